@@ -75,7 +75,7 @@ class RoleBasedLoginView(APIView):
                 # DBに保存
                 user.email_verification_code = verification_code
                 user.email_verification_expiry = expiration_time
-                user.save()
+                user.save(update_fields=['email_verification_code', 'email_verification_expiry'])
                 
                 # メール送信
                 email_service.send_2fa_code_email(user, verification_code)
@@ -110,7 +110,7 @@ class RoleBasedLoginView(APIView):
             # 認証成功時、使い終わったコードをクリア
             user.email_verification_code = ''
             user.email_verification_expiry = None
-            user.save()
+            user.save(update_fields=['email_verification_code', 'email_verification_expiry'])
         
         # JWT トークン生成
         access_payload = {
@@ -132,7 +132,7 @@ class RoleBasedLoginView(APIView):
         
         # 最終ログイン時刻を更新
         user.last_login_date = timezone.now()
-        user.save()
+        user.save(update_fields=['last_login_date'])
         
         return Response({
             'success': True,
@@ -366,7 +366,7 @@ class TwoFactorSetupView(APIView):
         # 一時的に保存（実際の有効化は別のエンドポイントで）
         user.two_factor_secret = secret
         user.backup_codes = backup_codes
-        user.save()
+        user.save(update_fields=['two_factor_secret', 'backup_codes'])
         
         return Response({
             'success': True,
@@ -402,7 +402,7 @@ class TwoFactorSetupView(APIView):
         
         # 2FA有効化
         user.is_2fa_enabled = True
-        user.save()
+        user.save(update_fields=['is_2fa_enabled'])
         
         return Response({
             'success': True,
@@ -443,7 +443,7 @@ class TwoFactorDisableView(APIView):
         user.is_2fa_enabled = False
         user.two_factor_secret = ''
         user.backup_codes = []
-        user.save()
+        user.save(update_fields=['is_2fa_enabled', 'two_factor_secret', 'backup_codes'])
         
         return Response({
             'success': True,
@@ -464,7 +464,7 @@ class GenerateBackupCodesView(APIView):
         # 新しいバックアップコード生成
         backup_codes = [secrets.token_hex(4).upper() for _ in range(8)]
         user.backup_codes = backup_codes
-        user.save()
+        user.save(update_fields=['backup_codes'])
         
         return Response({
             'success': True,
@@ -548,7 +548,7 @@ class EmailTwoFactorSetupView(APIView):
         # Save to DB
         user.email_verification_code = verification_code
         user.email_verification_expiry = expiration_time
-        user.save()
+        user.save(update_fields=['email_verification_code', 'email_verification_expiry'])
         
         # Send Email
         if email_service.send_2fa_code_email(user, verification_code):
@@ -590,7 +590,7 @@ class EmailTwoFactorSetupView(APIView):
         user.is_2fa_enabled = True
         user.email_verification_code = ''
         user.email_verification_expiry = None
-        user.save()
+        user.save(update_fields=['is_2fa_enabled', 'email_verification_code', 'email_verification_expiry'])
         
         return Response({
             'success': True,
@@ -0,0 +1,119 @@
+from django.db.models import Sum, Max, OuterRef, Subquery, IntegerField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import logging
+
+from .models import User, Store, PointTransaction, PointBalanceSnapshot, DepositTransaction
+from .ledger_archive_service import ledger_archive_service
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceSnapshotService:
+    """時点残高スナップショット管理サービス
+
+    スナップショットは「現在の保存済み残高 − 基準日時より後の取引合計」を1文で読み出して
+    算出するため、同一トランザクションで書かれる残高と取引の整合が保たれる。
+    時点残高は直前のスナップショットと、そこから対象日時までの取引（有界な台帳末尾）で復元する。
+    """
+
+    def __init__(self):
+        self.settle_lag_minutes = 5  # 処理中の取引が確定するまでの猶予（分）
+        self.batch_size = 5000  # スナップショット一括作成の件数
+
+    def _after_total(self, taken_at, earned_only=False):
+        """基準日時より後に記録された取引ポイント合計（ユーザー単位）"""
+        transactions = PointTransaction.objects.filter(user=OuterRef('pk'), created_at__gt=taken_at)
+        if earned_only:
+            transactions = transactions.filter(
+                transaction_type__in=ledger_archive_service.EARNED_TYPES, points__gt=0
+            )
+        return Coalesce(Subquery(
+            transactions.order_by().values('user').annotate(total=Sum('points')).values('total')[:1],
+            output_field=IntegerField()
+        ), Value(0))
+
+    def take_snapshots(self, dry_run=False):
+        """前回以降に取引のあったユーザー（初回は全ユーザー）のスナップショットを一括作成"""
+        taken_at = timezone.now() - timezone.timedelta(minutes=self.settle_lag_minutes)
+        last_taken_at = PointBalanceSnapshot.objects.aggregate(last=Max('taken_at'))['last']
+
+        users = User.objects.all()
+        if last_taken_at:
+            if last_taken_at >= taken_at:
+                return 0
+            users = users.filter(pk__in=PointTransaction.objects.filter(
+                created_at__gt=last_taken_at, created_at__lte=taken_at
+            ).values('user_id'))
+
+        if dry_run:
+            return users.count()
+
+        rows = users.annotate(
+            balance_after_snapshot=self._after_total(taken_at),
+            earned_after_snapshot=self._after_total(taken_at, earned_only=True)
+        ).order_by('pk').values_list(
+            'pk', 'stored_point_balance', 'lifetime_points_earned',
+            'balance_after_snapshot', 'earned_after_snapshot'
+        )
+
+        created = 0
+        snapshots = []
+        for user_id, balance, lifetime, balance_after, earned_after in rows.iterator(chunk_size=self.batch_size):
+            snapshots.append(PointBalanceSnapshot(
+                user_id=user_id,
+                taken_at=taken_at,
+                balance=balance - balance_after,
+                lifetime_points=lifetime - earned_after
+            ))
+            if len(snapshots) >= self.batch_size:
+                PointBalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+                created += len(snapshots)
+                snapshots = []
+        if snapshots:
+            PointBalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+            created += len(snapshots)
+
+        logger.info(f"Point balance snapshots taken at {taken_at.isoformat()}: {created} users")
+        return created
+
+    def user_balance_at(self, user_id, at):
+        """ユーザーの指定日時時点のポイント残高を復元"""
+        snapshot = PointBalanceSnapshot.objects.filter(
+            user_id=user_id, taken_at__lte=at
+        ).order_by('-taken_at').values('taken_at', 'balance', 'lifetime_points').first()
+
+        since = snapshot['taken_at'] if snapshot else None
+        tail_total, tail_count = ledger_archive_service.sum_points(user_id, after=since, until=at)
+        earned_total, _ = ledger_archive_service.sum_points(user_id, after=since, until=at, earned_only=True)
+
+        return {
+            'user_id': user_id,
+            'at': at,
+            'balance': (snapshot['balance'] if snapshot else 0) + tail_total,
+            'lifetime_points': (snapshot['lifetime_points'] if snapshot else 0) + earned_total,
+            'snapshot_taken_at': since,
+            'tail_transactions': tail_count,
+        }
+
+    def store_balance_at(self, store_id, at):
+        """店舗の指定日時時点のデポジット残高を復元
+
+        デポジット取引は各行が取引後残高を保持しているため、対象日時以前の最新の完了取引が
+        そのままスナップショットとなる（(store, created_at) インデックスで1行読み出し）。
+        """
+        last_transaction = DepositTransaction.objects.filter(
+            store_id=store_id, status='completed', created_at__lte=at
+        ).order_by('-created_at', '-id').values('balance_after', 'created_at').first()
+
+        return {
+            'store_id': store_id,
+            'at': at,
+            'deposit_balance': last_transaction['balance_after'] if last_transaction else 0,
+            'last_transaction_at': last_transaction['created_at'] if last_transaction else None,
+            'current_deposit_balance': Store.objects.values_list('deposit_balance', flat=True).get(pk=store_id),
+        }
+
+
+# グローバルインスタンス
+balance_snapshot_service = BalanceSnapshotService()
@@ -36,30 +36,22 @@ from .point_service import point_service
 def user_points_detail(request):
     """ユーザーの詳細ポイント情報を取得"""
     try:
-        user_points = UserPoint.objects.filter(
-            user=request.user, 
-            is_expired=False
-        ).order_by('expiry_date')
-        
-        # 期限切れチェック
-        for point in user_points:
-            point.is_valid()
-        
-        # 有効なポイントのみ再取得
-        valid_points = user_points.filter(is_expired=False)
-        total_points = sum(point.points for point in valid_points)
-        
-        # 期限別の集計
-        expiring_soon = valid_points.filter(
-            expiry_date__lte=timezone.now() + timedelta(days=30)
-        )
+        # キャッシュ済みのポイントサマリーを利用（読み取りのみ。期限切れ未処理のロットは集計から除外済み）
+        summary = point_service.get_user_point_summary(request.user)
+        # 有効期限のないロットは近日失効の対象外
+        expiring_soon = [
+            lot for lot in summary['point_details']
+            if lot['expiry_date'] is not None and lot['expiry_date'] <= summary['soon_expire_date']
+        ]
         
         return JsonResponse({
             'success': True,
-            'total_points': total_points,
-            'points_detail': UserPointSerializer(valid_points, many=True).data,
-            'expiring_soon': UserPointSerializer(expiring_soon, many=True).data,
-            'expiring_soon_total': sum(point.points for point in expiring_soon)
+            'total_points': summary['total_balance'],
+            'points_detail': summary['point_details'],
+            'expiring_soon': expiring_soon,
+            'expiring_soon_total': summary['soon_expire_points'],
+            'current_rank': summary['current_rank'],
+            'month_stats': summary['month_stats']
         })
         
     except Exception as e:
@@ -1,10 +1,13 @@
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db.models import Q, Count, BooleanField, ExpressionWrapper
 from decimal import Decimal
 from datetime import timedelta
+from collections import defaultdict
 import logging
 
 from .models import ECPointRequest, User, Store
+from .velocity_counter_service import velocity_counter_service
+from .order_id_index_service import order_id_index_service
 
 logger = logging.getLogger(__name__)
 
@@ -20,193 +23,321 @@ class DuplicateDetectionService:
     
     def check_for_duplicates(self, user: User, store: Store, amount: Decimal, 
                            order_id: str, purchase_date: timezone.datetime):
-        """重複申請をチェック"""
+        """重複申請をチェック
+        
+        注文ID・パターン一致の候補は1クエリ、類似注文IDの候補はインデックス検索1クエリで取得し、
+        不審パターン判定用の件数はスライディングウィンドウカウンター（キャッシュ）から読み出す。
+        類似注文ID・不審パターンが検知された場合のみ、参照先の申請を追加で取得する。
+        """
         potential_duplicates = []
+        candidates = self._fetch_candidates(user, store, amount, order_id, purchase_date)
         
         # 1. 完全な注文ID重複チェック
-        order_id_duplicates = self._check_order_id_duplicates(order_id)
-        if order_id_duplicates:
-            potential_duplicates.extend([
-                {
+        potential_duplicates.extend([
+            {
+                'type': 'order_id',
+                'original': duplicate,
+                'details': {
+                    'matching_order_id': order_id,
+                    'reason': '同一注文IDが既に存在'
+                },
+                'severity': 'critical'
+            } for duplicate in candidates if duplicate.is_order_id_match
+        ])
+        
+        # 2. パターンマッチング（同一ユーザー・店舗・金額・時間）
+        for duplicate in candidates:
+            if not duplicate.is_pattern_match:
+                continue
+            time_diff = int(abs((duplicate.purchase_date - purchase_date).total_seconds()) / 60)
+            potential_duplicates.append({
+                'type': 'pattern_match',
+                'original': duplicate,
+                'details': {
+                    'time_difference_minutes': time_diff,
+                    'amount_difference': float(abs(duplicate.purchase_amount - amount)),
+                    'reason': '同一ユーザー・店舗・金額・時間での重複申請'
+                },
+                'severity': 'high' if time_diff < 60 else 'medium'
+            })
+        
+        # 3. 類似注文IDチェック（同一店舗の直近の注文IDからインデックス検索）
+        potential_duplicates.extend([
+            {
+                'type': 'similar_order_id',
+                'original': duplicate,
+                'details': {
+                    'matching_order_id': duplicate.order_id,
+                    'similarity': round(similarity, 3),
+                    'reason': '類似した注文IDが既に存在'
+                },
+                'severity': 'medium'
+            } for duplicate, similarity in self._check_similar_order_ids(store, order_id)
+        ])
+        
+        # 4. 不審な活動パターンチェック
+        potential_duplicates.extend([
+            {
+                'type': 'suspicious',
+                'original': pattern['request'],
+                'details': pattern['details'],
+                'severity': pattern['severity']
+            } for pattern in self._check_suspicious_patterns(user, store, amount)
+        ])
+        
+        return potential_duplicates
+    
+    def check_batch(self, store: Store, entries):
+        """同一店舗の複数の申請をまとめて重複チェック（一括登録用）
+        
+        entries は user・amount・order_id・purchase_date を持つdictの一覧で、戻り値は申請ごとの
+        検知結果の一覧。既存申請との照合は候補1クエリ・類似注文ID検索・参照先取得で行い、
+        件数ルールはカウンターを1往復で読み出す。同じバッチ内の先行する申請とも照合し、
+        その場合の original はバッチ内の位置（int）となる。
+        """
+        results = [[] for _ in entries]
+        if not entries:
+            return results
+        
+        window = timedelta(hours=self.time_window_hours)
+        
+        # 1・2. 注文ID一致・パターン一致（既存申請の候補を1クエリで取得）
+        try:
+            purchase_dates = [entry['purchase_date'] for entry in entries]
+            existing = list(ECPointRequest.objects.filter(
+                Q(order_id__in={entry['order_id'] for entry in entries}) |
+                Q(
+                    store=store,
+                    user_id__in={entry['user'].pk for entry in entries},
+                    purchase_date__range=(min(purchase_dates) - window, max(purchase_dates) + window)
+                )
+            ).exclude(status='rejected').order_by('-created_at'))
+        except Exception as e:
+            logger.error(f"Duplicate candidate check failed: {str(e)}")
+            existing = []
+        
+        by_order_id = defaultdict(list)
+        by_user = defaultdict(list)
+        for request in existing:
+            by_order_id[request.order_id].append(request)
+            if request.store_id == store.pk:
+                by_user[request.user_id].append(request)
+        
+        for index, entry in enumerate(entries):
+            earlier = [(position, entries[position]) for position in range(index)]
+            
+            for original in by_order_id[entry['order_id']] + [
+                position for position, other in earlier if other['order_id'] == entry['order_id']
+            ]:
+                results[index].append({
                     'type': 'order_id',
-                    'original': duplicate,
+                    'original': original,
                     'details': {
-                        'matching_order_id': order_id,
+                        'matching_order_id': entry['order_id'],
                         'reason': '同一注文IDが既に存在'
                     },
                     'severity': 'critical'
-                } for duplicate in order_id_duplicates
-            ])
-        
-        # 2. パターンマッチング（同一ユーザー・店舗・金額・時間）
-        pattern_duplicates = self._check_pattern_duplicates(
-            user, store, amount, purchase_date
-        )
-        if pattern_duplicates:
-            potential_duplicates.extend([
-                {
+                })
+            
+            pattern_candidates = [
+                (request, request.purchase_date, request.purchase_amount) for request in by_user[entry['user'].pk]
+            ] + [
+                (position, other['purchase_date'], other['amount'])
+                for position, other in earlier if other['user'].pk == entry['user'].pk
+            ]
+            for original, purchase_date, amount in pattern_candidates:
+                if (abs(purchase_date - entry['purchase_date']) > window
+                        or abs(amount - entry['amount']) > self.amount_tolerance):
+                    continue
+                time_diff = int(abs((purchase_date - entry['purchase_date']).total_seconds()) / 60)
+                results[index].append({
                     'type': 'pattern_match',
-                    'original': duplicate['request'],
+                    'original': original,
                     'details': {
-                        'time_difference_minutes': duplicate['time_diff'],
-                        'amount_difference': float(duplicate['amount_diff']),
+                        'time_difference_minutes': time_diff,
+                        'amount_difference': float(abs(amount - entry['amount'])),
                         'reason': '同一ユーザー・店舗・金額・時間での重複申請'
                     },
-                    'severity': 'high' if duplicate['time_diff'] < 60 else 'medium'
-                } for duplicate in pattern_duplicates
-            ])
+                    'severity': 'high' if time_diff < 60 else 'medium'
+                })
         
-        # 3. 不審な活動パターンチェック
-        suspicious_patterns = self._check_suspicious_patterns(user, store, amount)
-        if suspicious_patterns:
-            potential_duplicates.extend([
-                {
-                    'type': 'suspicious',
-                    'original': pattern['request'],
-                    'details': pattern['details'],
-                    'severity': pattern['severity']
-                } for pattern in suspicious_patterns
+        # 3. 類似注文ID（既存申請はインデックス検索、バッチ内はシグネチャのバンド一致で候補を絞る）
+        try:
+            similar = self._check_similar_order_ids_batch(store, [entry['order_id'] for entry in entries])
+            for index, matches in enumerate(similar):
+                results[index].extend([
+                    {
+                        'type': 'similar_order_id',
+                        'original': original,
+                        'details': {
+                            'matching_order_id': original.order_id if isinstance(original, ECPointRequest)
+                            else entries[original]['order_id'],
+                            'similarity': round(similarity, 3),
+                            'reason': '類似した注文IDが既に存在'
+                        },
+                        'severity': 'medium'
+                    } for original, similarity in matches
+                ])
+        except Exception as e:
+            logger.error(f"Similar order ID check failed: {str(e)}")
+        
+        # 4. 不審な活動パターン（カウンターの値にバッチ内の先行する申請の件数を加算）
+        try:
+            signals = velocity_counter_service.activity_signals_many([
+                (entry['user'].pk, store.pk, entry['amount']) for entry in entries
             ])
+            user_latest, amount_latest = {}, {}
+            user_counts, amount_counts = defaultdict(int), defaultdict(int)
+            patterns = []
+            for index, (entry, signal) in enumerate(zip(entries, signals)):
+                user_key = entry['user'].pk
+                amount_key = (user_key, entry['amount'])
+                if user_key in user_latest:
+                    signal['user_hour_latest'] = ('batch', user_latest[user_key])
+                if amount_key in amount_latest:
+                    signal['same_amount_latest'] = ('batch', amount_latest[amount_key])
+                if index:
+                    signal['store_hour_latest'] = ('batch', index - 1)
+                signal['user_hour_count'] += user_counts[user_key]
+                signal['same_amount_count'] += amount_counts[amount_key]
+                signal['store_hour_count'] += index
+                patterns.append(self._suspicious_patterns(signal, store, entry['amount']))
+                
+                user_latest[user_key] = amount_latest[amount_key] = index
+                user_counts[user_key] += 1
+                amount_counts[amount_key] += 1
+            
+            request_ids = {
+                pattern['request'] for entry_patterns in patterns for pattern in entry_patterns
+                if pattern['request'] and not isinstance(pattern['request'], tuple)
+            }
+            requests = ECPointRequest.objects.in_bulk(list(request_ids)) if request_ids else {}
+            for index, entry_patterns in enumerate(patterns):
+                for pattern in entry_patterns:
+                    original = pattern['request']
+                    if isinstance(original, tuple):
+                        original = original[1]
+                    elif original:
+                        original = requests.get(original)
+                    results[index].append({
+                        'type': 'suspicious',
+                        'original': original,
+                        'details': pattern['details'],
+                        'severity': pattern['severity']
+                    })
+        except Exception as e:
+            logger.error(f"Suspicious pattern check failed: {str(e)}")
         
-        return potential_duplicates
+        return results
     
-    def _check_order_id_duplicates(self, order_id: str):
-        """注文ID重複チェック"""
-        try:
-            existing_requests = ECPointRequest.objects.filter(
-                order_id=order_id
-            ).exclude(
-                status='rejected'  # 拒否済みは除外
+    def candidate_queryset(self, user: User, store: Store, amount: Decimal,
+                           order_id: str, purchase_date: timezone.datetime):
+        """注文ID一致・パターン一致の候補を1クエリで取得するクエリセット"""
+        order_id_match = Q(order_id=order_id)
+        pattern_match = Q(
+            user=user,
+            store=store,
+            purchase_date__range=(
+                purchase_date - timedelta(hours=self.time_window_hours),
+                purchase_date + timedelta(hours=self.time_window_hours)
+            ),
+            purchase_amount__range=(
+                amount - self.amount_tolerance,
+                amount + self.amount_tolerance
             )
-            
-            return list(existing_requests)
-            
+        )
+        return ECPointRequest.objects.filter(order_id_match | pattern_match).exclude(
+            status='rejected'  # 拒否済みは除外
+        ).annotate(
+            is_order_id_match=ExpressionWrapper(order_id_match, output_field=BooleanField()),
+            is_pattern_match=ExpressionWrapper(pattern_match, output_field=BooleanField())
+        )
+    
+    def _fetch_candidates(self, user: User, store: Store, amount: Decimal,
+                          order_id: str, purchase_date: timezone.datetime):
+        try:
+            return list(self.candidate_queryset(user, store, amount, order_id, purchase_date))
         except Exception as e:
-            logger.error(f"Order ID duplicate check failed: {str(e)}")
+            logger.error(f"Duplicate candidate check failed: {str(e)}")
             return []
     
-    def _check_pattern_duplicates(self, user: User, store: Store, amount: Decimal, 
-                                purchase_date: timezone.datetime):
-        """パターンマッチング重複チェック"""
+    def _check_similar_order_ids(self, store: Store, order_id: str):
+        """類似注文IDチェック（完全一致は注文ID重複チェックで検知するため除外）"""
         try:
-            # 時間範囲を設定
-            time_start = purchase_date - timedelta(hours=self.time_window_hours)
-            time_end = purchase_date + timedelta(hours=self.time_window_hours)
-            
-            # 同一ユーザー・店舗での近似申請を検索
-            similar_requests = ECPointRequest.objects.filter(
-                user=user,
-                store=store,
-                purchase_date__range=(time_start, time_end),
-                purchase_amount__range=(
-                    amount - self.amount_tolerance,
-                    amount + self.amount_tolerance
-                )
-            ).exclude(
-                status='rejected'
-            )
+            matched = {}
+            for candidate in order_id_index_service.candidates(store.pk, order_id):
+                similarity = self.check_order_id_similarity(order_id, candidate)
+                if similarity >= self.order_id_similarity_threshold:
+                    matched[candidate] = similarity
+            if not matched:
+                return []
             
-            duplicates = []
-            for request in similar_requests:
-                time_diff = abs((request.purchase_date - purchase_date).total_seconds()) / 60
-                amount_diff = abs(request.purchase_amount - amount)
-                
-                duplicates.append({
-                    'request': request,
-                    'time_diff': int(time_diff),
-                    'amount_diff': amount_diff
-                })
-            
-            return duplicates
+            requests = ECPointRequest.objects.filter(
+                store=store, order_id__in=list(matched)
+            ).exclude(status='rejected')
+            return [(request, matched[request.order_id]) for request in requests]
             
         except Exception as e:
-            logger.error(f"Pattern duplicate check failed: {str(e)}")
+            logger.error(f"Similar order ID check failed: {str(e)}")
             return []
     
+    def _check_similar_order_ids_batch(self, store: Store, order_ids):
+        """複数の注文IDの類似注文IDチェック（申請ごとに [(参照先, 類似度), ...] を返す）"""
+        threshold = self.order_id_similarity_threshold
+        candidates = order_id_index_service.candidates_many(store.pk, order_ids)
+        
+        matched = []
+        for order_id in order_ids:
+            matched.append({
+                candidate: similarity for candidate, similarity in (
+                    (candidate, self.check_order_id_similarity(order_id, candidate))
+                    for candidate in candidates[order_id]
+                ) if similarity >= threshold
+            })
+        
+        requests = defaultdict(list)
+        matched_ids = {candidate for matches in matched for candidate in matches}
+        if matched_ids:
+            for request in ECPointRequest.objects.filter(
+                store=store, order_id__in=list(matched_ids)
+            ).exclude(status='rejected'):
+                requests[request.order_id].append(request)
+        
+        # バッチ内の先行する注文IDは、いずれかのバンドが一致するもののみ類似度を計算
+        stop_shingles = order_id_index_service.stop_shingles(store.pk)
+        buckets = defaultdict(list)
+        results = []
+        for index, order_id in enumerate(order_ids):
+            similar = [
+                (request, similarity)
+                for candidate, similarity in matched[index].items() for request in requests[candidate]
+            ]
+            signature = order_id_index_service.signature(order_id, stop_shingles)
+            earlier = {position for band, value in enumerate(signature) for position in buckets[(band, value)]}
+            for position in sorted(earlier):
+                if order_ids[position] == order_id:
+                    continue
+                similarity = self.check_order_id_similarity(order_id, order_ids[position])
+                if similarity >= threshold:
+                    similar.append((position, similarity))
+            for band, value in enumerate(signature):
+                buckets[(band, value)].append(index)
+            results.append(similar)
+        return results
+    
     def _check_suspicious_patterns(self, user: User, store: Store, amount: Decimal):
         """不審な活動パターンチェック"""
         try:
-            suspicious_patterns = []
-            now = timezone.now()
+            signals = velocity_counter_service.activity_signals(user.pk, store.pk, amount)
+            suspicious_patterns = self._suspicious_patterns(signals, store, amount)
             
-            # 1. 短時間での大量申請チェック
-            recent_requests = ECPointRequest.objects.filter(
-                user=user,
-                created_at__gte=now - timedelta(hours=1)
-            ).count()
-            
-            if recent_requests >= 5:  # 1時間に5回以上
-                latest_request = ECPointRequest.objects.filter(
-                    user=user
-                ).order_by('-created_at').first()
-                
-                suspicious_patterns.append({
-                    'request': latest_request,
-                    'details': {
-                        'reason': '短時間での大量申請',
-                        'request_count_per_hour': recent_requests,
-                        'threshold': 5
-                    },
-                    'severity': 'high'
-                })
-            
-            # 2. 同一金額での繰り返し申請チェック
-            same_amount_requests = ECPointRequest.objects.filter(
-                user=user,
-                purchase_amount=amount,
-                created_at__gte=now - timedelta(days=7)
-            ).count()
-            
-            if same_amount_requests >= 3:  # 1週間で同じ金額を3回以上
-                latest_request = ECPointRequest.objects.filter(
-                    user=user,
-                    purchase_amount=amount
-                ).order_by('-created_at').first()
-                
-                suspicious_patterns.append({
-                    'request': latest_request,
-                    'details': {
-                        'reason': '同一金額での繰り返し申請',
-                        'same_amount_count': same_amount_requests,
-                        'amount': float(amount),
-                        'period_days': 7
-                    },
-                    'severity': 'medium'
-                })
-            
-            # 3. 異常に高額な申請チェック
-            if amount > Decimal('50000'):  # 5万円以上
-                suspicious_patterns.append({
-                    'request': None,  # 新規申請なので既存requestはなし
-                    'details': {
-                        'reason': '高額申請',
-                        'amount': float(amount),
-                        'threshold': 50000
-                    },
-                    'severity': 'medium'
-                })
-            
-            # 4. 店舗での異常申請パターンチェック
-            store_recent_requests = ECPointRequest.objects.filter(
-                store=store,
-                created_at__gte=now - timedelta(hours=1)
-            ).count()
-            
-            if store_recent_requests >= 20:  # 1時間に20件以上
-                latest_store_request = ECPointRequest.objects.filter(
-                    store=store
-                ).order_by('-created_at').first()
-                
-                suspicious_patterns.append({
-                    'request': latest_store_request,
-                    'details': {
-                        'reason': '店舗での大量申請',
-                        'store_request_count_per_hour': store_recent_requests,
-                        'store_name': store.name,
-                        'threshold': 20
-                    },
-                    'severity': 'high'
-                })
+            # 検知されたルールの参照先申請をまとめて取得
+            request_ids = [pattern['request'] for pattern in suspicious_patterns if pattern['request']]
+            if request_ids:
+                requests = ECPointRequest.objects.in_bulk(request_ids)
+                for pattern in suspicious_patterns:
+                    if pattern['request']:
+                        pattern['request'] = requests.get(pattern['request'])
             
             return suspicious_patterns
             
@@ -214,6 +345,62 @@ class DuplicateDetectionService:
             logger.error(f"Suspicious pattern check failed: {str(e)}")
             return []
     
+    def _suspicious_patterns(self, signals, store: Store, amount: Decimal):
+        """件数・最新申請から不審パターンを判定（参照先は最新申請の値のまま返す）"""
+        suspicious_patterns = []
+        
+        # 1. 短時間での大量申請チェック
+        if signals['user_hour_count'] >= 5:  # 1時間に5回以上
+            suspicious_patterns.append({
+                'request': signals['user_hour_latest'],
+                'details': {
+                    'reason': '短時間での大量申請',
+                    'request_count_per_hour': signals['user_hour_count'],
+                    'threshold': 5
+                },
+                'severity': 'high'
+            })
+        
+        # 2. 同一金額での繰り返し申請チェック
+        if signals['same_amount_count'] >= 3:  # 1週間で同じ金額を3回以上
+            suspicious_patterns.append({
+                'request': signals['same_amount_latest'],
+                'details': {
+                    'reason': '同一金額での繰り返し申請',
+                    'same_amount_count': signals['same_amount_count'],
+                    'amount': float(amount),
+                    'period_days': 7
+                },
+                'severity': 'medium'
+            })
+        
+        # 3. 異常に高額な申請チェック
+        if amount > Decimal('50000'):  # 5万円以上
+            suspicious_patterns.append({
+                'request': None,  # 新規申請なので既存requestはなし
+                'details': {
+                    'reason': '高額申請',
+                    'amount': float(amount),
+                    'threshold': 50000
+                },
+                'severity': 'medium'
+            })
+        
+        # 4. 店舗での異常申請パターンチェック
+        if signals['store_hour_count'] >= 20:  # 1時間に20件以上
+            suspicious_patterns.append({
+                'request': signals['store_hour_latest'],
+                'details': {
+                    'reason': '店舗での大量申請',
+                    'store_request_count_per_hour': signals['store_hour_count'],
+                    'store_name': store.name,
+                    'threshold': 20
+                },
+                'severity': 'high'
+            })
+        
+        return suspicious_patterns
+    
     def check_order_id_similarity(self, order_id1: str, order_id2: str):
         """注文ID類似度チェック"""
         try:
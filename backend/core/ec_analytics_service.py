@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+from .models import ECPointRequest
+
+logger = logging.getLogger(__name__)
+
+
+class ECAnalyticsService:
+    """EC申請の分析データサービス"""
+
+    DAILY_TREND_CACHE_KEY = 'ec_daily_trend:{days}:{date}'
+
+    def __init__(self):
+        self.max_trend_days = 90
+        self.history_cache_timeout = 600  # 前日までの集計のキャッシュ秒数（過去日の状態変化の反映間隔）
+
+    def daily_trend(self, days=30):
+        """直近days日間の日別推移（当日を含む、古い順）
+
+        前日までの集計は (日数, 日付) をキーにキャッシュし、毎回集計し直すのは当日分のみ。
+        """
+        days = max(1, min(days, self.max_trend_days))
+        today = timezone.localdate()
+        start_date = today - timedelta(days=days - 1)
+
+        cache_key = self.DAILY_TREND_CACHE_KEY.format(days=days, date=today.isoformat())
+        history = cache.get(cache_key)
+        if history is None:
+            history = self._daily_rows(start_date, today)
+            cache.set(cache_key, history, timeout=self.history_cache_timeout)
+
+        return history + self._daily_rows(today, today + timedelta(days=1))
+
+    def _daily_rows(self, start_date, end_date):
+        """[start_date, end_date) の日別集計を1クエリで取得し、申請のない日は0で埋める"""
+        tz = timezone.get_current_timezone()
+        day_start = timezone.make_aware(timezone.datetime.combine(start_date, timezone.datetime.min.time()), tz)
+        day_end = timezone.make_aware(timezone.datetime.combine(end_date, timezone.datetime.min.time()), tz)
+
+        stats = {
+            row['day']: row for row in ECPointRequest.objects.filter(
+                created_at__gte=day_start,
+                created_at__lt=day_end
+            ).annotate(
+                day=TruncDate('created_at', tzinfo=tz)
+            ).order_by().values('day').annotate(
+                total_requests=Count('id'),
+                total_amount=Sum('purchase_amount'),
+                pending_count=Count('id', filter=Q(status='pending')),
+                approved_count=Count('id', filter=Q(status='approved')),
+                completed_count=Count('id', filter=Q(status='completed')),
+                rejected_count=Count('id', filter=Q(status='rejected'))
+            )
+        }
+
+        rows = []
+        current_date = start_date
+        while current_date < end_date:
+            day_stats = stats.get(current_date, {})
+            rows.append({
+                'date': current_date.strftime('%Y-%m-%d'),
+                'total_requests': day_stats.get('total_requests') or 0,
+                'total_amount': float(day_stats.get('total_amount') or 0),
+                'pending': day_stats.get('pending_count') or 0,
+                'approved': day_stats.get('approved_count') or 0,
+                'completed': day_stats.get('completed_count') or 0,
+                'rejected': day_stats.get('rejected_count') or 0
+            })
+            current_date += timedelta(days=1)
+        return rows
+
+
+# グローバルインスタンス
+ec_analytics_service = ECAnalyticsService()
@@ -0,0 +1,207 @@
+from django.db import transaction
+from django.utils import timezone
+from decimal import Decimal
+import logging
+import time
+
+from .models import ECPointRequest, PointAwardLog, IdempotencyRecord, Store
+from .point_service import point_service
+from .ec_payment_service import ec_payment_service
+from .idempotency_service import idempotency_service
+from .ec_stats_service import ec_stats_service
+from .latency_service import latency_service
+from .notification_service import NotificationService
+
+logger = logging.getLogger(__name__)
+
+
+class ECApprovalService:
+    """EC申請の一括承認サービス
+
+    店舗ごとに、承認待ちの申請をまとめて1回の決済（クレジット → デポジット）で課金し、
+    ポイント付与・付与ログ・申請の完了更新・通知を一括で書き込む。決済に失敗した店舗の
+    申請はすべて承認待ちのまま残る。承認結果は単件承認と同じ冪等キーで記録するため、
+    一括承認済みの申請を単件で再承認しても元の結果が返る。
+    """
+
+    def bulk_approve(self, request_ids, approved_by):
+        """申請を一括承認し、入力順の申請ごとの結果の一覧を返す"""
+        request_ids = list(dict.fromkeys(request_ids))
+        # 店舗管理者は所属店舗（User.store）の申請のみ処理できる
+        managed_store_ids = {approved_by.store_id} if approved_by.store_id else set()
+
+        found = dict(ECPointRequest.objects.filter(pk__in=request_ids).values_list('pk', 'store_id'))
+
+        outcomes = {}
+        by_store = {}
+        for request_id in request_ids:
+            if request_id not in found:
+                outcomes[request_id] = {'request_id': request_id, 'success': False, 'error': '申請が見つかりません'}
+                continue
+            store_id = found[request_id]
+            if store_id not in managed_store_ids:
+                outcomes[request_id] = {
+                    'request_id': request_id, 'success': False, 'error': 'この申請を処理する権限がありません'
+                }
+                continue
+            by_store.setdefault(store_id, []).append(request_id)
+
+        for store_id, store_request_ids in by_store.items():
+            outcomes.update(self._approve_store_requests(store_id, store_request_ids, approved_by))
+
+        return [outcomes[request_id] for request_id in request_ids]
+
+    @transaction.atomic
+    def _approve_store_requests(self, store_id, request_ids, approved_by):
+        """1店舗分の申請を一括承認（決済は合計ポイントで1回）"""
+        start_time = time.time()
+        store = Store.objects.select_for_update().get(pk=store_id)
+        actor_key = idempotency_service.actor_key('store', store_id)
+        outcomes = {}
+
+        # 承認済みの申請は記録済みの結果を返す
+        replays = {
+            record['reference_id']: record for record in IdempotencyRecord.objects.filter(
+                scope='ec_approval',
+                actor_key=actor_key,
+                reference_id__in=[str(request_id) for request_id in request_ids],
+                response_status__isnull=False
+            ).values('reference_id', 'response_body', 'response_status')
+        }
+
+        ec_requests = []
+        for ec_request in ECPointRequest.objects.select_for_update().filter(
+            pk__in=request_ids
+        ).select_related('user').order_by('pk'):
+            replay = replays.get(str(ec_request.pk))
+            if replay is not None:
+                outcomes[ec_request.pk] = {
+                    'request_id': ec_request.pk,
+                    'success': replay['response_status'] < 400,
+                    'replayed': True,
+                    'points_awarded': replay['response_body'].get('points_awarded')
+                }
+            elif not ec_request.can_be_approved():
+                outcomes[ec_request.pk] = {
+                    'request_id': ec_request.pk, 'success': False, 'error': 'この申請は既に処理済みです'
+                }
+            elif ec_request.calculate_points() <= 0:
+                outcomes[ec_request.pk] = {
+                    'request_id': ec_request.pk, 'success': False, 'error': '付与ポイントは1以上である必要があります'
+                }
+            else:
+                ec_requests.append(ec_request)
+
+        if not ec_requests:
+            return outcomes
+
+        # 1. 決済処理（合計ポイントで1回）
+        for ec_request in ec_requests:
+            ec_request.points_to_award = ec_request.calculate_points()
+        total_points = sum(ec_request.points_to_award for ec_request in ec_requests)
+        with latency_service.measure('payment', store_id):
+            payment_result = ec_payment_service.process_point_purchase(
+                store=store,
+                points_amount=total_points,
+                description=f'ECポイント一括付与: {len(ec_requests)}件'
+            )
+        if not payment_result['success']:
+            for ec_request in ec_requests:
+                outcomes[ec_request.pk] = {
+                    'request_id': ec_request.pk,
+                    'success': False,
+                    'error': 'ポイント付与に失敗しました',
+                    'message': payment_result['message']
+                }
+            return outcomes
+
+        # 2. ポイント付与（台帳への一括書き込み）
+        with latency_service.measure('award', store_id):
+            point_transactions = point_service._apply_bulk_grants(
+                [
+                    {
+                        'user_id': ec_request.user_id,
+                        'points': ec_request.points_to_award,
+                        'reference_id': ec_request.order_id,
+                    }
+                    for ec_request in ec_requests
+                ],
+                store=store,
+                description=f'EC購入ポイント付与: {store.name}',
+                notify=False
+            )
+
+        # 3. 申請の承認・完了を一括更新（bulk_update では保存シグナルが発火しないため集計も直接更新）
+        stats_before = [ec_stats_service.snapshot(ec_request) for ec_request in ec_requests]
+        now = timezone.now()
+        for ec_request in ec_requests:
+            ec_request.status = 'completed'
+            ec_request.store_approved_by = approved_by
+            ec_request.store_approved_at = now
+            ec_request.payment_method = payment_result['payment_method']
+            ec_request.payment_reference = payment_result.get('payment_reference', '')
+            ec_request.points_awarded = ec_request.points_to_award
+            ec_request.completed_at = now
+        ECPointRequest.objects.bulk_update(ec_requests, [
+            'status', 'store_approved_by', 'store_approved_at', 'payment_method', 'payment_reference',
+            'points_to_award', 'points_awarded', 'completed_at'
+        ], batch_size=500)
+        ec_stats_service.record_changes([
+            (before, ec_stats_service.snapshot(ec_request)) for before, ec_request in zip(stats_before, ec_requests)
+        ])
+
+        # 4. 付与ログ・冪等キーの一括記録
+        processing_time = int((time.time() - start_time) * 1000)
+        PointAwardLog.objects.bulk_create([
+            PointAwardLog(
+                ec_request=ec_request,
+                point_transaction=point_transaction,
+                awarded_points=ec_request.points_to_award,
+                award_rate=Decimal('1.0000'),  # 1%固定
+                processing_duration_ms=processing_time
+            )
+            for ec_request, point_transaction in zip(ec_requests, point_transactions)
+        ], batch_size=1000)
+
+        for ec_request in ec_requests:
+            outcomes[ec_request.pk] = {
+                'request_id': ec_request.pk,
+                'success': True,
+                'points_awarded': ec_request.points_to_award
+            }
+        IdempotencyRecord.objects.bulk_create([
+            IdempotencyRecord(
+                scope='ec_approval',
+                actor_key=actor_key,
+                reference_id=str(ec_request.pk),
+                response_body={
+                    'success': True,
+                    'message': 'ポイントを付与しました',
+                    'request_id': ec_request.pk,
+                    'points_awarded': ec_request.points_to_award,
+                    'payment_method': payment_result['payment_method'],
+                    'payment_message': payment_result['message'],
+                    'processing_time_ms': processing_time
+                },
+                response_status=200
+            )
+            for ec_request in ec_requests
+        ], batch_size=1000)
+
+        # 5. ユーザーに付与完了通知
+        with latency_service.measure('notification', store_id):
+            NotificationService().notify_users_points_awarded_bulk(
+                store, ec_requests, payment_result['message'],
+                balances={point_transaction.user_id: point_transaction.balance_after for point_transaction in point_transactions}
+            )
+        latency_service.record('approval_total', (time.time() - start_time) * 1000, store_id)
+
+        logger.info(
+            f"Bulk approval: Store {store.name}, {len(ec_requests)} requests, {total_points}pt, "
+            f"Method: {payment_result['payment_method']}, Time: {processing_time}ms"
+        )
+        return outcomes
+
+
+# グローバルインスタンス
+ec_approval_service = ECApprovalService()
@@ -9,6 +9,7 @@ from decimal import Decimal
 from .models import Store, ECPointRequest, DepositTransaction
 from .fincode_service import fincode_service
 from .deposit_service import deposit_service
+from .ec_stats_service import ec_stats_service
 
 logger = logging.getLogger(__name__)
 
@@ -243,23 +244,14 @@ class ECPaymentService:
         try:
             from django.db.models import Sum, Count
             
-            # ECポイント申請の統計
-            ec_stats = ECPointRequest.objects.filter(
-                store=store,
-                status__in=['approved', 'completed'],
-                store_approved_at__gte=start_date
-            ).aggregate(
-                total_requests=Count('id'),
-                total_points=Sum('points_to_award'),
-                credit_payments=Count('id', filter=Q(payment_method='card_payment')),
-                deposit_payments=Count('id', filter=Q(payment_method='deposit_consumption'))
-            )
+            # ECポイント申請の統計（日次集計から取得）
+            ec_stats = ec_stats_service.store_payment_stats(store, start_date)
             
             # デポジット消費の統計
             deposit_stats = DepositTransaction.objects.filter(
                 store=store,
                 transaction_type='consumption',
-                used_for='ec_point_purchase',
+                usage_logs__used_for='ec_point_purchase',
                 created_at__gte=start_date
             ).aggregate(
                 total_amount=Sum('amount'),
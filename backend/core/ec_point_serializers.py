@@ -211,16 +211,13 @@ class WebhookRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("有効なユーザーが見つかりません")
     
     def validate_store_key(self, value):
-        """店舗キーの検証"""
-        try:
-            webhook_key = StoreWebhookKey.objects.get(
-                webhook_key=value, 
-                is_active=True,
-                store__status='active'
-            )
-            return webhook_key
-        except StoreWebhookKey.DoesNotExist:
+        """店舗キーの検証（キャッシュから解決）"""
+        from .webhook_key_service import webhook_key_service
+        
+        webhook_key = webhook_key_service.resolve(value)
+        if webhook_key is None:
             raise serializers.ValidationError("無効な店舗キーです")
+        return webhook_key
     
     def validate_order_id(self, value):
         """注文IDの重複チェック"""
@@ -248,6 +245,29 @@ class WebhookRequestSerializer(serializers.Serializer):
         return request.META.get('REMOTE_ADDR', '0.0.0.0')
 
 
+class WebhookBatchLineSerializer(serializers.Serializer):
+    """一括Webhookの1行（店舗キーはリクエスト単位で認証するため含まない）
+    
+    ユーザー・処理済み注文IDの検証はバッチ全体でまとめて行う。
+    """
+    user_id = serializers.IntegerField(help_text="ユーザーID")
+    amount = serializers.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        min_value=Decimal('1'),
+        max_value=Decimal('1000000'),
+        help_text="購入金額"
+    )
+    order_id = serializers.CharField(max_length=100, help_text="注文ID")
+    purchase_date = serializers.DateTimeField(
+        required=False,
+        help_text="購入日時（省略時は現在時刻）"
+    )
+    
+    def validate_order_id(self, value):
+        return value.strip()
+
+
 class StoreApprovalSerializer(serializers.Serializer):
     """店舗承認・拒否用シリアライザー"""
     action = serializers.ChoiceField(
@@ -270,6 +290,16 @@ class StoreApprovalSerializer(serializers.Serializer):
         return attrs
 
 
+class BulkApprovalSerializer(serializers.Serializer):
+    """店舗一括承認用シリアライザー"""
+    request_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500,
+        help_text="承認する申請IDの一覧（最大500件）"
+    )
+
+
 class PointAwardLogSerializer(serializers.ModelSerializer):
     """ポイント付与ログシリアライザー"""
     user_name = serializers.CharField(source='ec_request.user.username', read_only=True)
@@ -332,6 +362,7 @@ class ECRequestListSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     request_type_display = serializers.CharField(source='get_request_type_display', read_only=True)
     has_receipt_image = serializers.SerializerMethodField()
+    receipt_thumbnail = serializers.SerializerMethodField()
     messages = ECPointRequestMessageSerializer(many=True, read_only=True)
     
     class Meta:
@@ -341,12 +372,19 @@ class ECRequestListSerializer(serializers.ModelSerializer):
             'store_name', 'purchase_amount', 'order_id', 'purchase_date',
             'status', 'status_display', 'points_to_award', 'points_awarded',
             'store_approved_at', 'rejection_reason', 'created_at',
-            'has_receipt_image', 'receipt_image', 'receipt_description', 'messages'
+            'has_receipt_image', 'receipt_image', 'receipt_thumbnail', 'receipt_description', 'messages'
         ]
     
     def get_has_receipt_image(self, obj):
         """レシート画像の有無"""
         return bool(obj.receipt_image)
+    
+    def get_receipt_thumbnail(self, obj):
+        """承認画面用のサムネイルURL（作成前はNone）"""
+        meta = getattr(obj, 'receipt_image_meta', None) if obj.receipt_image else None
+        if meta is None or meta.thumbnail_status != 'completed' or not meta.thumbnail:
+            return None
+        return meta.thumbnail.url
 
 
 class ECRequestDetailSerializer(serializers.ModelSerializer):
@@ -16,6 +16,11 @@ urlpatterns = [
     # === Webhook API ===
     # 店舗からの購入通知受信（GET方式で簡単実装）
     path('webhook/purchase/', ec_point_views.webhook_purchase, name='webhook_purchase'),
+    # 一括購入通知（JSON配列またはNDJSON）
+    path('webhook/purchase/batch/', ec_point_views.webhook_purchase_batch, name='webhook_purchase_batch'),
+    
+    # 非同期受信キューの滞留状況（運営管理者）
+    path('admin/webhook-queue/metrics/', ec_point_views.get_webhook_queue_metrics, name='webhook_queue_metrics'),
     
     # === 店舗管理者向けAPI ===
     # 承認待ち申請一覧
@@ -30,6 +35,9 @@ urlpatterns = [
     # 申請承認・拒否処理
     path('store/requests/<int:request_id>/approve/', ec_point_views.process_store_approval, name='process_store_approval'),
     
+    # 申請一括承認
+    path('store/requests/bulk-approve/', ec_point_views.bulk_approve_store_requests, name='bulk_approve_store_requests'),
+    
     # === 運営管理者向けAPI ===
     # 全申請管理
     path('admin/requests/', ec_point_views.ECRequestManagementView.as_view(), name='admin_ec_requests'),
@@ -39,4 +47,5 @@ urlpatterns = [
     path('admin/analytics/daily-trend/', ec_point_views.get_analytics_daily_trend, name='analytics_daily_trend'),
     path('admin/analytics/store-performance/', ec_point_views.get_analytics_store_performance, name='analytics_store_performance'),
     path('admin/analytics/payment-analysis/', ec_point_views.get_analytics_payment_analysis, name='analytics_payment_analysis'),
+    path('admin/analytics/stage-latency/', ec_point_views.get_analytics_stage_latency, name='analytics_stage_latency'),
 ]
\ No newline at end of file
@@ -4,6 +4,7 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -19,7 +20,7 @@ from .models import (
 )
 from .ec_point_serializers import (
     ECPointRequestSerializer, ECPointRequestMessageSerializer, ReceiptUploadSerializer, WebhookRequestSerializer,
-    StoreApprovalSerializer, PointAwardLogSerializer, DuplicateDetectionSerializer,
+    StoreApprovalSerializer, BulkApprovalSerializer, PointAwardLogSerializer, DuplicateDetectionSerializer,
     StoreWebhookKeySerializer, ECRequestListSerializer, ECRequestDetailSerializer
 )
 from .point_service import point_service
@@ -27,6 +28,14 @@ from .deposit_service import deposit_service
 from .duplicate_detection_service import DuplicateDetectionService
 from .notification_service import NotificationService
 from .ec_payment_service import ec_payment_service
+from .idempotency_service import idempotency_service
+from .webhook_ingest_service import webhook_ingest_service
+from .ec_approval_service import ec_approval_service
+from .ec_analytics_service import ec_analytics_service
+from .ec_stats_service import ec_stats_service
+from .receipt_image_service import receipt_image_service, ReceiptMultiPartParser
+from .latency_service import latency_service
+from .webhook_key_service import webhook_key_service
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +44,7 @@ logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-@parser_classes([MultiPartParser, FormParser])
+@parser_classes([ReceiptMultiPartParser, FormParser])
 def upload_receipt(request):
     """レシートアップロードによるポイント申請"""
     try:
@@ -46,27 +55,42 @@ def upload_receipt(request):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # シリアライザーでバリデーション
+        validation_started = time.perf_counter()
         serializer = ReceiptUploadSerializer(data=request.data, context={'request': request})
-        if not serializer.is_valid():
+        is_valid = serializer.is_valid()
+        latency_service.record(
+            'validation', (time.perf_counter() - validation_started) * 1000,
+            serializer.validated_data['store_name'].id if is_valid else None
+        )
+        if not is_valid:
             return Response({
                 'error': 'バリデーションエラー',
                 'details': serializer.errors
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # 重複検知チェック
-        duplicate_service = DuplicateDetectionService()
-        potential_duplicates = duplicate_service.check_for_duplicates(
-            user=request.user,
-            store=serializer.validated_data['store_name'],  # 既にStoreオブジェクト
-            amount=serializer.validated_data['purchase_amount'],
-            order_id=serializer.validated_data['order_id'],
-            purchase_date=serializer.validated_data['purchase_date']
-        )
+        store = serializer.validated_data['store_name']  # 既にStoreオブジェクト
+        with latency_service.measure('duplicate_detection', store.id):
+            duplicate_service = DuplicateDetectionService()
+            potential_duplicates = duplicate_service.check_for_duplicates(
+                user=request.user,
+                store=store,
+                amount=serializer.validated_data['purchase_amount'],
+                order_id=serializer.validated_data['order_id'],
+                purchase_date=serializer.validated_data['purchase_date']
+            )
+            
+            # 同じ写真の使い回しチェック（内容ハッシュ・知覚ハッシュ）
+            fingerprint = receipt_image_service.fingerprint(serializer.validated_data['receipt_image'])
+            image_matches = receipt_image_service.find_matches(fingerprint)
         
         with transaction.atomic():
             # ECポイント申請を作成
             ec_request = serializer.save()
             
+            # 画像の指紋を登録（サムネイルはワーカーが作成）
+            receipt_image_service.register(ec_request, fingerprint, image_matches)
+            
             # 重複が検知された場合は記録
             if potential_duplicates:
                 for duplicate in potential_duplicates:
@@ -89,7 +113,7 @@ def upload_receipt(request):
             'request_id': ec_request.id,
             'message': '申請を受け付けました。店舗の承認をお待ちください。',
             'estimated_points': ec_request.points_to_award,
-            'has_duplicates': len(potential_duplicates) > 0
+            'has_duplicates': len(potential_duplicates) > 0 or len(image_matches) > 0
         }, status=status.HTTP_201_CREATED)
         
     except Exception as e:
@@ -201,10 +225,33 @@ def webhook_purchase(request):
             'store_key': request.GET.get('store_key'),
             'purchase_date': request.GET.get('purchase_date')
         }
+        # 省略された項目（購入日時など）はシリアライザーの既定値を使う
+        webhook_data = {key: value for key, value in webhook_data.items() if value is not None}
+        
+        # 非同期モードでは受信データを保存して即座に応答し、取り込みはワーカーが行う
+        if getattr(settings, 'EC_WEBHOOK_ASYNC', False):
+            return enqueue_webhook_purchase(request, webhook_data, start_time)
+        
+        # 再送（同一店舗・同一注文ID）は重複検知や申請作成を行わず元の結果を返す
+        # （処理済みの注文IDはバリデーションで弾かれるため、全体のバリデーションより先に参照する）
+        if webhook_data.get('store_key') and webhook_data.get('order_id'):
+            webhook_key = webhook_key_service.resolve(webhook_data['store_key'])
+            if webhook_key is not None and webhook_key.is_ip_allowed(get_client_ip(request)):
+                replay = idempotency_service.lookup(
+                    'ec_webhook', idempotency_service.actor_key('store', webhook_key.store_id), webhook_data['order_id']
+                )
+                if replay is not None:
+                    return Response(replay[0], status=replay[1], headers={'Idempotent-Replayed': 'true'})
         
         # バリデーション
+        validation_started = time.perf_counter()
         serializer = WebhookRequestSerializer(data=webhook_data, context={'request': request})
-        if not serializer.is_valid():
+        is_valid = serializer.is_valid()
+        latency_service.record(
+            'validation', (time.perf_counter() - validation_started) * 1000,
+            serializer.validated_data['store_key'].store_id if is_valid else None
+        )
+        if not is_valid:
             logger.warning(f"Invalid webhook request: {serializer.errors}")
             return Response({
                 'error': 'Invalid request',
@@ -212,12 +259,7 @@ def webhook_purchase(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         validated_data = serializer.validated_data
-        user = validated_data['user_id']  # 既にUserオブジェクト
         webhook_key = validated_data['store_key']  # 既にStoreWebhookKeyオブジェクト
-        store = webhook_key.store
-        
-        # 購入日時のデフォルト設定
-        purchase_date = validated_data.get('purchase_date', timezone.now())
         
         # レート制限チェック
         if not check_rate_limit(webhook_key, request):
@@ -225,68 +267,150 @@ def webhook_purchase(request):
                 'error': 'Rate limit exceeded'
             }, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
-        # 重複検知
-        duplicate_service = DuplicateDetectionService()
-        potential_duplicates = duplicate_service.check_for_duplicates(
-            user=user,
-            store=store,
-            amount=validated_data['amount'],
-            order_id=validated_data['order_id'],
-            purchase_date=purchase_date
+        body, status_code, replayed = webhook_ingest_service.process(
+            validated_data, get_client_ip(request), request.META.get('HTTP_USER_AGENT', ''), start_time
+        )
+        return Response(
+            body,
+            status=status_code,
+            headers={'Idempotent-Replayed': 'true'} if replayed else None
         )
         
-        with transaction.atomic():
-            # ECポイント申請を作成
-            request_hash = ECPointRequest().generate_request_hash() if hasattr(ECPointRequest(), 'generate_request_hash') else ''
-            
-            ec_request = ECPointRequest.objects.create(
-                request_type='webhook',
-                user=user,
-                store=store,
-                purchase_amount=validated_data['amount'],
-                order_id=validated_data['order_id'],
-                purchase_date=purchase_date,
-                request_hash=request_hash,
-                ip_address=get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                points_to_award=int(validated_data['amount'] // 100)
-            )
-            
-            # 重複検知結果を記録
-            if potential_duplicates:
-                for duplicate in potential_duplicates:
-                    DuplicateDetection.objects.create(
-                        detection_type=duplicate['type'],
-                        original_request=duplicate['original'],
-                        duplicate_request=ec_request,
-                        detection_details=duplicate['details'],
-                        severity=duplicate['severity']
-                    )
-            
-            # Webhookキーの使用記録を更新
-            webhook_key.update_last_used()
-            
-            # 店舗に承認依頼通知
-            notification_service = NotificationService()
-            notification_service.notify_store_approval_request(ec_request)
+    except Exception as e:
+        logger.error(f"Webhook processing failed: {str(e)}")
+        return Response({
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def enqueue_webhook_purchase(request, webhook_data, start_time):
+    """Webhookの受信データをキューに保存（認証・IPアドレス制限・レート制限のみ確認）"""
+    missing = [field for field in ('user_id', 'amount', 'order_id', 'store_key') if not webhook_data.get(field)]
+    if missing:
+        return Response({
+            'error': 'Invalid request',
+            'details': {field: ['この項目は必須です。'] for field in missing}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    webhook_key = webhook_key_service.resolve(webhook_data['store_key'])
+    if webhook_key is None:
+        return Response({
+            'error': 'Invalid request',
+            'details': {'store_key': ['無効な店舗キーです']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    client_ip = get_client_ip(request)
+    if not webhook_key.is_ip_allowed(client_ip):
+        return Response({
+            'error': 'Invalid request',
+            'details': {'non_field_errors': ['このIPアドレスからのアクセスは許可されていません']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not check_rate_limit(webhook_key, request):
+        return Response({
+            'error': 'Rate limit exceeded'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    item = webhook_ingest_service.enqueue(
+        webhook_key.store, webhook_data, client_ip, request.META.get('HTTP_USER_AGENT', '')
+    )
+    return Response({
+        'success': True,
+        'queue_id': item.id,
+        'message': 'Purchase notification accepted',
+        'processing_time_ms': int((time.time() - start_time) * 1000)
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])  # Webhook認証は独自実装
+def webhook_purchase_batch(request):
+    """Webhook経由での購入通知の一括受信（JSON配列またはNDJSON）
+    
+    店舗キー（X-Store-Key ヘッダーまたは store_key パラメータ）の認証・IPアドレス制限・
+    レート制限はリクエスト単位で1回のみ行い、行ごとの結果を返す。
+    """
+    start_time = time.time()
+    
+    try:
+        webhook_key = webhook_key_service.resolve(
+            request.META.get('HTTP_X_STORE_KEY') or request.GET.get('store_key')
+        )
+        if webhook_key is None:
+            return Response({
+                'error': 'Invalid request',
+                'details': {'store_key': ['無効な店舗キーです']}
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        processing_time = int((time.time() - start_time) * 1000)
-        logger.info(f"Webhook processed: Store {store.name}, User {user.username}, Amount {validated_data['amount']}, Time: {processing_time}ms")
+        client_ip = get_client_ip(request)
+        if not webhook_key.is_ip_allowed(client_ip):
+            return Response({
+                'error': 'Invalid request',
+                'details': {'non_field_errors': ['このIPアドレスからのアクセスは許可されていません']}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not check_rate_limit(webhook_key, request):
+            return Response({
+                'error': 'Rate limit exceeded'
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
+        try:
+            lines, parse_errors = webhook_ingest_service.parse_batch(request.body)
+        except ValueError as e:
+            return Response({
+                'error': 'Invalid request',
+                'details': {'body': [f'JSONとして解析できません: {str(e)}']}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not isinstance(lines, list) or not lines:
+            return Response({
+                'error': 'Invalid request',
+                'details': {'body': ['注文データの配列またはNDJSONを指定してください']}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(lines) > webhook_ingest_service.max_batch_lines:
+            return Response({
+                'error': 'Invalid request',
+                'details': {'body': [f'1回に送信できる注文は{webhook_ingest_service.max_batch_lines}件までです']}
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        results = webhook_ingest_service.ingest_batch(
+            webhook_key, lines, client_ip, request.META.get('HTTP_USER_AGENT', ''), parse_errors
+        )
+        
+        created = sum(1 for result in results if result['status'] == status.HTTP_201_CREATED and not result.get('replayed'))
+        replayed = sum(1 for result in results if result.get('replayed'))
         return Response({
             'success': True,
-            'request_id': ec_request.id,
-            'message': 'Purchase notification received',
-            'processing_time_ms': processing_time
-        }, status=status.HTTP_201_CREATED)
+            'total': len(results),
+            'created': created,
+            'replayed': replayed,
+            'failed': len(results) - created - replayed,
+            'results': results,
+            'processing_time_ms': int((time.time() - start_time) * 1000)
+        })
         
     except Exception as e:
-        logger.error(f"Webhook processing failed: {str(e)}")
+        logger.error(f"Webhook batch processing failed: {str(e)}")
         return Response({
             'error': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_webhook_queue_metrics(request):
+    """Webhook受信キューの滞留状況"""
+    if request.user.role != 'admin':
+        return Response({
+            'error': '管理者のみアクセス可能です'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response({
+        'success': True,
+        'data': webhook_ingest_service.queue_metrics()
+    })
+
+
 # === 店舗承認機能 ===
 
 @api_view(['GET'])
@@ -315,7 +439,7 @@ def get_store_pending_requests(request):
         queryset = ECPointRequest.objects.filter(
             store__in=managed_stores,
             status='pending'
-        ).order_by('-created_at')
+        ).select_related('user', 'store', 'receipt_image_meta').order_by('-created_at')
         
         # ページネーション
         paginator = Paginator(queryset, per_page)
@@ -364,6 +488,12 @@ def process_store_approval(request, request_id):
                 'error': 'この申請を処理する権限がありません'
             }, status=status.HTTP_403_FORBIDDEN)
         
+        # 承認済み申請への再送は元の承認結果を返す（決済・ポイント付与は再実行しない）
+        actor_key = idempotency_service.actor_key('store', ec_request.store_id)
+        replay = idempotency_service.lookup('ec_approval', actor_key, str(ec_request.id))
+        if replay is not None:
+            return Response(replay[0], status=replay[1], headers={'Idempotent-Replayed': 'true'})
+        
         # 処理可能状態チェック
         if not ec_request.can_be_approved():
             return Response({
@@ -382,9 +512,19 @@ def process_store_approval(request, request_id):
         
         with transaction.atomic():
             if action == 'approve':
-                # 承認処理
-                result = process_approval(ec_request, request.user, start_time)
-                return Response(result['response'], status=result['status'])
+                # 承認処理（申請IDを冪等キーとして結果を記録）
+                def run_approval():
+                    result = process_approval(ec_request, request.user, start_time)
+                    return result['response'], result['status']
+                
+                body, status_code, replayed = idempotency_service.execute(
+                    'ec_approval', actor_key, str(ec_request.id), run_approval
+                )
+                return Response(
+                    body,
+                    status=status_code,
+                    headers={'Idempotent-Replayed': 'true'} if replayed else None
+                )
             
             elif action == 'reject':
                 # 拒否処理
@@ -410,15 +550,55 @@ def process_store_approval(request, request_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_approve_store_requests(request):
+    """店舗による申請の一括承認（店舗ごとに決済1回・ポイント付与は一括書き込み）"""
+    start_time = time.time()
+    
+    try:
+        # 店舗管理者のみアクセス可能
+        if request.user.role != 'store_manager':
+            return Response({
+                'error': '店舗管理者のみアクセス可能です'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = BulkApprovalSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'error': 'バリデーションエラー',
+                'details': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = ec_approval_service.bulk_approve(serializer.validated_data['request_ids'], request.user)
+        approved = sum(1 for result in results if result['success'])
+        
+        return Response({
+            'success': True,
+            'approved': approved,
+            'failed': len(results) - approved,
+            'points_awarded': sum(result.get('points_awarded') or 0 for result in results if result['success']),
+            'results': results,
+            'processing_time_ms': int((time.time() - start_time) * 1000)
+        })
+        
+    except Exception as e:
+        logger.error(f"Bulk approval failed: {str(e)}")
+        return Response({
+            'error': '一括承認処理に失敗しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 def process_approval(ec_request, approved_by, start_time):
     """承認処理の実行"""
     try:
         # 1. 決済処理（クレジット → デポジット）
-        payment_result = ec_payment_service.process_point_purchase(
-            store=ec_request.store,
-            points_amount=ec_request.points_to_award,
-            description=f'ECポイント付与: {ec_request.user.username} - {ec_request.order_id}'
-        )
+        with latency_service.measure('payment', ec_request.store_id):
+            payment_result = ec_payment_service.process_point_purchase(
+                store=ec_request.store,
+                points_amount=ec_request.points_to_award,
+                description=f'ECポイント付与: {ec_request.user.username} - {ec_request.order_id}'
+            )
         
         if not payment_result['success']:
             # 決済失敗
@@ -444,13 +624,14 @@ def process_approval(ec_request, approved_by, start_time):
             ec_request.save()
         
         # 3. ユーザーにポイント付与
-        point_transaction = point_service.award_points(
-            user=ec_request.user,
-            points=ec_request.points_to_award,
-            description=f'EC購入ポイント付与: {ec_request.store.name}',
-            store=ec_request.store,
-            reference_id=ec_request.order_id
-        )
+        with latency_service.measure('award', ec_request.store_id):
+            point_transaction = point_service.award_points(
+                user=ec_request.user,
+                points=ec_request.points_to_award,
+                description=f'EC購入ポイント付与: {ec_request.store.name}',
+                store=ec_request.store,
+                reference_id=ec_request.order_id
+            )
         
         # 4. ログ記録
         processing_time = int((time.time() - start_time) * 1000)
@@ -466,8 +647,10 @@ def process_approval(ec_request, approved_by, start_time):
         ec_request.mark_completed(ec_request.points_to_award)
         
         # 6. ユーザーに付与完了通知
-        notification_service = NotificationService()
-        notification_service.notify_user_points_awarded(ec_request, payment_result['message'])
+        with latency_service.measure('notification', ec_request.store_id):
+            notification_service = NotificationService()
+            notification_service.notify_user_points_awarded(ec_request, payment_result['message'])
+        latency_service.record('approval_total', (time.time() - start_time) * 1000, ec_request.store_id)
         
         logger.info(f"Points awarded: User {ec_request.user.username}, Points {ec_request.points_to_award}, Method: {payment_result['payment_method']}")
         
@@ -512,46 +695,10 @@ def get_analytics_daily_trend(request):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # パラメータ取得
-        days = min(int(request.GET.get('days', 30)), 90)
-        
-        from datetime import timedelta, date
-        from django.db.models import Count, Sum
-        
-        # 期間設定
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days-1)
+        days = min(int(request.GET.get('days', 30)), ec_analytics_service.max_trend_days)
         
-        # 日別データ生成
-        daily_data = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            day_start = timezone.make_aware(timezone.datetime.combine(current_date, timezone.datetime.min.time()))
-            day_end = day_start + timedelta(days=1)
-            
-            day_stats = ECPointRequest.objects.filter(
-                created_at__gte=day_start,
-                created_at__lt=day_end
-            ).aggregate(
-                total_requests=Count('id'),
-                total_amount=Sum('purchase_amount'),
-                pending_count=Count('id', filter=Q(status='pending')),
-                approved_count=Count('id', filter=Q(status='approved')),
-                completed_count=Count('id', filter=Q(status='completed')),
-                rejected_count=Count('id', filter=Q(status='rejected'))
-            )
-            
-            daily_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'total_requests': day_stats['total_requests'] or 0,
-                'total_amount': float(day_stats['total_amount'] or 0),
-                'pending': day_stats['pending_count'] or 0,
-                'approved': day_stats['approved_count'] or 0,
-                'completed': day_stats['completed_count'] or 0,
-                'rejected': day_stats['rejected_count'] or 0
-            })
-            
-            current_date += timedelta(days=1)
+        # 日別データ（1クエリで集計、前日までの分はキャッシュ）
+        daily_data = ec_analytics_service.daily_trend(days)
         
         return Response({
             'success': True,
@@ -581,41 +728,8 @@ def get_analytics_store_performance(request):
         days = min(int(request.GET.get('days', 30)), 90)
         limit = min(int(request.GET.get('limit', 20)), 50)
         
-        from datetime import timedelta
-        from django.db.models import Count, Sum, Avg
-        
-        # 期間設定
-        date_from = timezone.now() - timedelta(days=days)
-        
-        # 店舗別統計
-        store_stats = ECPointRequest.objects.filter(
-            created_at__gte=date_from
-        ).values(
-            'store__id', 'store__name'
-        ).annotate(
-            total_requests=Count('id'),
-            total_amount=Sum('purchase_amount'),
-            avg_amount=Avg('purchase_amount'),
-            completed_requests=Count('id', filter=Q(status='completed')),
-            pending_requests=Count('id', filter=Q(status='pending')),
-            rejected_requests=Count('id', filter=Q(status='rejected')),
-            success_rate=Count('id', filter=Q(status__in=['completed', 'approved'])) * 100.0 / Count('id')
-        ).order_by('-total_requests')[:limit]
-        
-        # データ整形
-        performance_data = []
-        for store in store_stats:
-            performance_data.append({
-                'store_id': store['store__id'],
-                'store_name': store['store__name'],
-                'total_requests': store['total_requests'],
-                'total_amount': float(store['total_amount'] or 0),
-                'avg_amount': float(store['avg_amount'] or 0),
-                'completed': store['completed_requests'],
-                'pending': store['pending_requests'],
-                'rejected': store['rejected_requests'],
-                'success_rate': round(store['success_rate'] or 0, 1)
-            })
+        # 店舗別統計（日次集計から取得）
+        performance_data = ec_stats_service.store_performance(days, limit)
         
         return Response({
             'success': True,
@@ -644,29 +758,11 @@ def get_analytics_payment_analysis(request):
         # パラメータ取得
         days = min(int(request.GET.get('days', 30)), 90)
         
-        from datetime import timedelta
-        from django.db.models import Count, Sum
-        
-        # 期間設定
-        date_from = timezone.now() - timedelta(days=days)
-        
-        # 申請タイプ別統計
-        type_stats = ECPointRequest.objects.filter(
-            created_at__gte=date_from
-        ).values('request_type').annotate(
-            count=Count('id'),
-            total_amount=Sum('purchase_amount')
-        )
+        # 申請タイプ別統計（日次集計から取得）
+        type_stats = ec_stats_service.breakdown(days, 'request_type')
         
         # 決済方法別統計（完了済み申請のみ）
-        payment_stats = ECPointRequest.objects.filter(
-            created_at__gte=date_from,
-            status='completed',
-            payment_method__isnull=False
-        ).values('payment_method').annotate(
-            count=Count('id'),
-            total_amount=Sum('purchase_amount')
-        )
+        payment_stats = ec_stats_service.breakdown(days, 'payment_method', status='completed', payment_method__gt='')
         
         # データ整形
         request_types = []
@@ -707,6 +803,47 @@ def get_analytics_payment_analysis(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_analytics_stage_latency(request):
+    """処理段階別のレイテンシ（p50/p95/p99）"""
+    try:
+        # 管理者のみアクセス可能
+        if request.user.role != 'admin':
+            return Response({
+                'error': '管理者のみアクセス可能です'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        # パラメータ取得
+        days = max(1, min(int(request.GET.get('days', 7)), 90))
+        store_id = request.GET.get('store_id')
+        stage = request.GET.get('stage')
+        group_by = request.GET.get('group_by', 'day')
+        if group_by not in ('day', 'store', 'stage'):
+            return Response({
+                'error': 'group_byは day / store / stage のいずれかを指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if stage and stage not in latency_service.STAGES:
+            return Response({
+                'error': f'stageは {" / ".join(latency_service.STAGES)} のいずれかを指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'period': f'{days}日間',
+            'group_by': group_by,
+            'data': latency_service.stage_percentiles(
+                days=days, store_id=int(store_id) if store_id else None, stage=stage, group_by=group_by
+            )
+        })
+        
+    except Exception as e:
+        logger.error(f"Failed to get stage latency: {str(e)}")
+        return Response({
+            'error': 'レイテンシデータの取得に失敗しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # === ユーティリティ関数 ===
 
 def get_client_ip(request):
@@ -810,47 +947,19 @@ class ECRequestManagementView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     def get_comprehensive_stats(self, days_filter):
-        """包括的な統計情報を取得"""
-        from datetime import timedelta
-        
-        # 期間設定
-        if days_filter > 0:
-            date_from = timezone.now() - timedelta(days=days_filter)
-            queryset = ECPointRequest.objects.filter(created_at__gte=date_from)
-        else:
-            queryset = ECPointRequest.objects.all()
-        
-        # 今日の範囲
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_queryset = queryset.filter(created_at__gte=today_start)
-        
-        # ステータス別集計
-        status_counts = queryset.values('status').annotate(count=Count('status'))
-        status_summary = {}
-        for item in status_counts:
-            status_summary[item['status']] = item['count']
-        
-        # 今日の合計金額
-        today_total = today_queryset.aggregate(
-            total=Sum('purchase_amount')
-        )['total'] or Decimal('0')
-        
-        # 全体統計
-        total_stats = queryset.aggregate(
-            total_amount=Sum('purchase_amount'),
-            total_points=Sum('points_awarded')
-        )
+        """包括的な統計情報を取得（日次集計から取得）"""
+        stats = ec_stats_service.summary(days_filter if days_filter > 0 else None)
         
         return {
-            'total': queryset.count(),
-            'pending': status_summary.get('pending', 0),
-            'approved': status_summary.get('approved', 0),
-            'completed': status_summary.get('completed', 0),
-            'rejected': status_summary.get('rejected', 0),
-            'failed': status_summary.get('failed', 0),
-            'today_total': float(today_total),
-            'period_total_amount': float(total_stats['total_amount'] or 0),
-            'period_total_points': total_stats['total_points'] or 0,
+            'total': stats['total'],
+            'pending': stats['pending'],
+            'approved': stats['approved'],
+            'completed': stats['completed'],
+            'rejected': stats['rejected'],
+            'failed': stats['failed'],
+            'today_total': float(stats['today_total']),
+            'period_total_amount': float(stats['total_amount']),
+            'period_total_points': stats['total_points'],
         }
     
     def get_store_list(self):
@@ -1007,7 +1116,7 @@ def get_store_all_requests(request):
         # すべての申請を取得
         queryset = ECPointRequest.objects.filter(
             store__in=managed_stores
-        ).prefetch_related('messages').order_by('-created_at')
+        ).select_related('user', 'store', 'receipt_image_meta').prefetch_related('messages').order_by('-created_at')
         
         # ページネーション
         paginator = Paginator(queryset, per_page)
@@ -0,0 +1,202 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from decimal import Decimal
+import logging
+
+from .models import ECPointRequest, ECRequestDailyStat
+
+logger = logging.getLogger(__name__)
+
+
+class ECStatsService:
+    """EC申請の日次集計（ECRequestDailyStat）の更新と参照
+
+    申請1件の集計上の状態を「スナップショット」（集計キー + 金額・ポイント）として扱い、
+    作成・変更・削除の前後のスナップショットの差分を集計行に加算する。分析APIは申請を
+    走査せずに集計行のみを読むため、応答時間は申請の総件数に依存しない。
+    """
+
+    KEY_FIELDS = ['store_id', 'day', 'request_type', 'status', 'payment_method']
+    SNAPSHOT_FIELDS = [
+        'store_id', 'created_at', 'request_type', 'status', 'payment_method',
+        'purchase_amount', 'points_to_award', 'points_awarded'
+    ]
+
+    def __init__(self):
+        self.rebuild_batch_size = 1000
+
+    # === 集計の更新 ===
+
+    def snapshot(self, ec_request):
+        """申請の集計上の状態（集計キー, 件数・金額・ポイントの値）"""
+        return self._snapshot_values(*(getattr(ec_request, field) for field in self.SNAPSHOT_FIELDS))
+
+    def fetch_snapshot(self, request_id):
+        """保存済みの申請のスナップショット（存在しない場合は None）"""
+        values = ECPointRequest.objects.filter(pk=request_id).values_list(*self.SNAPSHOT_FIELDS).first()
+        return self._snapshot_values(*values) if values else None
+
+    def _snapshot_values(self, store_id, created_at, request_type, status, payment_method,
+                         purchase_amount, points_to_award, points_awarded):
+        day = timezone.localtime(created_at).date() if created_at else timezone.localdate()
+        key = (store_id, day, request_type, status, payment_method or '')
+        return key, (1, Decimal(purchase_amount or 0), points_to_award or 0, points_awarded or 0)
+
+    def record_changes(self, changes):
+        """[(変更前のスナップショット, 変更後のスナップショット), ...] の差分を集計に反映
+
+        作成時は変更前、削除時は変更後を None とする。呼び出し側のトランザクション内で
+        実行すれば、申請の変更がロールバックされた場合に集計も元に戻る。
+        """
+        deltas = {}
+        for before, after in changes:
+            for snapshot, sign in ((before, -1), (after, 1)):
+                if snapshot is None:
+                    continue
+                key, values = snapshot
+                total = deltas.setdefault(key, [0, Decimal('0'), 0, 0])
+                for index, value in enumerate(values):
+                    total[index] += sign * value
+
+        deltas = {key: total for key, total in deltas.items() if any(total)}
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            ECRequestDailyStat.objects.bulk_create([
+                ECRequestDailyStat(**dict(zip(self.KEY_FIELDS, key))) for key in deltas
+            ], ignore_conflicts=True)
+            for key, (count, amount, points_to_award, points_awarded) in sorted(deltas.items(), key=str):
+                ECRequestDailyStat.objects.filter(**dict(zip(self.KEY_FIELDS, key))).update(
+                    request_count=F('request_count') + count,
+                    total_amount=F('total_amount') + amount,
+                    points_to_award=F('points_to_award') + points_to_award,
+                    points_awarded=F('points_awarded') + points_awarded
+                )
+
+    def record_created(self, ec_requests):
+        """一括作成した申請を集計に反映（bulk_create では post_save シグナルが発火しないため）"""
+        self.record_changes([(None, self.snapshot(ec_request)) for ec_request in ec_requests])
+
+    def rebuild(self, days=None, dry_run=False):
+        """申請から集計を作り直す（days 指定時は直近days日分のみ）"""
+        requests = ECPointRequest.objects.all()
+        stats = ECRequestDailyStat.objects.all()
+        if days:
+            start_date = timezone.localdate() - timezone.timedelta(days=days - 1)
+            tz = timezone.get_current_timezone()
+            requests = requests.filter(
+                created_at__gte=timezone.make_aware(
+                    timezone.datetime.combine(start_date, timezone.datetime.min.time()), tz
+                )
+            )
+            stats = stats.filter(day__gte=start_date)
+        if dry_run:
+            return requests.count()
+
+        rows = requests.annotate(
+            day=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+        ).order_by().values(*self.KEY_FIELDS).annotate(
+            request_count=Count('id'),
+            total_amount=Sum('purchase_amount'),
+            points_to_award=Sum('points_to_award'),
+            points_awarded=Sum('points_awarded')
+        )
+
+        with transaction.atomic():
+            stats.delete()
+            ECRequestDailyStat.objects.bulk_create([
+                ECRequestDailyStat(**row) for row in rows
+            ], batch_size=self.rebuild_batch_size)
+
+        rebuilt = requests.count()
+        logger.info(f"EC daily stats rebuilt from {rebuilt} requests")
+        return rebuilt
+
+    # === 集計の参照 ===
+
+    def period_stats(self, days=None, store=None):
+        """直近days日間（当日を含む、None の場合は全期間）の集計行"""
+        stats = ECRequestDailyStat.objects.all()
+        if days:
+            stats = stats.filter(day__gte=timezone.localdate() - timezone.timedelta(days=days - 1))
+        if store is not None:
+            stats = stats.filter(store=store)
+        return stats
+
+    def store_performance(self, days, limit):
+        """店舗別の申請数・金額・状態内訳（申請数の多い順）"""
+        stats = self.period_stats(days).values('store_id', 'store__name').annotate(
+            total_requests=Sum('request_count'),
+            total_amount=Sum('total_amount'),
+            completed_requests=Sum('request_count', filter=Q(status='completed')),
+            pending_requests=Sum('request_count', filter=Q(status='pending')),
+            rejected_requests=Sum('request_count', filter=Q(status='rejected')),
+            succeeded_requests=Sum('request_count', filter=Q(status__in=['completed', 'approved']))
+        ).filter(total_requests__gt=0).order_by('-total_requests')[:limit]
+
+        performance = []
+        for store in stats:
+            total_requests = store['total_requests']
+            total_amount = float(store['total_amount'] or 0)
+            performance.append({
+                'store_id': store['store_id'],
+                'store_name': store['store__name'],
+                'total_requests': total_requests,
+                'total_amount': total_amount,
+                'avg_amount': total_amount / total_requests,
+                'completed': store['completed_requests'] or 0,
+                'pending': store['pending_requests'] or 0,
+                'rejected': store['rejected_requests'] or 0,
+                'success_rate': round((store['succeeded_requests'] or 0) * 100.0 / total_requests, 1)
+            })
+        return performance
+
+    def breakdown(self, days, field, **filters):
+        """指定フィールド別の申請数・金額（[{field, count, total_amount}, ...]）"""
+        return [
+            row for row in self.period_stats(days).filter(**filters).values(field).annotate(
+                count=Sum('request_count'),
+                total_amount=Sum('total_amount')
+            ).order_by(field)
+            if row['count']
+        ]
+
+    def summary(self, days=None):
+        """期間内の状態別件数・金額・付与ポイントと当日の金額"""
+        statuses = ('pending', 'approved', 'completed', 'rejected', 'failed')
+        stats = self.period_stats(days).aggregate(
+            total_requests=Sum('request_count'),
+            period_amount=Sum('total_amount'),
+            period_points=Sum('points_awarded'),
+            today_amount=Sum('total_amount', filter=Q(day=timezone.localdate())),
+            **{f'{status}_requests': Sum('request_count', filter=Q(status=status)) for status in statuses}
+        )
+        summary = {
+            'total': stats['total_requests'] or 0,
+            'total_amount': stats['period_amount'] or Decimal('0'),
+            'total_points': stats['period_points'] or 0,
+            'today_total': stats['today_amount'] or Decimal('0'),
+        }
+        summary.update({status: stats[f'{status}_requests'] or 0 for status in statuses})
+        return summary
+
+    def store_payment_stats(self, store, start_date):
+        """店舗の承認済み申請の件数・付与予定ポイントと支払い方法別件数（start_date 以降に作成された申請）"""
+        stats = ECRequestDailyStat.objects.filter(
+            store=store,
+            status__in=['approved', 'completed'],
+            day__gte=timezone.localtime(start_date).date()
+        ).aggregate(
+            total_requests=Sum('request_count'),
+            total_points=Sum('points_to_award'),
+            credit_payments=Sum('request_count', filter=Q(payment_method='card_payment')),
+            deposit_payments=Sum('request_count', filter=Q(payment_method='deposit_consumption'))
+        )
+        return {key: value or 0 for key, value in stats.items()}
+
+
+# グローバルインスタンス
+ec_stats_service = ECStatsService()
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from datetime import timedelta
+import json
+import logging
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+
+class _FailedResponse(Exception):
+    """エラー応答時に冪等キーの確保ごとロールバックするための内部例外"""
+
+    def __init__(self, body, status_code):
+        self.body = body
+        self.status_code = status_code
+
+
+class IdempotencyService:
+    """冪等キー管理サービス
+
+    (処理種別, 実行主体, 参照ID) ごとに最初の処理結果を記録し、再送時は台帳に触れずに
+    記録済みの結果を返す。参照は短TTLキャッシュ → ユニークインデックスの順に行う。
+    """
+
+    CACHE_KEY = 'idempotency:{scope}:{actor_key}:{reference_id}'
+    HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+    def __init__(self):
+        self.cache_timeout = 600  # 再送が集中する直後の参照をキャッシュで受ける（秒）
+        self.purge_batch_size = 5000
+
+    @staticmethod
+    def actor_key(kind, pk):
+        """実行主体キーを生成（例: user:12, store:3）"""
+        return f"{kind}:{pk}"
+
+    def key_from_request(self, request, fallback=""):
+        """Idempotency-Keyヘッダー、なければ reference_id パラメータから参照IDを取得"""
+        reference_id = request.META.get(self.HEADER) or request.data.get('reference_id') or fallback
+        return str(reference_id)[:100] if reference_id else ""
+
+    def _cache_key(self, scope, actor_key, reference_id):
+        return self.CACHE_KEY.format(scope=scope, actor_key=actor_key, reference_id=reference_id)
+
+    def lookup(self, scope, actor_key, reference_id):
+        """記録済みの結果を (レスポンス内容, ステータス) で返す（未処理はNone）"""
+        if not reference_id:
+            return None
+
+        cache_key = self._cache_key(scope, actor_key, reference_id)
+        try:
+            cached = cache.get(cache_key)
+        except Exception:
+            cached = None
+        if cached is not None:
+            return cached['body'], cached['status']
+
+        record = IdempotencyRecord.objects.filter(
+            scope=scope,
+            actor_key=actor_key,
+            reference_id=reference_id,
+            response_status__isnull=False
+        ).values('response_body', 'response_status').first()
+        if record is None:
+            return None
+
+        self._cache_result(cache_key, record['response_body'], record['response_status'])
+        return record['response_body'], record['response_status']
+
+    def execute(self, scope, actor_key, reference_id, operation):
+        """冪等キー付きで処理を実行し、(レスポンス内容, ステータス, 再送か) を返す
+
+        operation は (レスポンス内容, ステータス) を返す関数。冪等キーの確保と処理は同一
+        トランザクションで行うため、同じキーの同時実行はユニーク制約で片方のみが処理される。
+        エラー応答（4xx/5xx）は記録せず、処理ごとロールバックして再試行可能にする。
+        """
+        if not reference_id:
+            body, status_code = operation()
+            return body, status_code, False
+
+        replay = self.lookup(scope, actor_key, reference_id)
+        if replay is not None:
+            logger.info(f"Idempotent replay: {scope} {actor_key} {reference_id}")
+            return replay[0], replay[1], True
+
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    scope=scope,
+                    actor_key=actor_key,
+                    reference_id=reference_id
+                )
+
+                body, status_code = operation()
+                if status_code >= 400:
+                    raise _FailedResponse(body, status_code)
+
+                body = json.loads(json.dumps(body, cls=DjangoJSONEncoder))
+                record.response_body = body
+                record.response_status = status_code
+                record.save(update_fields=['response_body', 'response_status'])
+
+        except _FailedResponse as failed:
+            return failed.body, failed.status_code, False
+
+        except IntegrityError:
+            # 同じキーの同時実行が先にコミットされた
+            replay = self.lookup(scope, actor_key, reference_id)
+            if replay is None:
+                raise
+            logger.info(f"Idempotent replay after concurrent execution: {scope} {actor_key} {reference_id}")
+            return replay[0], replay[1], True
+
+        cache_key = self._cache_key(scope, actor_key, reference_id)
+        transaction.on_commit(lambda: self._cache_result(cache_key, body, status_code))
+        return body, status_code, False
+
+    @property
+    def retention_days(self):
+        """記録の保持日数（送信元の再送期間より十分長くする）"""
+        return getattr(settings, 'IDEMPOTENCY_RETENTION_DAYS', 30)
+
+    def purge_expired(self, retention_days=None, dry_run=False):
+        """保持期間を過ぎた記録を削除し、削除（dry_run の場合は対象）件数を返す
+
+        作成日時のインデックスで古い順に一定件数ずつ削除し、長時間のロックを避ける。
+        """
+        days = self.retention_days if retention_days is None else retention_days
+        expired = IdempotencyRecord.objects.filter(created_at__lt=timezone.now() - timedelta(days=days))
+        if dry_run:
+            return expired.count()
+
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('created_at').values_list('id', flat=True)[:self.purge_batch_size])
+            if not ids:
+                break
+            deleted += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
+        if deleted:
+            logger.info(f"Purged {deleted} idempotency records older than {days} days")
+        return deleted
+
+    def _cache_result(self, cache_key, body, status_code):
+        try:
+            cache.set(cache_key, {'body': body, 'status': status_code}, self.cache_timeout)
+        except Exception as e:
+            logger.warning(f"Failed to cache idempotency result: {str(e)}")
+
+
+# グローバルインスタンス
+idempotency_service = IdempotencyService()
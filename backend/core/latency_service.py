@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from contextlib import contextmanager
+import bisect
+import logging
+import threading
+import time
+
+from .models import StageLatency
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyService:
+    """ECパイプラインの処理段階別レイテンシ（ヒストグラム）の記録と百分位数の算出
+
+    計測値はプロセス内のヒストグラム（日 × 段階 × 店舗）に加算し、一定間隔ごとに
+    StageLatency へまとめて書き込む。ヒストグラムは対数区間（1区間あたり20%）のため、
+    百分位数の誤差は区間幅以内に収まり、件数によらず行のサイズは一定。
+    """
+
+    BUCKET_BOUNDS_MS = [round(0.25 * 1.2 ** index, 3) for index in range(73)]  # 0.25ms 〜 約120秒
+    STAGES = [stage for stage, _ in StageLatency.STAGE_CHOICES]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._flush_scheduled = False
+
+    @property
+    def flush_interval(self):
+        """プロセス内のヒストグラムをテーブルに書き込む間隔（秒）"""
+        return getattr(settings, 'LATENCY_FLUSH_SECONDS', 30)
+
+    # === 記録 ===
+
+    def record(self, stage, duration_ms, store_id=None):
+        """処理時間を1件記録"""
+        key = (timezone.localdate(), stage, store_id)
+        bucket = bisect.bisect_left(self.BUCKET_BOUNDS_MS, duration_ms)
+
+        with self._lock:
+            histogram = self._pending.get(key)
+            if histogram is None:
+                histogram = self._pending[key] = {
+                    'buckets': [0] * (len(self.BUCKET_BOUNDS_MS) + 1), 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0
+                }
+            histogram['buckets'][bucket] += 1
+            histogram['count'] += 1
+            histogram['total_ms'] += duration_ms
+            histogram['max_ms'] = max(histogram['max_ms'], duration_ms)
+
+            due = not self._flush_scheduled and time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self._flush_scheduled = True
+
+        if due:
+            # 実行中のトランザクションがロールバックされても計測値を失わないよう、コミット後に書き込む
+            transaction.on_commit(self.flush)
+
+    @contextmanager
+    def measure(self, stage, store_id=None):
+        """with ブロックの処理時間を記録"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000, store_id)
+
+    def flush(self):
+        """プロセス内のヒストグラムをテーブルに加算し、書き込んだ行数を返す"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            self._flush_scheduled = False
+        if not pending:
+            return 0
+
+        try:
+            with transaction.atomic():
+                # 行ロックの取得順を揃えてデッドロックを避ける。同時に行を作成した場合は
+                # 一意制約（店舗なしは条件付き制約）で片方が失敗し、get_or_create が既存行を取得し直す
+                for (day, stage, store_id), histogram in sorted(pending.items(), key=str):
+                    row, _ = StageLatency.objects.select_for_update().get_or_create(
+                        day=day, stage=stage, store_id=store_id
+                    )
+                    buckets = row.bucket_counts or [0] * len(histogram['buckets'])
+                    row.bucket_counts = [mine + theirs for mine, theirs in zip(buckets, histogram['buckets'])]
+                    row.count += histogram['count']
+                    row.total_ms += histogram['total_ms']
+                    row.max_ms = max(row.max_ms, histogram['max_ms'])
+                    row.save()
+        except Exception as e:
+            logger.error(f"Failed to flush stage latencies: {str(e)}")
+            with self._lock:
+                for key, histogram in pending.items():
+                    self._merge(self._pending, key, histogram)
+            return 0
+        return len(pending)
+
+    def _merge(self, histograms, key, histogram):
+        current = histograms.get(key)
+        if current is None:
+            histograms[key] = histogram
+            return
+        current['buckets'] = [mine + theirs for mine, theirs in zip(current['buckets'], histogram['buckets'])]
+        current['count'] += histogram['count']
+        current['total_ms'] += histogram['total_ms']
+        current['max_ms'] = max(current['max_ms'], histogram['max_ms'])
+
+    # === 集計 ===
+
+    def percentile(self, buckets, count, fraction, max_ms):
+        """ヒストグラムの百分位数（該当区間の上限、最大値で頭打ち）"""
+        target = fraction * count
+        cumulative = 0
+        for index, bucket_count in enumerate(buckets):
+            cumulative += bucket_count
+            if cumulative >= target:
+                bound = self.BUCKET_BOUNDS_MS[index] if index < len(self.BUCKET_BOUNDS_MS) else max_ms
+                return round(min(bound, max_ms), 2)
+        return round(max_ms, 2)
+
+    def stage_percentiles(self, days=7, store_id=None, stage=None, group_by='day'):
+        """段階別のp50/p95/p99（group_by: 'day' は日別、'store' は店舗別、'stage' は期間全体）"""
+        self.flush()
+
+        rows = StageLatency.objects.filter(day__gte=timezone.localdate() - timezone.timedelta(days=days - 1))
+        if store_id:
+            rows = rows.filter(store_id=store_id)
+        if stage:
+            rows = rows.filter(stage=stage)
+
+        group_field = {'day': 'day', 'store': 'store_id'}.get(group_by)
+        merged = {}
+        for row in rows.values('day', 'stage', 'store_id', 'bucket_counts', 'count', 'total_ms', 'max_ms'):
+            key = (row['stage'], row[group_field] if group_field else None)
+            self._merge(merged, key, {
+                'buckets': row['bucket_counts'], 'count': row['count'],
+                'total_ms': row['total_ms'], 'max_ms': row['max_ms']
+            })
+
+        results = []
+        for (row_stage, group), histogram in sorted(
+            merged.items(), key=lambda item: (self.STAGES.index(item[0][0]), str(item[0][1]))
+        ):
+            count = histogram['count']
+            result = {'stage': row_stage}
+            if group_by == 'day':
+                result['date'] = group.isoformat()
+            elif group_by == 'store':
+                result['store_id'] = group
+            result.update({
+                'count': count,
+                'mean_ms': round(histogram['total_ms'] / count, 2) if count else 0,
+                'p50_ms': self.percentile(histogram['buckets'], count, 0.50, histogram['max_ms']),
+                'p95_ms': self.percentile(histogram['buckets'], count, 0.95, histogram['max_ms']),
+                'p99_ms': self.percentile(histogram['buckets'], count, 0.99, histogram['max_ms']),
+                'max_ms': round(histogram['max_ms'], 2),
+            })
+            results.append(result)
+        return results
+
+
+# グローバルインスタンス
+latency_service = LatencyService()
@@ -0,0 +1,325 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.utils import timezone
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+from .models import PointTransaction, PointLedgerArchive, PointAwardLog, User, Store
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=12)
+def _read_archive_file(file_path, checksum):
+    """アーカイブファイルを読み込み、行（dict）のリストを新しい順で返す
+
+    チェックサムをキーに含めるため、同じパスのファイルが差し替えられた場合は再読込される。
+    """
+    with gzip.open(file_path, 'rt', encoding='utf-8') as archive_file:
+        payload = json.load(archive_file)
+
+    columns = payload['columns']
+    data = payload['data']
+    rows = []
+    for values in zip(*(data[column] for column in columns)):
+        row = dict(zip(columns, values))
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+        rows.append(row)
+    rows.sort(key=lambda row: (row['created_at'], row['id']), reverse=True)
+    return rows
+
+
+class LedgerArchiveService:
+    """ポイント取引台帳の月次アーカイブ管理サービス
+
+    締め済みの月の取引を列指向（列ごとの配列）のJSONとしてgzip圧縮したファイルへ移し、
+    ホットテーブル（PointTransaction）からは削除する。履歴の読み出しはホットテーブルと
+    アーカイブを透過的にマージして返す。
+    """
+
+    FORMAT = 'point-ledger-columnar-v1'
+    COLUMNS = [
+        'id', 'user_id', 'store_id', 'points', 'transaction_type', 'description',
+        'balance_before', 'balance_after', 'reference_id', 'processed_by_id', 'created_at',
+    ]
+    EARNED_TYPES = ['grant', 'bonus']  # 累計獲得ポイントに算入する取引種別
+
+    def __init__(self):
+        self.delete_batch_size = 1000  # ホットテーブルからの削除1クエリあたりの件数
+
+    @property
+    def archive_dir(self):
+        return Path(getattr(settings, 'POINT_LEDGER_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'ledger_archive'))
+
+    @staticmethod
+    def month_start(value):
+        """日時が属する月の初日0時（現在のタイムゾーン）を返す"""
+        return timezone.localtime(value).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def next_month(month_start):
+        if month_start.month == 12:
+            return month_start.replace(year=month_start.year + 1, month=1)
+        return month_start.replace(month=month_start.month + 1)
+
+    def archivable_months(self, hot_months=None):
+        """アーカイブ対象となる締め済み月（ホット保持期間より前）の月初一覧を古い順で返す"""
+        if hot_months is None:
+            hot_months = getattr(settings, 'POINT_LEDGER_HOT_MONTHS', 12)
+
+        cutoff = self.month_start(timezone.now())
+        for _ in range(hot_months):
+            cutoff = (cutoff - timezone.timedelta(days=1)).replace(day=1)
+
+        oldest = PointTransaction.objects.filter(created_at__lt=cutoff).order_by('created_at').values_list(
+            'created_at', flat=True
+        ).first()
+        if oldest is None:
+            return []
+
+        archived = set(PointLedgerArchive.objects.values_list('month', flat=True))
+        months = []
+        month = self.month_start(oldest)
+        while month < cutoff:
+            if month.date() not in archived:
+                months.append(month)
+            month = self.next_month(month)
+        return months
+
+    def _archivable_queryset(self, month_start):
+        """対象月の取引のうち、他テーブルから参照されていないもの（参照中の行はホットに残す）"""
+        referenced_ids = PointAwardLog.objects.filter(
+            point_transaction__created_at__gte=month_start,
+            point_transaction__created_at__lt=self.next_month(month_start)
+        ).values('point_transaction_id')
+        return PointTransaction.objects.filter(
+            created_at__gte=month_start,
+            created_at__lt=self.next_month(month_start)
+        ).exclude(id__in=referenced_ids)
+
+    def archive_month(self, month_start, dry_run=False):
+        """1か月分の取引をアーカイブファイルへ移し、PointLedgerArchiveを返す（dry_run時は件数）"""
+        month_start = self.month_start(month_start)
+        if month_start >= self.month_start(timezone.now()):
+            raise ValueError(f"締め済みでない月はアーカイブできません: {month_start:%Y-%m}")
+        if PointLedgerArchive.objects.filter(month=month_start.date()).exists():
+            raise ValueError(f"既にアーカイブ済みの月です: {month_start:%Y-%m}")
+
+        queryset = self._archivable_queryset(month_start)
+        if dry_run:
+            return queryset.count()
+
+        # 列ごとの配列として読み出し（IDの昇順でストリーミング）
+        data = {column: [] for column in self.COLUMNS}
+        for values in queryset.order_by('id').values_list(*self.COLUMNS).iterator(chunk_size=5000):
+            for column, value in zip(self.COLUMNS, values):
+                data[column].append(value.isoformat() if column == 'created_at' else value)
+
+        row_count = len(data['id'])
+        if row_count == 0:
+            return None
+
+        file_path = self._write_archive_file(month_start, data)
+        checksum = self._file_checksum(file_path)
+
+        # 書き込んだファイルを読み戻して検証してからホットテーブルを削除する
+        archived_rows = _read_archive_file(str(file_path), checksum)
+        if len(archived_rows) != row_count:
+            raise ValueError(f"アーカイブ検証に失敗しました: {file_path}")
+
+        with transaction.atomic():
+            archive = PointLedgerArchive.objects.create(
+                month=month_start.date(),
+                file_path=str(file_path),
+                row_count=row_count,
+                points_total=sum(data['points']),
+                first_transaction_id=data['id'][0],
+                last_transaction_id=data['id'][-1],
+                file_size=file_path.stat().st_size,
+                checksum=checksum
+            )
+
+            ids = data['id']
+            for offset in range(0, len(ids), self.delete_batch_size):
+                PointTransaction.objects.filter(pk__in=ids[offset:offset + self.delete_batch_size]).delete()
+
+        logger.info(f"Point ledger archived: {month_start:%Y-%m}, {row_count} rows, {archive.file_size} bytes")
+        return archive
+
+    def _write_archive_file(self, month_start, data):
+        """一時ファイルへ書き込んでからリネームし、途中で中断しても壊れたファイルを残さない"""
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        file_path = self.archive_dir / f"point_transactions_{month_start:%Y_%m}.json.gz"
+        temp_path = file_path.with_suffix('.tmp')
+
+        payload = {
+            'format': self.FORMAT,
+            'month': f"{month_start:%Y-%m}",
+            'columns': self.COLUMNS,
+            'data': data,
+        }
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=9) as archive_file:
+            json.dump(payload, archive_file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, file_path)
+        return file_path
+
+    @staticmethod
+    def _file_checksum(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as archive_file:
+            for block in iter(lambda: archive_file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _archived_rows(self, archive):
+        return _read_archive_file(archive.file_path, archive.checksum)
+
+    def recent_transactions(self, limit=50, user_id=None, store_ids=None, transaction_types=None,
+                            positive_only=False, since=None, until=None):
+        """ホットテーブルとアーカイブを透過的にマージし、新しい順に取引（dict）を返す
+
+        ホットテーブルだけで件数が満たされ、かつ最古の行がアーカイブ範囲より新しければ
+        アーカイブは読まない。アーカイブは新しい月から順に必要な分だけ読み込む。
+        """
+        queryset = PointTransaction.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        if store_ids is not None:
+            queryset = queryset.filter(store_id__in=store_ids)
+        if transaction_types:
+            queryset = queryset.filter(transaction_type__in=transaction_types)
+        if positive_only:
+            queryset = queryset.filter(points__gt=0)
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+
+        rows = list(queryset.order_by('-created_at', '-id').values(*self.COLUMNS)[:limit])
+
+        archives = PointLedgerArchive.objects.order_by('-month')
+        if since:
+            archives = archives.filter(month__gte=self.month_start(since).date())
+        if until:
+            archives = archives.filter(month__lt=until.date() if isinstance(until, datetime) else until)
+
+        newest_archive = archives.values_list('month', flat=True).first()
+        needs_archive = newest_archive is not None and (
+            len(rows) < limit
+            or rows[-1]['created_at'] < self.next_month(
+                timezone.make_aware(datetime.combine(newest_archive, datetime.min.time()))
+            )
+        )
+
+        if needs_archive:
+            store_id_set = set(store_ids) if store_ids is not None else None
+            archived = []
+            for archive in archives:
+                for row in self._archived_rows(archive):
+                    if user_id is not None and row['user_id'] != user_id:
+                        continue
+                    if store_id_set is not None and row['store_id'] not in store_id_set:
+                        continue
+                    if transaction_types and row['transaction_type'] not in transaction_types:
+                        continue
+                    if positive_only and row['points'] <= 0:
+                        continue
+                    if since and row['created_at'] < since:
+                        continue
+                    if until and row['created_at'] >= until:
+                        continue
+                    archived.append(dict(row, archived=True))
+                    if len(archived) >= limit:
+                        break
+                if len(archived) >= limit:
+                    break
+
+            rows = sorted(rows + archived, key=lambda row: (row['created_at'], row['id']), reverse=True)[:limit]
+
+        return self._attach_names(rows)
+
+    def sum_points(self, user_id, after=None, until=None, earned_only=False):
+        """期間 (after, until] の取引ポイント合計と件数をホット・アーカイブ横断で返す
+
+        earned_only=True の場合は累計獲得ポイントの定義（付与・ボーナスの加算分）のみを集計する。
+        """
+        queryset = PointTransaction.objects.filter(user_id=user_id)
+        if after:
+            queryset = queryset.filter(created_at__gt=after)
+        if until:
+            queryset = queryset.filter(created_at__lte=until)
+        if earned_only:
+            queryset = queryset.filter(transaction_type__in=self.EARNED_TYPES, points__gt=0)
+        totals = queryset.aggregate(total=Sum('points'), count=Count('id'))
+        total = totals['total'] or 0
+        count = totals['count']
+
+        archives = PointLedgerArchive.objects.all()
+        if after:
+            archives = archives.filter(month__gte=self.month_start(after).date())
+        if until:
+            archives = archives.filter(month__lte=until.date())
+
+        for archive in archives:
+            for row in self._archived_rows(archive):
+                if row['user_id'] != user_id:
+                    continue
+                if after and row['created_at'] <= after:
+                    continue
+                if until and row['created_at'] > until:
+                    continue
+                if earned_only and (row['transaction_type'] not in self.EARNED_TYPES or row['points'] <= 0):
+                    continue
+                total += row['points']
+                count += 1
+
+        return total, count
+
+    def earned_totals(self):
+        """アーカイブ済み取引の累計獲得ポイント（付与・ボーナスの加算分）をユーザーごとに返す
+
+        ホットテーブルの集計に加算して累計獲得ポイントを求める（整合性チェック・修復用）。
+        """
+        totals = {}
+        for archive in PointLedgerArchive.objects.order_by('month'):
+            for row in self._archived_rows(archive):
+                if row['transaction_type'] in self.EARNED_TYPES and row['points'] > 0:
+                    totals[row['user_id']] = totals.get(row['user_id'], 0) + row['points']
+        return totals
+
+    def archived_months(self):
+        """アーカイブ済みの月（月初の日付）を古い順で返す"""
+        return list(PointLedgerArchive.objects.order_by('month').values_list('month', flat=True))
+
+    def _attach_names(self, rows):
+        """ユーザー名・店舗名を一括取得して付与（行ごとのJOINを避ける）"""
+        user_ids = {row['user_id'] for row in rows} | {
+            row['processed_by_id'] for row in rows if row['processed_by_id']
+        }
+        store_ids = {row['store_id'] for row in rows if row['store_id']}
+        users = {
+            user['id']: user
+            for user in User.objects.filter(pk__in=user_ids).values('id', 'username', 'email')
+        }
+        stores = dict(Store.objects.filter(pk__in=store_ids).values_list('id', 'name'))
+
+        for row in rows:
+            user = users.get(row['user_id'])
+            processed_by = users.get(row['processed_by_id'])
+            row['user_name'] = user['username'] if user else None
+            row['user_email'] = user['email'] if user else ''
+            row['store_name'] = stores.get(row['store_id'])
+            row['processed_by_name'] = processed_by['username'] if processed_by else None
+            row.setdefault('archived', False)
+        return rows
+
+
+# グローバルインスタンス
+ledger_archive_service = LedgerArchiveService()
@@ -0,0 +1,178 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import time
+import tracemalloc
+import uuid
+import logging
+
+from .models import User, Store, UserPoint, PointTransfer
+from .point_service import point_service
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerBenchmarkSuite:
+    """ポイント台帳の主要処理のベンチマーク（クエリ数の上限チェック付き）
+
+    生成したデータセットに対して各処理を実行し、実行時間・1操作あたりのクエリ数・
+    ピークメモリを計測する。クエリ数はデータセットの規模に依存してはならないため、
+    規模に関係なく固定の上限（QUERY_BUDGETS）で判定する。
+    """
+
+    # 1操作（check_expired_points は失効ロット1件）あたりのクエリ数の上限
+    QUERY_BUDGETS = {
+        'add_points': 8,
+        'consume_points': 8,
+        'execute_transfer': 17,
+        'award_points': 11,
+        'process_store_payment': 10,
+        'check_expired_points': 10,
+    }
+
+    def __init__(self):
+        self.default_users = 200
+        self.default_lots_per_user = 20
+        self.default_iterations = 20
+        self.lot_points = 100  # 1ロットあたりのポイント
+
+    def build_dataset(self, users=None, lots_per_user=None, expired_lots=None):
+        """ベンチマーク用の店舗・ユーザー・ポイントロットを一括生成"""
+        users = users or self.default_users
+        lots_per_user = lots_per_user or self.default_lots_per_user
+        run_id = uuid.uuid4().hex[:8]
+
+        store = Store.objects.create(
+            name=f'Ledger Benchmark {run_id}',
+            owner_name='Benchmark',
+            email=f'ledger-bench-{run_id}@example.com',
+            phone='000-0000-0000',
+            address='Benchmark'
+        )
+        User.objects.bulk_create([
+            User(
+                username=f'bench_ledger_{run_id}_{index}',
+                email=f'bench_ledger_{run_id}_{index}@example.com',
+                member_id=f'LBENCH{run_id}{index:06d}'
+            )
+            for index in range(users)
+        ])
+        user_ids = list(
+            User.objects.filter(username__startswith=f'bench_ledger_{run_id}_')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+        # 付与1回ごとにユーザーあたり1ロット（台帳・保存済み残高も整合した状態で作成）
+        chunk_size = point_service.max_bulk_grant_rows
+        for _ in range(lots_per_user):
+            for start in range(0, len(user_ids), chunk_size):
+                point_service.grant_points_bulk(
+                    [{'user_id': user_id, 'points': self.lot_points} for user_id in user_ids[start:start + chunk_size]],
+                    description='ベンチマーク用ポイント'
+                )
+
+        # 期限切れロット（既定はユーザー数と同数）
+        expired_lots = users if expired_lots is None else expired_lots
+        expired_ids = list(
+            UserPoint.objects.filter(user_id__in=user_ids).order_by('id').values_list('id', flat=True)[:expired_lots]
+        )
+        UserPoint.objects.filter(pk__in=expired_ids).update(
+            expiry_date=timezone.now() - timezone.timedelta(days=1)
+        )
+
+        return {'run_id': run_id, 'store': store, 'user_ids': user_ids}
+
+    def drop_dataset(self, dataset):
+        User.objects.filter(pk__in=dataset['user_ids']).delete()
+        dataset['store'].delete()
+
+    def _cases(self, dataset):
+        """(処理名, 事前準備, 計測対象) の一覧。事前準備の戻り値が計測対象に渡される"""
+        store = dataset['store']
+        user_ids = dataset['user_ids']
+        run_id = dataset['run_id']
+        # 複数ロットにまたがる消費
+        consume_amount = self.lot_points * 3 // 2
+
+        def user_at(index):
+            return User.objects.get(pk=user_ids[index % len(user_ids)])
+
+        return [
+            ('add_points', user_at,
+             lambda user: user.add_points(10, source_description='ベンチマーク付与')),
+            ('consume_points', user_at,
+             lambda user: user.consume_points(consume_amount, description='ベンチマーク消費')),
+            ('execute_transfer',
+             lambda index: PointTransfer.objects.create(
+                 sender=user_at(index), recipient=user_at(index + 1), points=10
+             ),
+             lambda transfer: transfer.execute_transfer()),
+            ('award_points', lambda index: (user_at(index), index),
+             lambda args: point_service.award_points(
+                 args[0], 10, 'ベンチマークEC付与', store=store, reference_id=f'BENCH-{run_id}-{args[1]}'
+             )),
+            ('process_store_payment', user_at,
+             lambda user: point_service.process_store_payment(
+                 customer=user, store=store, points=consume_amount
+             )),
+        ]
+
+    def _measure(self, operation, argument):
+        """1回の実行の (経過ミリ秒, クエリ数, ピークメモリKB, 戻り値) を返す"""
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                result = operation(argument)
+                elapsed = (time.perf_counter() - started) * 1000
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return elapsed, len(queries), peak / 1024, result
+
+    def run(self, dataset, iterations=None, operations=None):
+        """各処理を計測し、処理名ごとの結果（dict）の一覧を返す"""
+        iterations = iterations or self.default_iterations
+        results = []
+
+        for name, prepare, operation in self._cases(dataset):
+            if operations and name not in operations:
+                continue
+            timings, query_counts, peaks = [], [], []
+            for index in range(iterations):
+                elapsed, query_count, peak, _ = self._measure(operation, prepare(index))
+                timings.append(elapsed)
+                query_counts.append(query_count)
+                peaks.append(peak)
+            results.append(self._result(name, timings, query_counts, peaks, iterations))
+
+        if not operations or 'check_expired_points' in operations:
+            # 失効対象はデータセットのユーザーのロットに限定する（共有DB上の実ユーザーには触れない）
+            elapsed, query_count, peak, expired_count = self._measure(
+                point_service.check_expired_points, dataset['user_ids']
+            )
+            items = max(expired_count, 1)
+            results.append(self._result(
+                'check_expired_points', [elapsed / items], [query_count / items], [peak], expired_count
+            ))
+
+        return results
+
+    def _result(self, name, timings, query_counts, peaks, count):
+        timings = sorted(timings)
+        max_queries = max(query_counts)
+        budget = self.QUERY_BUDGETS[name]
+        return {
+            'operation': name,
+            'count': count,
+            'mean_ms': sum(timings) / len(timings),
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'max_queries': max_queries,
+            'query_budget': budget,
+            'peak_kb': max(peaks),
+            'over_budget': max_queries > budget,
+        }
+
+
+# グローバルインスタンス
+ledger_benchmark_suite = LedgerBenchmarkSuite()
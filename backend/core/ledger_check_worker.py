@@ -0,0 +1,102 @@
+"""ポイント台帳整合性チェックのワーカー処理
+
+spawnで起動した子プロセスから読み込まれるため、モジュール読み込み時にはモデルを
+importせず、Djangoのセットアップ後に関数内でimportする。
+"""
+
+
+def init_worker():
+    """ワーカープロセス初期化（spawnで起動した子プロセスでDjangoをセットアップ）"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def check_user_batch(user_ids):
+    """ユーザーの一括チェック（ワーカープロセスで実行）
+
+    バッチ単位で「保存済み残高」「有効ロット集計」「台帳のストリーム」の3クエリのみを発行し、
+    台帳はユーザー・作成日時順に1本のカーソルで読み進める。
+    """
+    from django.db.models import Sum, Count, Q
+    from .models import User, UserPoint, PointTransaction
+    from .ledger_archive_service import ledger_archive_service
+
+    # アーカイブ済みの月をまたぐ取引間はチェーンが途切れる（間の取引がホットテーブルにない）
+    archived_months = ledger_archive_service.archived_months()
+
+    stored = dict(
+        User.objects.filter(pk__in=user_ids).values_list('pk', 'stored_point_balance')
+    )
+    lots = {
+        row['user_id']: row
+        for row in UserPoint.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+            valid_total=Sum('points', filter=Q(is_expired=False)),
+            negative_lots=Count('id', filter=Q(points__lt=0))
+        )
+    }
+
+    issues = []
+    transactions_checked = 0
+    last_balance = {}
+    last_month = {}
+
+    ledger = PointTransaction.objects.filter(user_id__in=user_ids).order_by(
+        'user_id', 'created_at', 'id'
+    ).values_list('id', 'user_id', 'points', 'balance_before', 'balance_after', 'created_at')
+
+    for transaction_id, user_id, points, balance_before, balance_after, created_at in ledger.iterator(chunk_size=5000):
+        transactions_checked += 1
+        month = ledger_archive_service.month_start(created_at).date()
+        previous = last_balance.get(user_id)
+        archived_between = previous is not None and archived_months and any(
+            last_month[user_id] <= archived_month <= month for archived_month in archived_months
+        )
+        if previous is not None and not archived_between and balance_before != previous:
+            issues.append({
+                'type': 'chain_break',
+                'user_id': user_id,
+                'transaction_id': transaction_id,
+                'detail': f'balance_before {balance_before} != previous balance_after {previous}',
+            })
+        if balance_after != balance_before + points:
+            issues.append({
+                'type': 'row_mismatch',
+                'user_id': user_id,
+                'transaction_id': transaction_id,
+                'detail': f'{balance_before} + ({points}) != balance_after {balance_after}',
+            })
+        last_balance[user_id] = balance_after
+        last_month[user_id] = month
+
+    for user_id in user_ids:
+        if user_id not in stored:
+            continue
+        balance = stored[user_id]
+        lot_row = lots.get(user_id, {})
+
+        if lot_row.get('negative_lots'):
+            issues.append({
+                'type': 'negative_lot',
+                'user_id': user_id,
+                'detail': f'{lot_row["negative_lots"]} lots with negative points',
+            })
+        if (lot_row.get('valid_total') or 0) != balance:
+            issues.append({
+                'type': 'lot_sum_mismatch',
+                'user_id': user_id,
+                'detail': f'valid lots {lot_row.get("valid_total") or 0} != stored balance {balance}',
+            })
+        if user_id in last_balance and last_balance[user_id] != balance:
+            issues.append({
+                'type': 'ledger_balance_mismatch',
+                'user_id': user_id,
+                'detail': f'last balance_after {last_balance[user_id]} != stored balance {balance}',
+            })
+
+    return {
+        'users_checked': len(stored),
+        'transactions_checked': transactions_checked,
+        'issues': issues,
+    }
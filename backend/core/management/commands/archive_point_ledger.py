@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import datetime
+from core.ledger_archive_service import ledger_archive_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Move closed months of the point ledger to compressed columnar archive files (run monthly via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be archived without making changes',
+        )
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Archive a single closed month (YYYY-MM)',
+        )
+        parser.add_argument(
+            '--hot-months',
+            type=int,
+            help='Number of recent months kept in the hot table (default: POINT_LEDGER_HOT_MONTHS)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        if options['month']:
+            try:
+                month = timezone.make_aware(datetime.strptime(options['month'], '%Y-%m'))
+            except ValueError:
+                raise CommandError('--month must be in YYYY-MM format')
+            months = [month]
+        else:
+            months = ledger_archive_service.archivable_months(options['hot_months'])
+
+        if not months:
+            self.stdout.write('No closed months to archive')
+            return
+
+        archived_rows = 0
+        for month in months:
+            try:
+                result = ledger_archive_service.archive_month(month, dry_run=dry_run)
+            except ValueError as e:
+                self.stdout.write(self.style.ERROR(str(e)))
+                continue
+            except Exception as e:
+                logger.error(f"Point ledger archive failed for {month:%Y-%m}: {str(e)}")
+                raise CommandError(f'Archive failed for {month:%Y-%m}: {str(e)}')
+
+            if dry_run:
+                self.stdout.write(f'[DRY RUN] {month:%Y-%m}: would archive {result} transactions')
+                archived_rows += result
+            elif result is None:
+                self.stdout.write(f'{month:%Y-%m}: nothing to archive')
+            else:
+                self.stdout.write(
+                    f'{month:%Y-%m}: archived {result.row_count} transactions '
+                    f'to {result.file_path} ({result.file_size} bytes)'
+                )
+                archived_rows += result.row_count
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"[DRY RUN] " if dry_run else ""}'
+                f'{"Would archive" if dry_run else "Archived"} {archived_rows} transactions'
+            )
+        )
@@ -0,0 +1,255 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from core.models import User, Store, ECPointRequest
+from core.duplicate_detection_service import DuplicateDetectionService
+from core.velocity_counter_service import velocity_counter_service
+from core.order_id_index_service import order_id_index_service
+import random
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _per_rule_check(service, user, store, amount, order_id, purchase_date):
+    """集約前の実装（ルールごとに個別クエリを発行）。比較用"""
+    found = []
+    for duplicate in ECPointRequest.objects.filter(order_id=order_id).exclude(status='rejected'):
+        found.append(('order_id', duplicate.pk, 'critical'))
+
+    for duplicate in ECPointRequest.objects.filter(
+        user=user,
+        store=store,
+        purchase_date__range=(
+            purchase_date - timedelta(hours=service.time_window_hours),
+            purchase_date + timedelta(hours=service.time_window_hours)
+        ),
+        purchase_amount__range=(amount - service.amount_tolerance, amount + service.amount_tolerance)
+    ).exclude(status='rejected'):
+        time_diff = abs((duplicate.purchase_date - purchase_date).total_seconds()) / 60
+        found.append(('pattern_match', duplicate.pk, 'high' if time_diff < 60 else 'medium'))
+
+    now = timezone.now()
+    if ECPointRequest.objects.filter(user=user, created_at__gte=now - timedelta(hours=1)).count() >= 5:
+        latest = ECPointRequest.objects.filter(user=user).order_by('-created_at').first()
+        found.append(('suspicious', latest.pk, 'high'))
+    if ECPointRequest.objects.filter(
+        user=user, purchase_amount=amount, created_at__gte=now - timedelta(days=7)
+    ).count() >= 3:
+        latest = ECPointRequest.objects.filter(user=user, purchase_amount=amount).order_by('-created_at').first()
+        found.append(('suspicious', latest.pk, 'medium'))
+    if amount > Decimal('50000'):
+        found.append(('suspicious', None, 'medium'))
+    if ECPointRequest.objects.filter(store=store, created_at__gte=now - timedelta(hours=1)).count() >= 20:
+        latest = ECPointRequest.objects.filter(store=store).order_by('-created_at').first()
+        found.append(('suspicious', latest.pk, 'high'))
+    return found
+
+
+class Command(BaseCommand):
+    help = 'Benchmark EC duplicate detection: queries and latency per request, per-rule vs consolidated'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=100000,
+            help='Number of generated ECPointRequest rows',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=5000,
+            help='Number of generated customers',
+        )
+        parser.add_argument(
+            '--stores',
+            type=int,
+            default=50,
+            help='Number of generated stores',
+        )
+        parser.add_argument(
+            '--checks',
+            type=int,
+            default=200,
+            help='Number of duplicate checks measured per implementation',
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the query plans of the consolidated queries',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the generated dataset after the run',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['users'], options['stores'], options['checks']) < 1:
+            raise CommandError('requests, users, stores and checks must be positive')
+
+        run_id = uuid.uuid4().hex[:8]
+        self.stdout.write(
+            f'Generating {options["requests"]} requests for {options["users"]} users / {options["stores"]} stores'
+        )
+        users, stores = self.build_dataset(run_id, options['requests'], options['users'], options['stores'])
+        service = DuplicateDetectionService()
+        # 一括作成ではシグナルが発火しないため、カウンターと類似検索インデックスを申請データから再構築する
+        velocity_counter_service.rebuild()
+        order_id_index_service.rebuild()
+
+        try:
+            samples = self.build_samples(users, stores, options['checks'])
+
+            before, before_results = self.measure(
+                lambda sample: _per_rule_check(service, *sample), samples
+            )
+            after, after_results = self.measure(
+                lambda sample: [
+                    (duplicate['type'], duplicate['original'].pk if duplicate['original'] else None,
+                     duplicate['severity'])
+                    for duplicate in service.check_for_duplicates(*sample)
+                ],
+                samples
+            )
+
+            self.stdout.write(f'{"implementation":<16}{"queries/check":>15}{"mean ms":>10}{"p95 ms":>10}')
+            for label, stats in (('per-rule', before), ('consolidated', after)):
+                self.stdout.write(
+                    f'{label:<16}{stats["queries"]:>15.2f}{stats["mean_ms"]:>10.2f}{stats["p95_ms"]:>10.2f}'
+                )
+
+            # 注文ID・パターン一致は完全一致、件数ルールはカウンターの按分による境界差のみ許容
+            # （類似注文IDは集約前の実装に存在しないルールのため比較対象外）
+            mismatches = 0
+            velocity_differences = 0
+            for old, new in zip(before_results, after_results):
+                new = [item for item in new if item[0] != 'similar_order_id']
+                if sorted(old, key=str) == sorted(new, key=str):
+                    continue
+                exact_old = sorted((item for item in old if item[0] != 'suspicious'), key=str)
+                exact_new = sorted((item for item in new if item[0] != 'suspicious'), key=str)
+                if exact_old != exact_new:
+                    mismatches += 1
+                else:
+                    velocity_differences += 1
+            if velocity_differences:
+                self.stdout.write(self.style.WARNING(
+                    f'{velocity_differences} checks differ only in window-boundary velocity rules'
+                ))
+            if options['explain']:
+                self.explain(service, samples[0])
+        finally:
+            if not options['keep']:
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+                Store.objects.filter(pk__in=[store.pk for store in stores]).delete()
+
+        if mismatches:
+            raise CommandError(f'{mismatches} checks returned different signals')
+        self.stdout.write(self.style.SUCCESS('Consolidated detection matches the per-rule checks'))
+
+    def build_dataset(self, run_id, request_count, user_count, store_count):
+        """ユーザー・店舗ごとに偏りのある申請データを一括生成"""
+        Store.objects.bulk_create([
+            Store(
+                name=f'Dup Bench {run_id} {index}',
+                owner_name='Benchmark',
+                email=f'dup-bench-{run_id}-{index}@example.com',
+                phone='000-0000-0000',
+                address='Benchmark'
+            )
+            for index in range(store_count)
+        ])
+        stores = list(Store.objects.filter(name__startswith=f'Dup Bench {run_id} '))
+        User.objects.bulk_create([
+            User(
+                username=f'bench_dup_{run_id}_{index}',
+                email=f'bench_dup_{run_id}_{index}@example.com',
+                member_id=f'DBENCH{run_id}{index:06d}'
+            )
+            for index in range(user_count)
+        ])
+        users = list(User.objects.filter(username__startswith=f'bench_dup_{run_id}_'))
+
+        # 本番と同様に作成日時が主キー順に単調増加するよう、購入日時の昇順で作成する
+        now = timezone.now()
+        amounts = [Decimal(value) for value in (500, 1000, 1980, 3000, 5000, 12800)]
+        # 5%は直近1時間に集中させ、短時間の大量申請ルールも発火させる
+        purchase_dates = sorted(
+            now - timedelta(minutes=random.randint(5, 60) if random.random() < 0.05 else random.randint(60, 60 * 24 * 90))
+            for _ in range(request_count)
+        )
+        for offset in range(0, request_count, 5000):
+            rows = []
+            for index in range(offset, min(offset + 5000, request_count)):
+                amount = random.choice(amounts)
+                rows.append(ECPointRequest(
+                    request_type=random.choice(['webhook', 'receipt']),
+                    user=random.choice(users),
+                    store=stores[min(int(random.expovariate(0.2)), store_count - 1)],
+                    purchase_amount=amount,
+                    order_id=f'BENCH-{run_id}-{index}',
+                    purchase_date=purchase_dates[index],
+                    status=random.choice(['pending', 'approved', 'completed', 'rejected']),
+                    points_to_award=int(amount // 100),
+                    request_hash=f'{run_id}{index:056d}',
+                    ip_address='127.0.0.1',
+                ))
+            created = ECPointRequest.objects.bulk_create(rows)
+            # 作成日時は購入日時の直後とする（auto_now_add を一括で上書き）
+            for row in created:
+                row.created_at = row.purchase_date + timedelta(minutes=5)
+            ECPointRequest.objects.bulk_update(created, ['created_at'], batch_size=1000)
+        return users, stores
+
+    def build_samples(self, users, stores, count):
+        """既存申請の再送（重複あり）と新規申請（重複なし）を半々で混ぜた検査対象"""
+        existing = list(
+            ECPointRequest.objects.filter(user__in=users).order_by('?').select_related('user', 'store')[:count // 2]
+        )
+        samples = [
+            (request.user, request.store, request.purchase_amount, request.order_id, request.purchase_date)
+            for request in existing
+        ]
+        while len(samples) < count:
+            samples.append((
+                random.choice(users), random.choice(stores), Decimal(random.randint(100, 60000)),
+                f'NEW-{uuid.uuid4().hex[:12]}', timezone.now()
+            ))
+        return samples
+
+    def measure(self, check, samples):
+        """検査ごとのクエリ数とレイテンシを計測し、(集計, 各検査の結果) を返す"""
+        timings = []
+        query_count = 0
+        results = []
+        for sample in samples:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                results.append(check(sample))
+                timings.append((time.perf_counter() - started) * 1000)
+            query_count += len(queries)
+        timings.sort()
+        return {
+            'queries': query_count / len(samples),
+            'mean_ms': sum(timings) / len(timings),
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        }, results
+
+    def explain(self, service, sample):
+        """集約後の検査が発行するクエリの実行計画を表示"""
+        with CaptureQueriesContext(connection) as queries:
+            service.check_for_duplicates(*sample)
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                self.stdout.write(f'\n{query["sql"]}')
+                cursor.execute(prefix + query['sql'])
+                for row in cursor.fetchall():
+                    self.stdout.write(f'  {" ".join(str(column) for column in row)}')
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.ledger_benchmark import ledger_benchmark_suite
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark core point ledger operations and fail when a query budget is exceeded'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=ledger_benchmark_suite.default_users,
+            help='Number of generated users',
+        )
+        parser.add_argument(
+            '--lots-per-user',
+            type=int,
+            default=ledger_benchmark_suite.default_lots_per_user,
+            help='Number of point lots generated per user',
+        )
+        parser.add_argument(
+            '--expired-lots',
+            type=int,
+            help='Number of overdue lots for check_expired_points (default: same as --users)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=ledger_benchmark_suite.default_iterations,
+            help='Number of measured runs per operation',
+        )
+        parser.add_argument(
+            '--operation',
+            action='append',
+            choices=sorted(ledger_benchmark_suite.QUERY_BUDGETS),
+            help='Benchmark only this operation (repeatable)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the generated dataset after the run',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['lots_per_user'] < 2 or options['iterations'] < 1:
+            raise CommandError('users and lots-per-user must be at least 2, iterations at least 1')
+
+        self.stdout.write(
+            f'Generating dataset: {options["users"]} users x {options["lots_per_user"]} lots'
+        )
+        dataset = ledger_benchmark_suite.build_dataset(
+            users=options['users'],
+            lots_per_user=options['lots_per_user'],
+            expired_lots=options['expired_lots']
+        )
+
+        try:
+            results = ledger_benchmark_suite.run(
+                dataset, iterations=options['iterations'], operations=options['operation']
+            )
+        finally:
+            if not options['keep']:
+                ledger_benchmark_suite.drop_dataset(dataset)
+
+        self.stdout.write(
+            f'{"operation":<24}{"runs":>6}{"mean ms":>10}{"p95 ms":>10}'
+            f'{"queries":>9}{"budget":>8}{"peak KB":>10}'
+        )
+        for result in results:
+            line = (
+                f'{result["operation"]:<24}{result["count"]:>6}'
+                f'{result["mean_ms"]:>10.2f}{result["p95_ms"]:>10.2f}'
+                f'{result["max_queries"]:>9g}{result["query_budget"]:>8}{result["peak_kb"]:>10.1f}'
+            )
+            self.stdout.write(self.style.ERROR(line) if result['over_budget'] else line)
+
+        over_budget = [result['operation'] for result in results if result['over_budget']]
+        if over_budget:
+            logger.warning(f"Ledger benchmark query budget exceeded: {', '.join(over_budget)}")
+            raise CommandError(f'Query budget exceeded: {", ".join(over_budget)}')
+
+        self.stdout.write(self.style.SUCCESS('All operations within their query budgets'))
@@ -0,0 +1,155 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Store, OrderIdSignature
+from core.order_id_index_service import order_id_index_service
+from core.duplicate_detection_service import DuplicateDetectionService
+import random
+import string
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark fuzzy order-ID lookups against a large generated similarity index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ids',
+            type=int,
+            default=1000000,
+            help='Number of order IDs stored in the index',
+        )
+        parser.add_argument(
+            '--stores',
+            type=int,
+            default=20,
+            help='Number of stores the order IDs are spread over',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=1000,
+            help='Number of measured lookups (half near-duplicates, half new IDs)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the generated stores and signatures after the run',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['ids'], options['stores'], options['lookups']) < 1:
+            raise CommandError('ids, stores and lookups must be positive')
+
+        run_id = uuid.uuid4().hex[:8]
+        Store.objects.bulk_create([
+            Store(
+                name=f'Order Index Bench {run_id} {index}',
+                owner_name='Benchmark',
+                email=f'order-index-{run_id}-{index}@example.com',
+                phone='000-0000-0000',
+                address='Benchmark'
+            )
+            for index in range(options['stores'])
+        ])
+        store_ids = list(
+            Store.objects.filter(name__startswith=f'Order Index Bench {run_id} ').values_list('pk', flat=True)
+        )
+        # 店舗ごとに注文IDの書式を固定（ECサイトごとの採番規則を想定）
+        formats = {store_id: random.choice(['prefixed', 'dated', 'random']) for store_id in store_ids}
+
+        try:
+            stored = self.build_index(store_ids, formats, options['ids'])
+            self.measure_lookups(store_ids, formats, stored, options['lookups'])
+        finally:
+            if not options['keep']:
+                OrderIdSignature.objects.filter(store_id__in=store_ids).delete()
+                Store.objects.filter(pk__in=store_ids).delete()
+
+    @staticmethod
+    def generate_order_id(store_format):
+        if store_format == 'prefixed':
+            return f'AMZ-{random.randint(0, 10 ** 10):010d}'
+        if store_format == 'dated':
+            return f'{random.randint(2024, 2026)}{random.randint(1, 12):02d}{random.randint(1, 28):02d}-{random.randint(0, 10 ** 6):06d}'
+        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+
+    @staticmethod
+    def mutate(order_id):
+        """1文字の置換・挿入・削除で近似重複を作る"""
+        position = random.randrange(len(order_id))
+        character = random.choice(string.ascii_uppercase + string.digits)
+        operation = random.choice(['replace', 'insert', 'delete'])
+        if operation == 'replace':
+            return order_id[:position] + character + order_id[position + 1:]
+        if operation == 'insert':
+            return order_id[:position] + character + order_id[position:]
+        return order_id[:position] + order_id[position + 1:]
+
+    def build_index(self, store_ids, formats, count):
+        """店舗ごとに書式を学習してからシグネチャを一括登録し、近似重複の検索元として一部の (店舗ID, 注文ID) を返す"""
+        self.stdout.write(f'Indexing {count} order IDs across {len(store_ids)} stores')
+        rows = []
+        for _ in range(count):
+            store_id = random.choice(store_ids)
+            rows.append((store_id, self.generate_order_id(formats[store_id]), None))
+
+        started = time.perf_counter()
+        for store_id in store_ids:
+            order_id_index_service.learn_template(store_id, [row[1] for row in rows if row[0] == store_id])
+        for offset in range(0, count, 10000):
+            order_id_index_service.add_many(rows[offset:offset + 10000])
+            if (offset + 10000) % 100000 == 0:
+                self.stdout.write(f'  {offset + 10000} indexed')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Indexed in {elapsed:.1f}s ({count / elapsed:.0f} IDs/s)')
+        return [(store_id, order_id) for store_id, order_id, _ in random.sample(rows, min(count, 10000))]
+
+    def measure_lookups(self, store_ids, formats, stored, lookups):
+        """近似重複（既存IDの1文字違い）と新規IDの検索レイテンシ・候補数・再現率を計測"""
+        detector = DuplicateDetectionService()
+        results = {'near-duplicate': [], 'new': []}
+        found = 0
+
+        for index in range(lookups):
+            if index % 2 == 0:
+                store_id, original = random.choice(stored)
+                probe, kind = self.mutate(original), 'near-duplicate'
+            else:
+                store_id = random.choice(store_ids)
+                original, probe, kind = None, self.generate_order_id(formats[store_id]), 'new'
+
+            started = time.perf_counter()
+            candidates = order_id_index_service.candidates(store_id, probe)
+            elapsed = (time.perf_counter() - started) * 1000
+            results[kind].append((elapsed, len(candidates)))
+
+            if original and (
+                original in candidates
+                or detector.check_order_id_similarity(probe, original) < detector.order_id_similarity_threshold
+            ):
+                found += 1
+
+        self.stdout.write(f'{"lookup":<16}{"runs":>6}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"avg cand.":>11}')
+        for kind, rows in results.items():
+            if not rows:
+                continue
+            timings = sorted(elapsed for elapsed, _ in rows)
+            self.stdout.write(
+                f'{kind:<16}{len(rows):>6}'
+                f'{self.percentile(timings, 50):>9.3f}{self.percentile(timings, 95):>9.3f}'
+                f'{self.percentile(timings, 99):>9.3f}{sum(count for _, count in rows) / len(rows):>11.1f}'
+            )
+        near_duplicates = len(results['near-duplicate'])
+        if near_duplicates:
+            self.stdout.write(self.style.SUCCESS(
+                f'Near-duplicate recall: {found / near_duplicates * 100:.1f}% '
+                f'(originals within the similarity threshold returned as candidates)'
+            ))
+
+    @staticmethod
+    def percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
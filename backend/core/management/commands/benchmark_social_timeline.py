@@ -0,0 +1,172 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.models import User
+from core.social_models import SocialPost, Friendship
+from core.social_timeline_service import social_timeline_service
+import random
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark home feed reads/sec from the fan-out timeline cache versus the SQL feed query'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=100000,
+            help='Number of benchmark users',
+        )
+        parser.add_argument(
+            '--friends',
+            type=int,
+            default=10,
+            help='Friendships created per user (each user ends up with about twice as many friends)',
+        )
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=2,
+            help='Posts created per user',
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=500,
+            help='Number of distinct users reading their feed',
+        )
+        parser.add_argument(
+            '--reads',
+            type=int,
+            default=5000,
+            help='Number of feed page reads per measured path',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Posts per feed page',
+        )
+        parser.add_argument(
+            '--fanout-posts',
+            type=int,
+            default=200,
+            help='Posts created through the normal save path to measure fan-out on write',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark users, friendships and posts after the run',
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if min(users, options['readers'], options['reads'], options['page_size']) < 1:
+            raise CommandError('users, readers, reads and page-size must be positive')
+        if options['friends'] < 0 or options['posts'] < 0 or options['fanout_posts'] < 0:
+            raise CommandError('friends, posts and fanout-posts must not be negative')
+
+        if SocialPost._meta.db_table not in connection.introspection.table_names():
+            raise CommandError('Social tables do not exist in this database')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite plans the feed subqueries differently; run against PostgreSQL for meaningful numbers'
+            ))
+
+        run_id = uuid.uuid4().hex[:8]
+        started = time.monotonic()
+        user_ids = self.setup_fixtures(run_id, users, options['friends'], options['posts'])
+        self.stdout.write(f'Fixtures: {users} users created in {time.monotonic() - started:.1f}s')
+
+        try:
+            readers = [User(id=user_id) for user_id in random.sample(user_ids, min(options['readers'], users))]
+            schedule = [random.choice(readers) for _ in range(options['reads'])]
+            page_size = options['page_size']
+            social_timeline_service.invalidate([reader.id for reader in readers])
+
+            self.report('SQL feed', schedule, lambda viewer: social_timeline_service.database_page(viewer, None, page_size))
+            # 初回の読み込みでタイムラインを作成（キャッシュミス）
+            self.report('Timeline (cold)', readers, lambda viewer: social_timeline_service.feed_page(viewer, None, page_size))
+            self.report('Timeline (warm)', schedule, lambda viewer: social_timeline_service.feed_page(viewer, None, page_size))
+            cursors = {
+                reader.id: social_timeline_service.feed_page(reader, None, page_size)[1] for reader in readers
+            }
+            self.report('Timeline (page 2)', schedule, lambda viewer: social_timeline_service.feed_page(
+                viewer, cursors[viewer.id], page_size
+            ))
+
+            if options['fanout_posts']:
+                authors = random.sample(user_ids, min(options['fanout_posts'], users))
+                latencies = []
+                for author_id in authors:
+                    post_started = time.perf_counter()
+                    SocialPost.objects.create(
+                        author_id=author_id, post_type='text', content=f'Benchmark {run_id}', visibility='friends'
+                    )
+                    latencies.append((time.perf_counter() - post_started) * 1000)
+                self.write_latencies('Post + fan-out', sorted(latencies))
+        finally:
+            social_timeline_service.invalidate(user_ids)
+            if not options['keep']:
+                User.objects.filter(username__startswith=f'bench_feed_{run_id}_').delete()
+
+    def setup_fixtures(self, run_id, user_count, friends_per_user, posts_per_user):
+        """ベンチマーク用のユーザー・フレンド関係（承認済み）・投稿を一括作成（投稿時の配信は行わない）"""
+        User.objects.bulk_create([
+            User(
+                username=f'bench_feed_{run_id}_{index}',
+                email=f'bench_feed_{run_id}_{index}@example.com',
+                member_id=f'BF{run_id}{index:07d}'
+            )
+            for index in range(user_count)
+        ], batch_size=5000)
+        user_ids = list(User.objects.filter(
+            username__startswith=f'bench_feed_{run_id}_'
+        ).order_by('id').values_list('id', flat=True))
+
+        pairs = set()
+        for user_id in user_ids:
+            for friend_id in random.sample(user_ids, min(friends_per_user + 1, user_count)):
+                if friend_id != user_id and (friend_id, user_id) not in pairs:
+                    pairs.add((user_id, friend_id))
+        Friendship.objects.bulk_create([
+            Friendship(from_user_id=from_id, to_user_id=to_id, status='accepted') for from_id, to_id in pairs
+        ], batch_size=5000)
+
+        visibilities = ['public'] * 5 + ['friends'] * 4 + ['private']
+        SocialPost.objects.bulk_create([
+            SocialPost(
+                author_id=user_id, post_type='text', content=f'Benchmark {run_id} #{index}',
+                visibility=random.choice(visibilities)
+            )
+            for user_id in user_ids for index in range(posts_per_user)
+        ], batch_size=5000)
+        return user_ids
+
+    def report(self, label, viewers, read_page):
+        latencies = []
+        started = time.monotonic()
+        for viewer in viewers:
+            read_started = time.perf_counter()
+            read_page(viewer)
+            latencies.append((time.perf_counter() - read_started) * 1000)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{label}: {len(latencies) / elapsed:.1f} reads/s')
+        self.write_latencies(label, sorted(latencies))
+
+    def write_latencies(self, label, latencies):
+        self.stdout.write(
+            f'  {label} latency p50 {self.percentile(latencies, 50):.2f}ms, '
+            f'p95 {self.percentile(latencies, 95):.2f}ms, '
+            f'p99 {self.percentile(latencies, 99):.2f}ms'
+        )
+
+    def percentile(self, values, percent):
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
@@ -0,0 +1,169 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from concurrent.futures import ThreadPoolExecutor
+from core.models import User, Store
+from core.point_service import point_service
+import random
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Stress-benchmark concurrent store payments and report payments/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of parallel payment workers',
+        )
+        parser.add_argument(
+            '--payments',
+            type=int,
+            default=2000,
+            help='Total number of payments to process',
+        )
+        parser.add_argument(
+            '--customers',
+            type=int,
+            default=50,
+            help='Number of benchmark customers (fewer customers = more lock contention)',
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=10,
+            help='Points consumed per payment',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark store and customers after the run',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        payments = options['payments']
+        points = options['points']
+
+        if workers < 1 or payments < 1 or options['customers'] < 1 or points < 1:
+            raise CommandError('workers, payments, customers and points must be positive')
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite serializes writers and ignores row locks; '
+                'run against PostgreSQL for meaningful numbers'
+            ))
+
+        run_id = uuid.uuid4().hex[:8]
+        store, customers = self.setup_fixtures(run_id, options['customers'], payments, points)
+
+        try:
+            # 顧客をランダムに割り当て、同一顧客への同時決済（ロック競合）を発生させる
+            targets = [random.choice(customers) for _ in range(payments)]
+            chunks = [targets[index::workers] for index in range(workers)]
+
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                worker_results = list(executor.map(
+                    lambda chunk: self.run_worker(chunk, store, points), chunks
+                ))
+            elapsed = time.monotonic() - started
+
+            latencies = sorted(latency for result in worker_results for latency in result['latencies'])
+            failed = sum(result['failed'] for result in worker_results)
+            succeeded = len(latencies)
+
+            self.stdout.write(
+                f'Workers: {workers}, customers: {len(customers)}, payments: {payments}'
+            )
+            self.stdout.write(
+                f'Succeeded: {succeeded}, failed: {failed}, elapsed: {elapsed:.2f}s'
+            )
+            if succeeded:
+                self.stdout.write(
+                    f'Throughput: {succeeded / elapsed:.1f} payments/s, '
+                    f'latency p50 {self.percentile(latencies, 50):.1f}ms, '
+                    f'p95 {self.percentile(latencies, 95):.1f}ms, '
+                    f'p99 {self.percentile(latencies, 99):.1f}ms'
+                )
+
+            self.verify_balances(customers)
+        finally:
+            if not options['keep']:
+                User.objects.filter(pk__in=[customer.pk for customer in customers]).delete()
+                store.delete()
+
+    def setup_fixtures(self, run_id, customer_count, payments, points):
+        """ベンチマーク用の店舗と十分な残高を持つ顧客を作成"""
+        store = Store.objects.create(
+            name=f'Benchmark Store {run_id}',
+            owner_name='Benchmark',
+            email=f'bench-{run_id}@example.com',
+            phone='000-0000-0000',
+            address='Benchmark'
+        )
+        User.objects.bulk_create([
+            User(
+                username=f'bench_pay_{run_id}_{index}',
+                email=f'bench_pay_{run_id}_{index}@example.com',
+                member_id=f'BENCH{run_id}{index:05d}'
+            )
+            for index in range(customer_count)
+        ])
+        customers = list(User.objects.filter(username__startswith=f'bench_pay_{run_id}_'))
+
+        # 全決済が1人に集中しても残高不足にならない量を付与
+        chunk_size = point_service.max_bulk_grant_rows
+        for start in range(0, len(customers), chunk_size):
+            point_service.grant_points_bulk(
+                [{'user_id': customer.pk, 'points': payments * points} for customer in customers[start:start + chunk_size]],
+                description='ベンチマーク用ポイント'
+            )
+        return store, customers
+
+    def run_worker(self, customers, store, points):
+        """1ワーカー分の決済を順次実行し、成功分のレイテンシ(ms)と失敗数を返す"""
+        latencies = []
+        failed = 0
+        try:
+            for customer in customers:
+                started = time.monotonic()
+                try:
+                    point_service.process_store_payment(
+                        customer=customer,
+                        store=store,
+                        points=points,
+                        description='ベンチマーク決済'
+                    )
+                    latencies.append((time.monotonic() - started) * 1000)
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Benchmark payment failed: {str(e)}")
+        finally:
+            connections.close_all()
+        return {'latencies': latencies, 'failed': failed}
+
+    def verify_balances(self, customers):
+        """保存済み残高が台帳（有効ロット合計）と一致することを確認"""
+        mismatched = 0
+        for customer in User.objects.filter(pk__in=[customer.pk for customer in customers]):
+            if customer.point_balance != customer.calculate_point_balance():
+                mismatched += 1
+                self.stdout.write(self.style.ERROR(
+                    f'Balance mismatch for {customer.username}: '
+                    f'stored {customer.point_balance}, ledger {customer.calculate_point_balance()}'
+                ))
+        if mismatched:
+            self.stdout.write(self.style.ERROR(f'{mismatched} customers have inconsistent balances'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All balances consistent with the point ledger'))
+
+    @staticmethod
+    def percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
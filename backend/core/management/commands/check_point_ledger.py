@@ -0,0 +1,129 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import multiprocessing
+import os
+
+from core.models import User, PointTransaction, LedgerCheckRun
+from core.ledger_check_worker import init_worker, check_user_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Verify point ledger chains, lots and stored balances in parallel (run nightly via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (1 = run in this process)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users per worker task',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Check every user instead of users changed since the last completed run',
+        )
+        parser.add_argument(
+            '--max-report',
+            type=int,
+            default=100,
+            help='Maximum number of issues printed',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        batch_size = options['batch_size']
+
+        users = User.objects.all()
+        last_run = LedgerCheckRun.objects.filter(status='completed').order_by('-started_at').first()
+        incremental = last_run is not None and not options['full']
+        if incremental:
+            # 前回チェック開始以降に台帳へ書き込みのあったユーザーのみ
+            users = users.filter(pk__in=PointTransaction.objects.filter(
+                created_at__gte=last_run.started_at
+            ).values('user_id'))
+            self.stdout.write(f'Incremental check since {last_run.started_at.isoformat()}')
+
+        run = LedgerCheckRun.objects.create(incremental=incremental)
+        reported = 0
+
+        try:
+            for result in self.run_batches(users, batch_size, workers):
+                run.users_checked += result['users_checked']
+                run.transactions_checked += result['transactions_checked']
+                run.issues_found += len(result['issues'])
+
+                for issue in result['issues']:
+                    if reported < options['max_report']:
+                        self.stdout.write(self.style.ERROR(
+                            f'[{issue["type"]}] user {issue["user_id"]}'
+                            f'{" tx " + str(issue["transaction_id"]) if "transaction_id" in issue else ""}: '
+                            f'{issue["detail"]}'
+                        ))
+                        reported += 1
+
+            run.status = 'completed'
+        except Exception as e:
+            run.status = 'failed'
+            logger.error(f"Point ledger check failed: {str(e)}")
+            raise
+        finally:
+            run.finished_at = timezone.now()
+            run.save()
+
+        elapsed = (run.finished_at - run.started_at).total_seconds()
+        summary = (
+            f'Checked {run.users_checked} users / {run.transactions_checked} transactions '
+            f'in {elapsed:.1f}s: {run.issues_found} issues'
+        )
+        if run.issues_found:
+            logger.warning(f"Point ledger check found {run.issues_found} issues (run {run.id})")
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+    def iter_user_batches(self, users, batch_size):
+        """主キー順のキーセットページングでユーザーIDのバッチを生成"""
+        last_id = 0
+        while True:
+            batch = list(
+                users.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                return
+            last_id = batch[-1]
+            yield batch
+
+    def run_batches(self, users, batch_size, workers):
+        """バッチをワーカープロセスへ分配し、完了順に結果を返す（投入数は上限付き）"""
+        batches = self.iter_user_batches(users, batch_size)
+
+        if workers == 1:
+            for batch in batches:
+                yield check_user_batch(batch)
+            return
+
+        # forkすると親のDB接続を子が共有してしまうため、spawnで独立した接続を持たせる
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        ) as executor:
+            pending = set()
+            for batch in batches:
+                pending.add(executor.submit(check_user_batch, batch))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in pending:
+                yield future.result()
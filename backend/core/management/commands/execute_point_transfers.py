@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import PointTransfer
+from core.point_service import point_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Execute pending point transfers in batches (run every minute via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many transfers are pending without executing them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of transfers executed per batch',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Maximum number of transfers processed in this run',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+            pending = PointTransfer.objects.filter(status='pending').count()
+            self.stdout.write(self.style.SUCCESS(f'[DRY RUN] {pending} pending transfers'))
+            return
+
+        try:
+            totals = point_service.execute_pending_transfers_in_batches(
+                batch_size=options['batch_size'],
+                limit=options['limit'],
+                progress_callback=self.report_progress
+            )
+        except Exception as e:
+            logger.error(f"Pending point transfer execution failed: {str(e)}")
+            raise CommandError(f'Transfer execution failed: {str(e)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Executed {totals["transfers"]} transfers in {totals["batches"]} batches: '
+            f'{totals["completed"]} completed, {totals["failed"]} failed ({totals["per_second"]} transfers/s)'
+        ))
+
+    def report_progress(self, batch):
+        """バッチごとの処理件数とスループットを表示"""
+        self.stdout.write(
+            f'  batch up to transfer {batch["last_id"]}: {batch["completed"]} completed, '
+            f'{batch["failed"]} failed in {batch["elapsed"] * 1000:.0f}ms ({batch["per_second"]} transfers/s)'
+        )
@@ -15,6 +15,17 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making changes',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of users processed per chunk',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Start a new run instead of resuming an interrupted one',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -24,7 +35,16 @@ class Command(BaseCommand):
         
         try:
             if not dry_run:
-                expired_count = point_service.check_expired_points()
+                run = point_service.expire_points_in_batches(
+                    chunk_size=options['chunk_size'],
+                    resume=not options['restart'],
+                    progress_callback=self.report_progress
+                )
+                expired_count = run.lots_expired
+                self.stdout.write(
+                    f'Expired {run.points_expired}pt for {run.users_processed} users '
+                    f'in {run.chunks_processed} chunks ({run.lots_per_second} lots/s)'
+                )
             else:
                 # DRY RUN: 期限切れ予定のポイントを表示
                 from core.models import UserPoint
@@ -50,4 +70,11 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Error processing expired points: {str(e)}')
             )
             logger.error(f"Expired points check failed: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def report_progress(self, run):
+        """チャンクごとの進捗を表示"""
+        self.stdout.write(
+            f'  chunk {run.chunks_processed}: {run.lots_expired} lots / '
+            f'{run.users_processed} users (last user {run.last_user_id}, {run.lots_per_second} lots/s)'
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core.balance_snapshot_service import balance_snapshot_service
+
+
+class Command(BaseCommand):
+    help = "Reconstruct a user's point balance or a store's deposit balance as of a given time"
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument(
+            '--user-id',
+            type=int,
+            help='User whose point balance is reconstructed',
+        )
+        target.add_argument(
+            '--store-id',
+            type=int,
+            help='Store whose deposit balance is reconstructed',
+        )
+        parser.add_argument(
+            '--at',
+            type=str,
+            required=True,
+            help='Point in time (ISO 8601, e.g. 2025-03-31T23:59:59+09:00)',
+        )
+
+    def handle(self, *args, **options):
+        at = parse_datetime(options['at'])
+        if at is None:
+            raise CommandError('--at must be an ISO 8601 datetime')
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        if options['user_id']:
+            result = balance_snapshot_service.user_balance_at(options['user_id'], at)
+            self.stdout.write(
+                f'User {result["user_id"]} balance at {at.isoformat()}: {result["balance"]}pt '
+                f'(lifetime {result["lifetime_points"]}pt)'
+            )
+            self.stdout.write(
+                f'  snapshot: {result["snapshot_taken_at"].isoformat() if result["snapshot_taken_at"] else "none"}, '
+                f'ledger tail: {result["tail_transactions"]} transactions'
+            )
+        else:
+            result = balance_snapshot_service.store_balance_at(options['store_id'], at)
+            self.stdout.write(
+                f'Store {result["store_id"]} deposit balance at {at.isoformat()}: {result["deposit_balance"]}円 '
+                f'(current {result["current_deposit_balance"]}円)'
+            )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+import time
+
+from core.receipt_image_service import receipt_image_service
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Create store-approval thumbnails for uploaded receipt images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=receipt_image_service.batch_size,
+            help='Number of images processed per batch',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when no images are pending',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once all pending images have been processed (for cron) instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('batch-size must be positive')
+
+        totals = {'completed': 0, 'retried': 0, 'failed': 0}
+        while True:
+            drained = receipt_image_service.drain(options['batch_size'])
+            for key, value in drained.items():
+                totals[key] += value
+            if any(drained.values()):
+                logger.info(f"Receipt thumbnails: {drained}")
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed receipt images: {totals["completed"]} thumbnails created, '
+            f'{totals["retried"]} retried, {totals["failed"]} failed'
+        ))
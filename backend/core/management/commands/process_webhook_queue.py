@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+
+from core.webhook_ingest_service import webhook_ingest_service
+from core.webhook_queue_worker import run_partition
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Drain the asynchronous EC webhook queue with a pool of workers (one store partition per worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes; stores are partitioned by id so each store is handled by one worker',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=webhook_ingest_service.batch_size,
+            help='Number of queue items claimed per batch',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue has been drained (for cron) instead of polling',
+        )
+        parser.add_argument(
+            '--metrics',
+            action='store_true',
+            help='Print queue depth metrics and exit',
+        )
+        parser.add_argument(
+            '--requeue-dead-letters',
+            action='store_true',
+            help='Move dead letters back to the end of the queue and exit',
+        )
+        parser.add_argument(
+            '--store',
+            type=int,
+            help='Limit --requeue-dead-letters to one store id',
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            for key, value in webhook_ingest_service.queue_metrics().items():
+                self.stdout.write(f'{key}: {value}')
+            return
+
+        if options['requeue_dead_letters']:
+            requeued = webhook_ingest_service.requeue_dead_letters(store_id=options['store'])
+            self.stdout.write(self.style.SUCCESS(f'Requeued {requeued} dead letters'))
+            return
+
+        workers = options['workers']
+        if workers < 1 or options['batch_size'] < 1:
+            raise CommandError('workers and batch-size must be positive')
+
+        args = (options['batch_size'], options['poll_interval'], options['once'])
+        if workers == 1:
+            results = [run_partition(0, 1, *args)]
+        else:
+            # forkすると親のDB接続を子が共有してしまうため、spawnで独立した接続を持たせる
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                futures = [executor.submit(run_partition, partition, workers, *args) for partition in range(workers)]
+                results = [future.result() for future in futures]
+
+        purged = webhook_ingest_service.purge_completed()
+        totals = {key: sum(result[key] for result in results) for key in results[0]}
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed webhook queue: {totals["completed"]} completed, {totals["retried"]} retried, '
+            f'{totals["dead_lettered"]} dead-lettered, {purged} completed items purged'
+        ))
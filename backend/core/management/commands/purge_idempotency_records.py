@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.idempotency_service import idempotency_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency records older than the retention period (run daily via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Retention period in days (defaults to IDEMPOTENCY_RETENTION_DAYS, 30)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many records would be deleted without making changes',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        days = options['days']
+        if days is not None and days < 1:
+            raise CommandError('days must be positive')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        try:
+            count = idempotency_service.purge_expired(retention_days=days, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Idempotency record purge failed: {str(e)}")
+            self.stdout.write(self.style.ERROR(f'Error during purge: {str(e)}'))
+            raise
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"[DRY RUN] " if dry_run else ""}'
+                f'{"Would delete" if dry_run else "Deleted"} {count} idempotency records'
+            )
+        )
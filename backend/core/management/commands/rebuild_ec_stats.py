@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from core.ec_stats_service import ec_stats_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the EC request daily statistics rollup from EC point requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the requests that would be aggregated without making changes',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Only rebuild the most recent N days (default: full history)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        try:
+            rebuilt = ec_stats_service.rebuild(days=options['days'], dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"EC stats rebuild failed: {str(e)}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[DRY RUN] Would aggregate" if dry_run else "Aggregated"} {rebuilt} EC requests'
+        ))
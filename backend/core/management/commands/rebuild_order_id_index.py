@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from core.order_id_index_service import order_id_index_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fuzzy order-ID similarity index from recent EC point requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the requests that would be indexed without making changes',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Index requests created within this many days (default: ORDER_ID_INDEX_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        try:
+            indexed = order_id_index_service.rebuild(
+                days=options['days'],
+                dry_run=dry_run,
+                progress_callback=lambda count: self.stdout.write(f'  indexed {count} requests')
+            )
+        except Exception as e:
+            logger.error(f"Order ID index rebuild failed: {str(e)}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[DRY RUN] Would index" if dry_run else "Indexed"} {indexed} order IDs'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from core.velocity_counter_service import velocity_counter_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild EC fraud-rule velocity counters from recent requests (run after a cache flush or deploy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the buckets that would be written without touching the cache',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        try:
+            buckets = velocity_counter_service.rebuild(dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Velocity counter rebuild failed: {str(e)}")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[DRY RUN] Would rebuild" if dry_run else "Rebuilt"} {buckets} velocity counter buckets'
+        ))
@@ -0,0 +1,133 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery, IntegerField, Value, F
+from django.db.models.functions import Coalesce
+from core.models import User, UserPoint, PointTransaction
+from core.point_service import point_service
+from core.ledger_archive_service import ledger_archive_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _valid_points_subquery():
+    """有効なUserPointの合計（ユーザー単位）"""
+    return Coalesce(Subquery(
+        UserPoint.objects.filter(
+            user=OuterRef('pk'),
+            is_expired=False
+        ).order_by().values('user').annotate(total=Sum('points')).values('total')[:1],
+        output_field=IntegerField()
+    ), Value(0))
+
+
+def _lifetime_points_subquery():
+    """付与・ボーナス取引の累計（ユーザー単位、ホットテーブルのみ。アーカイブ分は呼び出し側で加算）"""
+    return Coalesce(Subquery(
+        PointTransaction.objects.filter(
+            user=OuterRef('pk'),
+            transaction_type__in=['grant', 'bonus'],
+            points__gt=0
+        ).order_by().values('user').annotate(total=Sum('points')).values('total')[:1],
+        output_field=IntegerField()
+    ), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Detect and repair drift between stored point balances and the point ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without repairing it',
+        )
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            help='Only check the given user',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users checked per query',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        users = User.objects.all()
+        if options['user_id']:
+            users = users.filter(pk=options['user_id'])
+
+        # アーカイブ済み取引は PointTransaction から削除されているため、累計獲得ポイントに加算する
+        archived_lifetime = ledger_archive_service.earned_totals()
+
+        drifted = users.annotate(
+            ledger_balance=_valid_points_subquery(),
+            ledger_lifetime=_lifetime_points_subquery()
+        )
+        if not archived_lifetime:
+            # 保存値と台帳の再集計値が一致しないユーザーのみをSQL側で抽出
+            drifted = drifted.exclude(
+                stored_point_balance=F('ledger_balance'),
+                lifetime_points_earned=F('ledger_lifetime')
+            )
+
+        drift_count = 0
+        last_id = 0
+
+        while True:
+            # 主キー順にキーセットページング
+            batch = list(
+                drifted.filter(pk__gt=last_id).order_by('pk').values(
+                    'pk', 'username', 'stored_point_balance', 'lifetime_points_earned',
+                    'ledger_balance', 'ledger_lifetime'
+                )[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['pk']
+
+            for row in batch:
+                row['ledger_lifetime'] += archived_lifetime.get(row['pk'], 0)
+                if (row['stored_point_balance'] == row['ledger_balance']
+                        and row['lifetime_points_earned'] == row['ledger_lifetime']):
+                    continue
+
+                drift_count += 1
+                self.stdout.write(
+                    f'{"[DRY RUN] " if dry_run else ""}Drift for {row["username"]}: '
+                    f'balance {row["stored_point_balance"]} -> {row["ledger_balance"]}, '
+                    f'lifetime {row["lifetime_points_earned"]} -> {row["ledger_lifetime"]}'
+                )
+
+                if not dry_run:
+                    self.repair_user(row['pk'], archived_lifetime.get(row['pk'], 0))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"[DRY RUN] " if dry_run else ""}'
+                f'{"Found" if dry_run else "Repaired"} {drift_count} drifted point balances'
+            )
+        )
+
+    def repair_user(self, user_id, archived_lifetime=0):
+        """行ロック下で台帳から再集計して保存済み残高を修復（archived_lifetime はアーカイブ分の累計獲得ポイント）"""
+        with transaction.atomic():
+            User.objects.select_for_update().filter(pk=user_id).first()
+            ledger = User.objects.filter(pk=user_id).annotate(
+                ledger_balance=_valid_points_subquery(),
+                ledger_lifetime=_lifetime_points_subquery()
+            ).values('ledger_balance', 'ledger_lifetime').get()
+            User.objects.filter(pk=user_id).update(
+                stored_point_balance=ledger['ledger_balance'],
+                lifetime_points_earned=ledger['ledger_lifetime'] + archived_lifetime
+            )
+            point_service.invalidate_point_summary(user_id)
+        logger.info(f"Point balance repaired for user {user_id}: {ledger}")
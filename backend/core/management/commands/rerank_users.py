@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from core.rank_service import rank_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer ranks from lifetime earned points in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        # 最新のランク設定で判定する
+        rank_service.invalidate()
+        results = rank_service.bulk_rerank(dry_run=dry_run)
+
+        for rank_name, count in results.items():
+            self.stdout.write(f'{"[DRY RUN] " if dry_run else ""}{rank_name}: {count} users')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"[DRY RUN] " if dry_run else ""}Updated ranks for {sum(results.values())} users'
+            )
+        )
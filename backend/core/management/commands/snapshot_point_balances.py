@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from core.balance_snapshot_service import balance_snapshot_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Write point balance snapshots for users with ledger activity since the last run (run daily via cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many snapshots would be written without making changes',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
+
+        try:
+            count = balance_snapshot_service.take_snapshots(dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Point balance snapshot failed: {str(e)}")
+            self.stdout.write(self.style.ERROR(f'Error during snapshot: {str(e)}'))
+            raise
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{"[DRY RUN] " if dry_run else ""}'
+                f'{"Would write" if dry_run else "Wrote"} {count} point balance snapshots'
+            )
+        )
@@ -1,8 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
-from core.models import User, UserPoint, PointTransaction
+from core.models import User, UserPoint
 import logging
 
 logger = logging.getLogger(__name__)
@@ -63,22 +62,11 @@ class Command(BaseCommand):
                 # 既存のUserPointがない場合のみ作成
                 if not user.user_points.exists():
                     if not dry_run:
-                        # 6ヶ月後の有効期限でUserPointを作成
-                        expiry_date = timezone.now() + timedelta(days=180)
-                        UserPoint.objects.create(
-                            user=user,
-                            points=points,
-                            expiry_date=expiry_date
-                        )
-                        
-                        # 取引履歴も作成
-                        PointTransaction.objects.create(
-                            user=user,
-                            points=points,
-                            transaction_type='grant',
-                            description=f'システム移行: {points}pt',
-                            balance_before=0,
-                            balance_after=points
+                        # 6ヶ月後の有効期限でUserPointと取引履歴を作成（保存済み残高も同時に更新）
+                        user.record_point_grant(
+                            points,
+                            expiry_months=6,
+                            description=f'システム移行: {points}pt'
                         )
                     
                     migrated_count += 1
@@ -91,21 +79,17 @@ class Command(BaseCommand):
         self.stdout.write(f'{"[DRY RUN] " if dry_run else ""}Migrated points for {migrated_count} users')
 
     def sync_user_ranks(self, dry_run=False):
-        """ユーザーランクの同期"""
+        """ユーザーランクの同期（累計獲得ポイントから一括再計算）"""
         self.stdout.write('Syncing user ranks...')
         
-        updated_count = 0
-        for user in User.objects.filter(role='customer'):
-            old_rank = user.rank
-            
-            if not dry_run:
-                user.check_and_update_rank()
-                user.refresh_from_db()
-            
-            if user.rank != old_rank:
-                updated_count += 1
-                self.stdout.write(f'{"[DRY RUN] " if dry_run else ""}Updated rank for {user.username}: {old_rank} -> {user.rank}')
+        from core.rank_service import rank_service
+        results = rank_service.bulk_rerank(dry_run=dry_run)
+        
+        for rank_name, count in results.items():
+            if count:
+                self.stdout.write(f'{"[DRY RUN] " if dry_run else ""}{rank_name}: {count} users')
         
+        updated_count = sum(results.values())
         self.stdout.write(f'{"[DRY RUN] " if dry_run else ""}Updated ranks for {updated_count} users')
 
     def cleanup_expired_points(self, dry_run=False):
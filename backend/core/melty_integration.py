@@ -327,7 +327,9 @@ class MeltyUserService:
         if not rank_upgraded:
             logger.info(f"User {user.username} melty link completed - no rank upgrade needed (current: {user.rank})")
         
-        user.save()
+        user.save(update_fields=[
+            'melty_user_id', 'melty_email', 'melty_connected_at', 'is_melty_linked', 'melty_profile_data', 'rank'
+        ])
         return user
     
     def grant_melty_welcome_bonus(self, user: User, melty_membership_type: str = 'free'):
@@ -371,7 +373,7 @@ class MeltyUserService:
             if melty_email and melty_email != user.melty_email:
                 user.melty_email = melty_email
             
-            user.save()
+            user.save(update_fields=['melty_profile_data', 'melty_email'])
             logger.info(f"Synced melty profile for user {user.username}")
             return True
             
@@ -387,7 +389,9 @@ class MeltyUserService:
             user.melty_connected_at = None
             user.is_melty_linked = False
             user.melty_profile_data = {}
-            user.save()
+            user.save(update_fields=[
+                'melty_user_id', 'melty_email', 'melty_connected_at', 'is_melty_linked', 'melty_profile_data'
+            ])
             
             logger.info(f"Unlinked melty account for user {user.username}")
             return True
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_point_balances(apps, schema_editor):
+    """既存ユーザーの保存済み残高・累計獲得ポイントを台帳から初期化"""
+    User = apps.get_model('core', 'User')
+    UserPoint = apps.get_model('core', 'UserPoint')
+    PointTransaction = apps.get_model('core', 'PointTransaction')
+
+    valid_points = UserPoint.objects.filter(
+        user=OuterRef('pk'), is_expired=False
+    ).order_by().values('user').annotate(total=Sum('points')).values('total')[:1]
+
+    lifetime_points = PointTransaction.objects.filter(
+        user=OuterRef('pk'), transaction_type__in=['grant', 'bonus'], points__gt=0
+    ).order_by().values('user').annotate(total=Sum('points')).values('total')[:1]
+
+    User.objects.update(
+        stored_point_balance=Coalesce(Subquery(valid_points, output_field=IntegerField()), Value(0)),
+        lifetime_points_earned=Coalesce(Subquery(lifetime_points, output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_user_email_verification_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='stored_point_balance',
+            field=models.IntegerField(default=0, verbose_name='ポイント残高（保存値）'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='lifetime_points_earned',
+            field=models.IntegerField(default=0, verbose_name='累計獲得ポイント'),
+        ),
+        migrations.RunPython(
+            code=backfill_point_balances,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
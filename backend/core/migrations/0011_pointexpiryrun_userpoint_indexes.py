@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_stored_point_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointExpiryRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField(verbose_name='失効基準日時')),
+                ('status', models.CharField(choices=[('running', '実行中'), ('completed', '完了'), ('failed', '失敗')], default='running', max_length=20, verbose_name='状態')),
+                ('last_user_id', models.BigIntegerField(default=0, verbose_name='処理済み最終ユーザーID')),
+                ('chunks_processed', models.IntegerField(default=0, verbose_name='処理チャンク数')),
+                ('users_processed', models.IntegerField(default=0, verbose_name='処理ユーザー数')),
+                ('lots_expired', models.IntegerField(default=0, verbose_name='失効ロット数')),
+                ('points_expired', models.BigIntegerField(default=0, verbose_name='失効ポイント数')),
+                ('error_message', models.TextField(blank=True, verbose_name='エラー内容')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+            ],
+            options={
+                'verbose_name': 'ポイント失効処理',
+                'verbose_name_plural': 'ポイント失効処理',
+                'db_table': 'point_expiry_runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userpoint',
+            index=models.Index(fields=['user', 'is_expired', 'expiry_date'], name='core_userpo_user_id_c4a8bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpoint',
+            index=models.Index(fields=['is_expired', 'expiry_date'], name='core_userpo_is_expi_2502d8_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_pointexpiryrun_userpoint_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('point_grant', 'ポイント付与'), ('store_payment', '店舗決済'), ('ec_webhook', 'EC Webhook'), ('ec_approval', 'EC申請承認')], max_length=30, verbose_name='処理種別')),
+                ('actor_key', models.CharField(max_length=100, verbose_name='実行主体')),
+                ('reference_id', models.CharField(max_length=100, verbose_name='参照ID')),
+                ('response_status', models.IntegerField(blank=True, null=True, verbose_name='レスポンスステータス')),
+                ('response_body', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='レスポンス内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': '冪等キー記録',
+                'verbose_name_plural': '冪等キー記録',
+                'db_table': 'idempotency_records',
+                'indexes': [models.Index(fields=['created_at'], name='idempotency_created_3fb3ea_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'actor_key', 'reference_id'), name='unique_idempotency_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointLedgerArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='対象月')),
+                ('file_path', models.CharField(max_length=500, verbose_name='アーカイブファイル')),
+                ('row_count', models.IntegerField(default=0, verbose_name='取引件数')),
+                ('points_total', models.BigIntegerField(default=0, verbose_name='ポイント合計')),
+                ('first_transaction_id', models.BigIntegerField(blank=True, null=True, verbose_name='最小取引ID')),
+                ('last_transaction_id', models.BigIntegerField(blank=True, null=True, verbose_name='最大取引ID')),
+                ('file_size', models.BigIntegerField(default=0, verbose_name='ファイルサイズ')),
+                ('checksum', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': 'ポイント取引アーカイブ',
+                'verbose_name_plural': 'ポイント取引アーカイブ',
+                'db_table': 'point_ledger_archives',
+                'ordering': ['-month'],
+            },
+        ),
+    ]
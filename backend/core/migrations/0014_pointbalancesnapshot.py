@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_pointledgerarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='基準日時')),
+                ('balance', models.IntegerField(verbose_name='ポイント残高')),
+                ('lifetime_points', models.IntegerField(default=0, verbose_name='累計獲得ポイント')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+            ],
+            options={
+                'verbose_name': 'ポイント残高スナップショット',
+                'verbose_name_plural': 'ポイント残高スナップショット',
+                'db_table': 'point_balance_snapshots',
+                'indexes': [models.Index(fields=['taken_at'], name='point_balan_taken_a_9550a6_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'taken_at'), name='unique_user_balance_snapshot')],
+            },
+        ),
+    ]
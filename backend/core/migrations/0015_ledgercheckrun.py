@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_pointbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('incremental', models.BooleanField(default=False, verbose_name='差分チェック')),
+                ('status', models.CharField(choices=[('running', '実行中'), ('completed', '完了'), ('failed', '失敗')], default='running', max_length=20, verbose_name='状態')),
+                ('users_checked', models.IntegerField(default=0, verbose_name='チェックユーザー数')),
+                ('transactions_checked', models.BigIntegerField(default=0, verbose_name='チェック取引数')),
+                ('issues_found', models.IntegerField(default=0, verbose_name='検出件数')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+            ],
+            options={
+                'verbose_name': '台帳整合性チェック',
+                'verbose_name_plural': '台帳整合性チェック',
+                'db_table': 'ledger_check_runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
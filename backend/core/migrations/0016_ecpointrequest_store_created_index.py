@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_ledgercheckrun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ecpointrequest',
+            index=models.Index(fields=['store', 'created_at'], name='ec_point_re_store_i_943c55_idx'),
+        ),
+    ]
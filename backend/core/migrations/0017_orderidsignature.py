@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_ecpointrequest_store_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='duplicatedetection',
+            name='detection_type',
+            field=models.CharField(choices=[('order_id', '注文ID重複'), ('pattern_match', 'パターンマッチ'), ('similar_order_id', '類似注文ID'), ('suspicious', '不審な活動')], max_length=20, verbose_name='検知種別'),
+        ),
+        migrations.CreateModel(
+            name='OrderIdTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_shingles', models.JSONField(default=list, verbose_name='除外n-gram')),
+                ('sample_size', models.IntegerField(default=0, verbose_name='学習件数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='order_id_template', to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '注文ID書式',
+                'verbose_name_plural': '注文ID書式',
+                'db_table': 'order_id_templates',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderIdSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.CharField(max_length=100, verbose_name='注文ID')),
+                ('band_0', models.BigIntegerField(verbose_name='バンド0')),
+                ('band_1', models.BigIntegerField(verbose_name='バンド1')),
+                ('band_2', models.BigIntegerField(verbose_name='バンド2')),
+                ('band_3', models.BigIntegerField(verbose_name='バンド3')),
+                ('band_4', models.BigIntegerField(verbose_name='バンド4')),
+                ('band_5', models.BigIntegerField(verbose_name='バンド5')),
+                ('band_6', models.BigIntegerField(verbose_name='バンド6')),
+                ('band_7', models.BigIntegerField(verbose_name='バンド7')),
+                ('band_8', models.BigIntegerField(verbose_name='バンド8')),
+                ('band_9', models.BigIntegerField(verbose_name='バンド9')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='申請日時')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '注文IDシグネチャ',
+                'verbose_name_plural': '注文IDシグネチャ',
+                'db_table': 'order_id_signatures',
+                'indexes': [models.Index(fields=['store', 'band_0'], name='order_id_si_store_i_318582_idx'), models.Index(fields=['store', 'band_1'], name='order_id_si_store_i_b3e91c_idx'), models.Index(fields=['store', 'band_2'], name='order_id_si_store_i_d75d39_idx'), models.Index(fields=['store', 'band_3'], name='order_id_si_store_i_c9eae5_idx'), models.Index(fields=['store', 'band_4'], name='order_id_si_store_i_f52997_idx'), models.Index(fields=['store', 'band_5'], name='order_id_si_store_i_f47892_idx'), models.Index(fields=['store', 'band_6'], name='order_id_si_store_i_70720b_idx'), models.Index(fields=['store', 'band_7'], name='order_id_si_store_i_79a9d8_idx'), models.Index(fields=['store', 'band_8'], name='order_id_si_store_i_59ca12_idx'), models.Index(fields=['store', 'band_9'], name='order_id_si_store_i_5ab383_idx'), models.Index(fields=['created_at'], name='order_id_si_created_a25560_idx')],
+                'constraints': [models.UniqueConstraint(fields=('store', 'order_id'), name='unique_order_id_signature')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_orderidsignature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='受信データ')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='IPアドレス')),
+                ('user_agent', models.TextField(blank=True, verbose_name='ユーザーエージェント')),
+                ('attempts', models.IntegerField(default=0, verbose_name='試行回数')),
+                ('error', models.TextField(verbose_name='エラー')),
+                ('received_at', models.DateTimeField(verbose_name='受信日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_dead_letters', to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': 'Webhookデッドレター',
+                'verbose_name_plural': 'Webhookデッドレター',
+                'db_table': 'webhook_dead_letters',
+                'indexes': [models.Index(fields=['store', 'created_at'], name='webhook_dea_store_i_b5c8bf_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookQueueItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='受信データ')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='IPアドレス')),
+                ('user_agent', models.TextField(blank=True, verbose_name='ユーザーエージェント')),
+                ('status', models.CharField(choices=[('pending', '処理待ち'), ('processing', '処理中'), ('completed', '完了')], default='pending', max_length=20, verbose_name='ステータス')),
+                ('attempts', models.IntegerField(default=0, verbose_name='試行回数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='次回試行日時')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='処理開始日時')),
+                ('last_error', models.TextField(blank=True, verbose_name='直近のエラー')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='処理結果')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='受信日時')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='処理完了日時')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_queue_items', to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': 'Webhook受信キュー',
+                'verbose_name_plural': 'Webhook受信キュー',
+                'db_table': 'webhook_queue_items',
+                'indexes': [models.Index(fields=['status', 'store', 'id'], name='webhook_que_status_b924b7_idx'), models.Index(fields=['status', 'next_attempt_at'], name='webhook_que_status_755b0c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_webhookqueue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='duplicatedetection',
+            name='original_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_detections_as_original', to='core.ecpointrequest', verbose_name='元申請'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_duplicatedetection_original_nullable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ECRequestDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='作成日')),
+                ('request_type', models.CharField(max_length=20, verbose_name='申請方式')),
+                ('status', models.CharField(max_length=20, verbose_name='処理状況')),
+                ('payment_method', models.CharField(blank=True, max_length=20, verbose_name='支払い方法')),
+                ('request_count', models.IntegerField(default=0, verbose_name='申請数')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='購入金額合計')),
+                ('points_to_award', models.BigIntegerField(default=0, verbose_name='付与予定ポイント合計')),
+                ('points_awarded', models.BigIntegerField(default=0, verbose_name='実付与ポイント合計')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ec_daily_stats', to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': 'EC申請日次集計',
+                'verbose_name_plural': 'EC申請日次集計',
+                'db_table': 'ec_request_daily_stats',
+                'indexes': [models.Index(fields=['day'], name='ec_request__day_af8259_idx')],
+                'constraints': [models.UniqueConstraint(fields=('store', 'day', 'request_type', 'status', 'payment_method'), name='unique_ec_request_daily_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_ecrequestdailystat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='duplicatedetection',
+            name='detection_type',
+            field=models.CharField(choices=[('order_id', '注文ID重複'), ('pattern_match', 'パターンマッチ'), ('similar_order_id', '類似注文ID'), ('image_match', 'レシート画像一致'), ('suspicious', '不審な活動')], max_length=20, verbose_name='検知種別'),
+        ),
+        migrations.CreateModel(
+            name='ReceiptImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='内容ハッシュ')),
+                ('perceptual_hash', models.CharField(max_length=16, verbose_name='知覚ハッシュ')),
+                ('phash_band_0', models.IntegerField(verbose_name='知覚ハッシュ バンド0')),
+                ('phash_band_1', models.IntegerField(verbose_name='知覚ハッシュ バンド1')),
+                ('phash_band_2', models.IntegerField(verbose_name='知覚ハッシュ バンド2')),
+                ('phash_band_3', models.IntegerField(verbose_name='知覚ハッシュ バンド3')),
+                ('file_size', models.IntegerField(default=0, verbose_name='ファイルサイズ')),
+                ('thumbnail', models.ImageField(blank=True, upload_to='receipts/thumbnails/', verbose_name='サムネイル')),
+                ('thumbnail_status', models.CharField(choices=[('pending', '作成待ち'), ('completed', '作成済み'), ('failed', '作成失敗')], default='pending', max_length=20, verbose_name='サムネイル状態')),
+                ('attempts', models.IntegerField(default=0, verbose_name='試行回数')),
+                ('last_error', models.TextField(blank=True, verbose_name='最終エラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='サムネイル作成日時')),
+                ('ec_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_image_meta', to='core.ecpointrequest', verbose_name='EC申請')),
+            ],
+            options={
+                'verbose_name': 'レシート画像',
+                'verbose_name_plural': 'レシート画像',
+                'db_table': 'receipt_images',
+                'indexes': [models.Index(fields=['content_hash'], name='receipt_ima_content_301dc6_idx'), models.Index(fields=['phash_band_0'], name='receipt_ima_phash_b_0325d2_idx'), models.Index(fields=['phash_band_1'], name='receipt_ima_phash_b_9698e0_idx'), models.Index(fields=['phash_band_2'], name='receipt_ima_phash_b_5ee1e3_idx'), models.Index(fields=['phash_band_3'], name='receipt_ima_phash_b_23d745_idx'), models.Index(fields=['thumbnail_status', 'id'], name='receipt_ima_thumbna_d07a75_idx')],
+            },
+        ),
+    ]
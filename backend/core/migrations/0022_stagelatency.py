@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_receiptimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageLatency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日付')),
+                ('stage', models.CharField(choices=[('validation', 'バリデーション'), ('duplicate_detection', '重複検知'), ('payment', '決済'), ('award', 'ポイント付与'), ('notification', '通知'), ('webhook_total', 'Webhook処理全体'), ('approval_total', '承認処理全体')], max_length=30, verbose_name='処理段階')),
+                ('bucket_counts', models.JSONField(default=list, verbose_name='区間別件数')),
+                ('count', models.BigIntegerField(default=0, verbose_name='件数')),
+                ('total_ms', models.FloatField(default=0, verbose_name='合計時間(ms)')),
+                ('max_ms', models.FloatField(default=0, verbose_name='最大時間(ms)')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('store', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stage_latencies', to='core.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '処理段階別レイテンシ',
+                'verbose_name_plural': '処理段階別レイテンシ',
+                'db_table': 'stage_latency_histograms',
+                'indexes': [models.Index(fields=['store', 'day'], name='stage_laten_store_i_e1fb63_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'stage', 'store'), name='unique_stage_latency')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+def merge_duplicate_no_store_rows(apps, schema_editor):
+    """店舗なしの重複行（同時書き込みで作成されたもの）を1行に合算"""
+    StageLatency = apps.get_model('core', 'StageLatency')
+
+    duplicates = StageLatency.objects.filter(store__isnull=True).values('day', 'stage').annotate(
+        rows=models.Count('id')
+    ).filter(rows__gt=1)
+    for duplicate in duplicates:
+        keep, *others = StageLatency.objects.filter(
+            store__isnull=True, day=duplicate['day'], stage=duplicate['stage']
+        ).order_by('id')
+        for other in others:
+            buckets = keep.bucket_counts or [0] * len(other.bucket_counts)
+            keep.bucket_counts = [mine + theirs for mine, theirs in zip(buckets, other.bucket_counts)]
+            keep.count += other.count
+            keep.total_ms += other.total_ms
+            keep.max_ms = max(keep.max_ms, other.max_ms)
+        keep.save()
+        StageLatency.objects.filter(pk__in=[other.pk for other in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_stagelatency'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            code=merge_duplicate_no_store_rows,
+            reverse_code=migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='stagelatency',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('store__isnull', True)), fields=('day', 'stage'),
+                name='unique_stage_latency_no_store'
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_stagelatency_unique_no_store'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointtransaction',
+            name='balance_after',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='pointtransaction',
+            name='balance_before',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.db.models import Sum
 from django.core.validators import MinValueValidator, MaxValueValidator, EmailValidator
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class ServiceArea(models.Model):
@@ -83,6 +84,8 @@ class User(AbstractUser):
         ('terminal', 'Terminal'),
     ]
     
+    LOT_FETCH_SIZE = 50  # ポイント消費時に1クエリで取得するロット数
+    
     member_id = models.CharField(max_length=50, unique=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
     registration_date = models.DateTimeField(auto_now_add=True)
@@ -127,6 +130,12 @@ class User(AbstractUser):
     
     monthly_counters_reset_at = models.DateTimeField(null=True, blank=True, verbose_name="月次カウンターリセット日時")
 
+    # Point Balance (Materialized)
+    # UserPoint / PointTransaction の書き込みと同一トランザクションで更新する
+    stored_point_balance = models.IntegerField(default=0, verbose_name="ポイント残高（保存値）")
+    lifetime_points_earned = models.IntegerField(default=0, verbose_name="累計獲得ポイント")
+    MATERIALIZED_BALANCE_FIELDS = ('stored_point_balance', 'lifetime_points_earned')
+
     # 2FA Fields
     email_verification_code = models.CharField(max_length=6, blank=True, help_text="Email 2FA Verification Code")
     email_verification_expiry = models.DateTimeField(null=True, blank=True, help_text="Email 2FA Code Expiry")
@@ -366,25 +375,75 @@ class User(AbstractUser):
     def lock_account(self, duration_seconds=7200):
         """アカウントをロック"""
         self.locked_until = timezone.now() + timezone.timedelta(seconds=duration_seconds)
-        self.save()
+        self.save(update_fields=['locked_until'])
     
     def unlock_account(self):
         """アカウントのロックを解除"""
         self.locked_until = None
         self.failed_login_attempts = 0
-        self.save()
-    
+        self.save(update_fields=['locked_until', 'failed_login_attempts'])
+
+    def save(self, *args, **kwargs):
+        """保存済み残高カラムは update_fields で指定された場合のみ書き込む
+
+        残高は apply_point_delta などが行ロック下で更新するため、
+        更新前に読み込んだインスタンスの全項目保存で古い値に戻さないようにする。
+        """
+        if (not args and not self._state.adding and self.pk is not None
+                and kwargs.get('update_fields') is None and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.MATERIALIZED_BALANCE_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def point_balance(self):
-        """有効なポイント残高を計算"""
-        from django.db.models import Sum
-        valid_points = self.user_points.filter(
+        """有効なポイント残高（保存済みの残高カラムを返す）"""
+        return self.stored_point_balance
+    
+    def calculate_point_balance(self):
+        """有効なポイント残高をUserPointから再集計（整合性チェック用）"""
+        return self.user_points.filter(
             is_expired=False
         ).aggregate(total=Sum('points'))['total'] or 0
-        return valid_points
     
-    def add_points(self, points, expiry_months=6, source_description=""):
-        """ポイントを追加（有効期限付き）"""
+    def apply_point_delta(self, delta, earned=0):
+        """保存済み残高を行ロック下で更新し、(更新前残高, 更新後残高) を返す
+        
+        UserPoint / PointTransaction の書き込みと同じトランザクション内で呼び出すこと。
+        """
+        with transaction.atomic():
+            current = User.objects.select_for_update().values(
+                'stored_point_balance', 'lifetime_points_earned'
+            ).get(pk=self.pk)
+            
+            balance_before = current['stored_point_balance']
+            balance_after = balance_before + delta
+            lifetime = current['lifetime_points_earned'] + earned
+            
+            User.objects.filter(pk=self.pk).update(
+                stored_point_balance=balance_after,
+                lifetime_points_earned=lifetime
+            )
+        
+        self.stored_point_balance = balance_after
+        self.lifetime_points_earned = lifetime
+        self.invalidate_point_summary()
+        return balance_before, balance_after
+    
+    def invalidate_point_summary(self):
+        """ポイントサマリーのキャッシュを無効化（台帳書き込み時に呼び出す）"""
+        from .point_service import point_service
+        point_service.invalidate_point_summary(self.pk)
+    
+    @transaction.atomic
+    def record_point_grant(self, points, expiry_months=6, description="", store=None,
+                           reference_id="", transaction_type='grant', processed_by=None):
+        """ポイントロットと取引履歴を作成し、(UserPoint, PointTransaction) を返す"""
         from datetime import timedelta
         expiry_date = timezone.now() + timedelta(days=30 * expiry_months)
         
@@ -394,14 +453,29 @@ class User(AbstractUser):
             expiry_date=expiry_date
         )
         
+        balance_before, balance_after = self.apply_point_delta(points, earned=points)
+        
         # 取引履歴を記録
-        PointTransaction.objects.create(
+        point_transaction = PointTransaction.objects.create(
             user=self,
+            store=store,
             points=points,
-            transaction_type='grant',
-            description=source_description or f"{points}ポイント付与",
-            balance_before=self.point_balance - points,
-            balance_after=self.point_balance
+            transaction_type=transaction_type,
+            description=description or f"{points}ポイント付与",
+            balance_before=balance_before,
+            balance_after=balance_after,
+            reference_id=reference_id,
+            processed_by=processed_by
+        )
+        
+        return user_point, point_transaction
+    
+    def add_points(self, points, expiry_months=6, source_description=""):
+        """ポイントを追加（有効期限付き）"""
+        user_point, _ = self.record_point_grant(
+            points,
+            expiry_months=expiry_months,
+            description=source_description
         )
         
         # ランクアップチェック
@@ -409,70 +483,84 @@ class User(AbstractUser):
         
         return user_point
     
-    def consume_points(self, points, description=""):
-        """ポイントを消費（FIFO - 有効期限が近いものから）"""
-        if self.point_balance < points:
-            raise ValueError(f"ポイント残高不足: 残高{self.point_balance}pt, 必要{points}pt")
+    @transaction.atomic
+    def record_point_consumption(self, points, description="", store=None,
+                                 processed_by=None, transaction_type='payment', reference_id=""):
+        """ポイントをFIFO消費して取引履歴を作成し、(消費ロット一覧, PointTransaction) を返す
+        
+        ユーザー行と消費対象のロットのみを行ロックし、全額消費ロットは1回のDELETE、
+        部分消費ロットは1回のUPDATEで反映する。消費ロット一覧は [(ロットID, 消費ポイント), ...]。
+        """
+        balance_before = User.objects.select_for_update().values_list(
+            'stored_point_balance', flat=True
+        ).get(pk=self.pk)
+        if balance_before < points:
+            raise ValueError(f"ポイント残高不足: 残高{balance_before}pt, 必要{points}pt")
+        
+        # 有効期限が近い順に、必要な分のロットだけをロックして取得
+        lots = UserPoint.objects.select_for_update().filter(
+            user_id=self.pk, is_expired=False
+        ).order_by('expiry_date', 'id')
         
         remaining_points = points
         consumed_points = []
+        fully_consumed_ids = []
+        offset = 0
+        while remaining_points > 0:
+            chunk = list(lots.values_list('id', 'points')[offset:offset + self.LOT_FETCH_SIZE])
+            if not chunk:
+                raise ValueError(f"ポイントロット不足: 不足{remaining_points}pt")
+            offset += len(chunk)
+            
+            for lot_id, lot_points in chunk:
+                if lot_points <= remaining_points:
+                    # このロットを全て消費
+                    consumed_points.append((lot_id, lot_points))
+                    fully_consumed_ids.append(lot_id)
+                    remaining_points -= lot_points
+                else:
+                    # このロットを部分消費
+                    consumed_points.append((lot_id, remaining_points))
+                    UserPoint.objects.filter(pk=lot_id).update(
+                        points=models.F('points') - remaining_points
+                    )
+                    remaining_points = 0
+                if remaining_points <= 0:
+                    break
         
-        # 有効期限が近い順に消費
-        for user_point in self.user_points.filter(is_expired=False).order_by('expiry_date'):
-            if remaining_points <= 0:
-                break
-                
-            if user_point.points <= remaining_points:
-                # このポイントを全て消費
-                consumed_points.append((user_point, user_point.points))
-                remaining_points -= user_point.points
-                user_point.delete()
-            else:
-                # このポイントを部分消費
-                consumed_points.append((user_point, remaining_points))
-                user_point.points -= remaining_points
-                user_point.save()
-                remaining_points = 0
+        if fully_consumed_ids:
+            UserPoint.objects.filter(pk__in=fully_consumed_ids).delete()
+        
+        balance_after = balance_before - points
+        User.objects.filter(pk=self.pk).update(stored_point_balance=balance_after)
+        self.stored_point_balance = balance_after
+        self.invalidate_point_summary()
         
         # 取引履歴を記録
-        PointTransaction.objects.create(
+        point_transaction = PointTransaction.objects.create(
             user=self,
+            store=store,
             points=-points,
-            transaction_type='payment',
+            transaction_type=transaction_type,
             description=description or f"{points}ポイント消費",
-            balance_before=self.point_balance + points,
-            balance_after=self.point_balance
+            balance_before=balance_before,
+            balance_after=balance_after,
+            reference_id=reference_id,
+            processed_by=processed_by
         )
         
+        return consumed_points, point_transaction
+    
+    def consume_points(self, points, description=""):
+        """ポイントを消費（FIFO - 有効期限が近いものから）"""
+        consumed_points, _ = self.record_point_consumption(points, description=description)
         return consumed_points
     
     def check_and_update_rank(self):
-        """ランクアップチェックと自動更新"""
+        """ランクアップチェックと自動更新（累計獲得ポイントから判定）"""
         try:
-            total_points = PointTransaction.objects.filter(
-                user=self,
-                transaction_type__in=['grant', 'bonus'],
-                points__gt=0
-            ).aggregate(total=Sum('points'))['total'] or 0
-            
-            # 適用可能な最高ランクを取得
-            suitable_rank = AccountRank.objects.filter(
-                required_points__lte=total_points
-            ).order_by('-required_points').first()
-            
-            if suitable_rank and self.rank != suitable_rank.rank:
-                old_rank = self.rank
-                self.rank = suitable_rank.rank
-                self.save()
-                
-                # ランクアップ通知
-                Notification.objects.create(
-                    user=self,
-                    notification_type='system',
-                    title='ランクアップ！',
-                    message=f'おめでとうございます！{old_rank}から{self.rank}にランクアップしました！',
-                    priority='high'
-                )
+            from .rank_service import rank_service
+            rank_service.evaluate_user(self)
                 
         except Exception as e:
             # ランクアップエラーはログに記録するが、メインの処理は継続
@@ -1036,6 +1124,10 @@ class UserPoint(models.Model):
     
     class Meta:
         ordering = ['expiry_date']
+        indexes = [
+            models.Index(fields=['user', 'is_expired', 'expiry_date']),
+            models.Index(fields=['is_expired', 'expiry_date']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.points}pt - 期限: {self.expiry_date}"
@@ -1045,12 +1137,153 @@ class UserPoint(models.Model):
         if self.is_expired:
             return False
         if self.expiry_date and self.expiry_date < timezone.now():
+            with transaction.atomic():
+                # 他の処理で失効済みの場合は残高を二重に減らさない
+                updated = UserPoint.objects.filter(
+                    pk=self.pk, is_expired=False
+                ).update(is_expired=True)
+                if updated:
+                    balance_before, balance_after = self.user.apply_point_delta(-self.points)
+                    # 台帳（取引履歴の合計）と残高が一致するよう失効取引を記録
+                    PointTransaction.objects.create(
+                        user=self.user,
+                        points=-self.points,
+                        transaction_type='expire',
+                        description=f"ポイント失効: {self.points}pt（期限: {self.expiry_date}）",
+                        balance_before=balance_before,
+                        balance_after=balance_after
+                    )
             self.is_expired = True
-            self.save()
             return False
         return True
 
 
+class PointExpiryRun(models.Model):
+    """ポイント一括失効処理の実行記録（中断時の再開ポイントを兼ねる）"""
+    STATUS_CHOICES = [
+        ('running', '実行中'),
+        ('completed', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    cutoff = models.DateTimeField(verbose_name='失効基準日時')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', verbose_name='状態')
+    last_user_id = models.BigIntegerField(default=0, verbose_name='処理済み最終ユーザーID')
+    chunks_processed = models.IntegerField(default=0, verbose_name='処理チャンク数')
+    users_processed = models.IntegerField(default=0, verbose_name='処理ユーザー数')
+    lots_expired = models.IntegerField(default=0, verbose_name='失効ロット数')
+    points_expired = models.BigIntegerField(default=0, verbose_name='失効ポイント数')
+    error_message = models.TextField(blank=True, verbose_name='エラー内容')
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='開始日時')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='終了日時')
+    
+    class Meta:
+        db_table = 'point_expiry_runs'
+        verbose_name = 'ポイント失効処理'
+        verbose_name_plural = 'ポイント失効処理'
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"失効処理 {self.started_at:%Y-%m-%d %H:%M} ({self.get_status_display()})"
+    
+    @property
+    def lots_per_second(self):
+        """処理スループット（失効ロット/秒）"""
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.lots_expired / elapsed, 1) if elapsed > 0 else 0.0
+
+
+
+class IdempotencyRecord(models.Model):
+    """冪等キーの処理結果（再送時に元の結果を返すための記録）"""
+    SCOPE_CHOICES = [
+        ('point_grant', 'ポイント付与'),
+        ('store_payment', '店舗決済'),
+        ('ec_webhook', 'EC Webhook'),
+        ('ec_approval', 'EC申請承認'),
+    ]
+    
+    scope = models.CharField(max_length=30, choices=SCOPE_CHOICES, verbose_name='処理種別')
+    actor_key = models.CharField(max_length=100, verbose_name='実行主体')
+    reference_id = models.CharField(max_length=100, verbose_name='参照ID')
+    response_status = models.IntegerField(null=True, blank=True, verbose_name='レスポンスステータス')
+    response_body = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name='レスポンス内容')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    
+    class Meta:
+        db_table = 'idempotency_records'
+        verbose_name = '冪等キー記録'
+        verbose_name_plural = '冪等キー記録'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'actor_key', 'reference_id'],
+                name='unique_idempotency_key'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} {self.actor_key} {self.reference_id}"
+
+
+
+class PointBalanceSnapshot(models.Model):
+    """ユーザーのポイント残高スナップショット（時点残高の復元起点）
+    
+    taken_at 以前（taken_at を含む）の取引をすべて反映した残高を保持する。
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_snapshots', verbose_name='ユーザー')
+    taken_at = models.DateTimeField(verbose_name='基準日時')
+    balance = models.IntegerField(verbose_name='ポイント残高')
+    lifetime_points = models.IntegerField(default=0, verbose_name='累計獲得ポイント')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    
+    class Meta:
+        db_table = 'point_balance_snapshots'
+        verbose_name = 'ポイント残高スナップショット'
+        verbose_name_plural = 'ポイント残高スナップショット'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'taken_at'], name='unique_user_balance_snapshot')
+        ]
+        indexes = [
+            models.Index(fields=['taken_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} @ {self.taken_at:%Y-%m-%d %H:%M}: {self.balance}pt"
+
+
+
+class LedgerCheckRun(models.Model):
+    """ポイント台帳整合性チェックの実行記録（差分チェックの起点を兼ねる）"""
+    STATUS_CHOICES = [
+        ('running', '実行中'),
+        ('completed', '完了'),
+        ('failed', '失敗'),
+    ]
+    
+    incremental = models.BooleanField(default=False, verbose_name='差分チェック')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', verbose_name='状態')
+    users_checked = models.IntegerField(default=0, verbose_name='チェックユーザー数')
+    transactions_checked = models.BigIntegerField(default=0, verbose_name='チェック取引数')
+    issues_found = models.IntegerField(default=0, verbose_name='検出件数')
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='開始日時')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='終了日時')
+    
+    class Meta:
+        db_table = 'ledger_check_runs'
+        verbose_name = '台帳整合性チェック'
+        verbose_name_plural = '台帳整合性チェック'
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"台帳チェック {self.started_at:%Y-%m-%d %H:%M} ({self.get_status_display()})"
+
+
 # === ポイント転送機能 ===
 
 class PointTransfer(models.Model):
@@ -1133,8 +1366,9 @@ class PointTransaction(models.Model):
     points = models.IntegerField()  # 正の値は増加、負の値は減少
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPE_CHOICES)
     description = models.CharField(max_length=500, blank=True)
-    balance_before = models.PositiveIntegerField(default=0)
-    balance_after = models.PositiveIntegerField(default=0)
+    # 保存済み残高がロットの合計より少ない（ドリフトした）場合の失効では負になり得る
+    balance_before = models.IntegerField(default=0)
+    balance_after = models.IntegerField(default=0)
     reference_id = models.CharField(max_length=100, blank=True)  # 外部システムの参照ID
     processed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='processed_transactions')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -1152,6 +1386,29 @@ class PointTransaction(models.Model):
         return f"{self.user.username}: {sign}{self.points}pt ({self.transaction_type})"
 
 
+
+class PointLedgerArchive(models.Model):
+    """締め済み月のポイント取引アーカイブ（列指向の圧縮ファイル）"""
+    month = models.DateField(unique=True, verbose_name='対象月')
+    file_path = models.CharField(max_length=500, verbose_name='アーカイブファイル')
+    row_count = models.IntegerField(default=0, verbose_name='取引件数')
+    points_total = models.BigIntegerField(default=0, verbose_name='ポイント合計')
+    first_transaction_id = models.BigIntegerField(null=True, blank=True, verbose_name='最小取引ID')
+    last_transaction_id = models.BigIntegerField(null=True, blank=True, verbose_name='最大取引ID')
+    file_size = models.BigIntegerField(default=0, verbose_name='ファイルサイズ')
+    checksum = models.CharField(max_length=64, verbose_name='SHA-256')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    
+    class Meta:
+        db_table = 'point_ledger_archives'
+        verbose_name = 'ポイント取引アーカイブ'
+        verbose_name_plural = 'ポイント取引アーカイブ'
+        ordering = ['-month']
+    
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.row_count}件)"
+
+
 # === 通知機能 ===
 
 class Notification(models.Model):
@@ -1289,6 +1546,7 @@ class ECPointRequest(models.Model):
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['store', 'status']),
             models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['store', 'created_at']),
             models.Index(fields=['order_id']),
             models.Index(fields=['request_hash']),
         ]
@@ -1399,6 +1657,75 @@ class StoreWebhookKey(models.Model):
         """Webhookキーを生成"""
         import secrets
         return secrets.token_hex(32)
+    
+    def is_ip_allowed(self, ip_address):
+        """IPアドレスが許可されているかチェック"""
+        if not self.allowed_ips:
+            return True  # 制限なし
+        return ip_address in self.allowed_ips
+    
+    def update_last_used(self):
+        """最終使用日時を更新"""
+        from django.utils import timezone
+        self.last_used_at = timezone.now()
+        self.save(update_fields=['last_used_at'])
+
+
+class WebhookQueueItem(models.Model):
+    """Webhook受信キュー（受信時は生データのみ保存し、ワーカーが店舗ごとの受信順に取り込む）"""
+    STATUS_CHOICES = [
+        ('pending', '処理待ち'),
+        ('processing', '処理中'),
+        ('completed', '完了'),
+    ]
+    
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='webhook_queue_items', verbose_name='店舗')
+    payload = models.JSONField(verbose_name='受信データ')
+    ip_address = models.GenericIPAddressField(verbose_name='IPアドレス')
+    user_agent = models.TextField(blank=True, verbose_name='ユーザーエージェント')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='ステータス')
+    attempts = models.IntegerField(default=0, verbose_name='試行回数')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='次回試行日時')
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name='処理開始日時')
+    last_error = models.TextField(blank=True, verbose_name='直近のエラー')
+    result = models.JSONField(blank=True, null=True, verbose_name='処理結果')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='受信日時')
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name='処理完了日時')
+    
+    class Meta:
+        db_table = 'webhook_queue_items'
+        verbose_name = 'Webhook受信キュー'
+        verbose_name_plural = 'Webhook受信キュー'
+        indexes = [
+            models.Index(fields=['status', 'store', 'id']),
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.store_id}: {self.payload.get('order_id')} ({self.status})"
+
+
+class WebhookDeadLetter(models.Model):
+    """Webhook受信キューのデッドレター（検証エラー・再試行上限到達）"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='webhook_dead_letters', verbose_name='店舗')
+    payload = models.JSONField(verbose_name='受信データ')
+    ip_address = models.GenericIPAddressField(verbose_name='IPアドレス')
+    user_agent = models.TextField(blank=True, verbose_name='ユーザーエージェント')
+    attempts = models.IntegerField(default=0, verbose_name='試行回数')
+    error = models.TextField(verbose_name='エラー')
+    received_at = models.DateTimeField(verbose_name='受信日時')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    
+    class Meta:
+        db_table = 'webhook_dead_letters'
+        verbose_name = 'Webhookデッドレター'
+        verbose_name_plural = 'Webhookデッドレター'
+        indexes = [
+            models.Index(fields=['store', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.store_id}: {self.payload.get('order_id')} - {self.error[:50]}"
 
 
 # ============================================
@@ -2125,18 +2452,6 @@ class UserExperienceSettings(models.Model):
         verbose_name = "👤 ユーザー体験設定"
         verbose_name_plural = "👤 ユーザー体験設定"
         db_table = 'core_user_experience_settings'
-    
-    def is_ip_allowed(self, ip_address):
-        """IPアドレスが許可されているかチェック"""
-        if not self.allowed_ips:
-            return True  # 制限なし
-        return ip_address in self.allowed_ips
-    
-    def update_last_used(self):
-        """最終使用日時を更新"""
-        from django.utils import timezone
-        self.last_used_at = timezone.now()
-        self.save(update_fields=['last_used_at'])
 
 
 class PointAwardLog(models.Model):
@@ -2172,6 +2487,8 @@ class DuplicateDetection(models.Model):
     DETECTION_TYPE_CHOICES = [
         ('order_id', '注文ID重複'),
         ('pattern_match', 'パターンマッチ'),
+        ('similar_order_id', '類似注文ID'),
+        ('image_match', 'レシート画像一致'),
         ('suspicious', '不審な活動'),
     ]
     
@@ -2186,6 +2503,8 @@ class DuplicateDetection(models.Model):
     original_request = models.ForeignKey(
         ECPointRequest, 
         on_delete=models.CASCADE, 
+        blank=True, 
+        null=True, 
         related_name='duplicate_detections_as_original', 
         verbose_name='元申請'
     )
@@ -2214,6 +2533,201 @@ class DuplicateDetection(models.Model):
         return f"{self.get_detection_type_display()} - {self.get_severity_display()}"
 
 
+class OrderIdSignature(models.Model):
+    """注文ID類似検索用のMinHashシグネチャ（店舗ごと・LSHバンド単位でインデックス）"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, verbose_name='店舗')
+    order_id = models.CharField(max_length=100, verbose_name='注文ID')
+    band_0 = models.BigIntegerField(verbose_name='バンド0')
+    band_1 = models.BigIntegerField(verbose_name='バンド1')
+    band_2 = models.BigIntegerField(verbose_name='バンド2')
+    band_3 = models.BigIntegerField(verbose_name='バンド3')
+    band_4 = models.BigIntegerField(verbose_name='バンド4')
+    band_5 = models.BigIntegerField(verbose_name='バンド5')
+    band_6 = models.BigIntegerField(verbose_name='バンド6')
+    band_7 = models.BigIntegerField(verbose_name='バンド7')
+    band_8 = models.BigIntegerField(verbose_name='バンド8')
+    band_9 = models.BigIntegerField(verbose_name='バンド9')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='申請日時')
+    
+    class Meta:
+        db_table = 'order_id_signatures'
+        verbose_name = '注文IDシグネチャ'
+        verbose_name_plural = '注文IDシグネチャ'
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'order_id'], name='unique_order_id_signature'),
+        ]
+        indexes = [
+            models.Index(fields=['store', 'band_0']),
+            models.Index(fields=['store', 'band_1']),
+            models.Index(fields=['store', 'band_2']),
+            models.Index(fields=['store', 'band_3']),
+            models.Index(fields=['store', 'band_4']),
+            models.Index(fields=['store', 'band_5']),
+            models.Index(fields=['store', 'band_6']),
+            models.Index(fields=['store', 'band_7']),
+            models.Index(fields=['store', 'band_8']),
+            models.Index(fields=['store', 'band_9']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.store_id}: {self.order_id}"
+
+
+class OrderIdTemplate(models.Model):
+    """店舗の注文IDの採番書式（大半の注文IDに共通するn-gram）
+    
+    共通部分がシグネチャを支配して無関係な注文IDが同じバケットに集まるのを防ぐため、
+    シグネチャ計算時に除外する。変更時はその店舗のシグネチャを再計算すること。
+    """
+    store = models.OneToOneField(Store, on_delete=models.CASCADE, related_name='order_id_template', verbose_name='店舗')
+    stop_shingles = models.JSONField(default=list, verbose_name='除外n-gram')
+    sample_size = models.IntegerField(default=0, verbose_name='学習件数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+    
+    class Meta:
+        db_table = 'order_id_templates'
+        verbose_name = '注文ID書式'
+        verbose_name_plural = '注文ID書式'
+    
+    def __str__(self):
+        return f"{self.store_id}: {len(self.stop_shingles)} n-grams"
+
+
+class ECRequestDailyStat(models.Model):
+    """EC申請の日次集計（店舗 × 作成日 × 申請方式 × 処理状況 × 支払い方法）
+
+    申請の作成・状態変更時に差分で更新する。集計値が申請と食い違った場合は
+    rebuild_ec_stats コマンドで再集計すること。
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='ec_daily_stats', verbose_name='店舗')
+    day = models.DateField(verbose_name='作成日')
+    request_type = models.CharField(max_length=20, verbose_name='申請方式')
+    status = models.CharField(max_length=20, verbose_name='処理状況')
+    payment_method = models.CharField(max_length=20, blank=True, verbose_name='支払い方法')
+    request_count = models.IntegerField(default=0, verbose_name='申請数')
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='購入金額合計')
+    points_to_award = models.BigIntegerField(default=0, verbose_name='付与予定ポイント合計')
+    points_awarded = models.BigIntegerField(default=0, verbose_name='実付与ポイント合計')
+
+    class Meta:
+        db_table = 'ec_request_daily_stats'
+        verbose_name = 'EC申請日次集計'
+        verbose_name_plural = 'EC申請日次集計'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['store', 'day', 'request_type', 'status', 'payment_method'],
+                name='unique_ec_request_daily_stat'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.day} {self.request_type}/{self.status}: {self.request_count}"
+
+
+class ReceiptImage(models.Model):
+    """レシート画像の指紋とサムネイル
+
+    同じ写真の使い回しを検知するため、内容ハッシュ（SHA-256）と知覚ハッシュ（64bitのdHash）を
+    保持する。知覚ハッシュは16bitずつ4つのバンドに分けてインデックスし、ハミング距離3以内の
+    画像はいずれかのバンドが一致するため、バンド検索1回で候補が得られる。
+    サムネイルは承認画面用にワーカー（process_receipt_images）が非同期で作成する。
+    """
+    THUMBNAIL_STATUS_CHOICES = [
+        ('pending', '作成待ち'),
+        ('completed', '作成済み'),
+        ('failed', '作成失敗'),
+    ]
+
+    ec_request = models.OneToOneField(
+        ECPointRequest,
+        on_delete=models.CASCADE,
+        related_name='receipt_image_meta',
+        verbose_name='EC申請'
+    )
+    content_hash = models.CharField(max_length=64, verbose_name='内容ハッシュ')
+    perceptual_hash = models.CharField(max_length=16, verbose_name='知覚ハッシュ')
+    phash_band_0 = models.IntegerField(verbose_name='知覚ハッシュ バンド0')
+    phash_band_1 = models.IntegerField(verbose_name='知覚ハッシュ バンド1')
+    phash_band_2 = models.IntegerField(verbose_name='知覚ハッシュ バンド2')
+    phash_band_3 = models.IntegerField(verbose_name='知覚ハッシュ バンド3')
+    file_size = models.IntegerField(default=0, verbose_name='ファイルサイズ')
+    thumbnail = models.ImageField(upload_to='receipts/thumbnails/', blank=True, verbose_name='サムネイル')
+    thumbnail_status = models.CharField(
+        max_length=20, choices=THUMBNAIL_STATUS_CHOICES, default='pending', verbose_name='サムネイル状態'
+    )
+    attempts = models.IntegerField(default=0, verbose_name='試行回数')
+    last_error = models.TextField(blank=True, verbose_name='最終エラー')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='作成日時')
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name='サムネイル作成日時')
+
+    class Meta:
+        db_table = 'receipt_images'
+        verbose_name = 'レシート画像'
+        verbose_name_plural = 'レシート画像'
+        indexes = [
+            models.Index(fields=['content_hash']),
+            models.Index(fields=['phash_band_0']),
+            models.Index(fields=['phash_band_1']),
+            models.Index(fields=['phash_band_2']),
+            models.Index(fields=['phash_band_3']),
+            models.Index(fields=['thumbnail_status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.ec_request_id}: {self.content_hash[:12]}"
+
+
+class StageLatency(models.Model):
+    """ECパイプラインの処理段階別の処理時間ヒストグラム（日 × 段階 × 店舗）
+
+    各プロセスがメモリ上で集計したヒストグラムを定期的に加算する。bucket_counts は
+    latency_service.BUCKET_BOUNDS_MS の各上限以下の件数（末尾は上限超過）。
+    """
+    STAGE_CHOICES = [
+        ('validation', 'バリデーション'),
+        ('duplicate_detection', '重複検知'),
+        ('payment', '決済'),
+        ('award', 'ポイント付与'),
+        ('notification', '通知'),
+        ('webhook_total', 'Webhook処理全体'),
+        ('approval_total', '承認処理全体'),
+    ]
+
+    day = models.DateField(verbose_name='日付')
+    stage = models.CharField(max_length=30, choices=STAGE_CHOICES, verbose_name='処理段階')
+    store = models.ForeignKey(
+        Store, on_delete=models.CASCADE, blank=True, null=True, related_name='stage_latencies', verbose_name='店舗'
+    )
+    bucket_counts = models.JSONField(default=list, verbose_name='区間別件数')
+    count = models.BigIntegerField(default=0, verbose_name='件数')
+    total_ms = models.FloatField(default=0, verbose_name='合計時間(ms)')
+    max_ms = models.FloatField(default=0, verbose_name='最大時間(ms)')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        db_table = 'stage_latency_histograms'
+        verbose_name = '処理段階別レイテンシ'
+        verbose_name_plural = '処理段階別レイテンシ'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'stage', 'store'], name='unique_stage_latency'),
+            # 店舗なし（NULL）の行は上の制約では重複を防げないため別途一意にする
+            models.UniqueConstraint(
+                fields=['day', 'stage'], condition=models.Q(store__isnull=True),
+                name='unique_stage_latency_no_store'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['store', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.stage} ({self.store_id}): {self.count}"
+
+
 class EmailTemplate(models.Model):
     """メールテンプレート管理"""
     name = models.CharField(max_length=100, unique=True)
@@ -54,6 +54,44 @@ class NotificationService:
             logger.error(f"Failed to send approval request notifications: {str(e)}")
             return False
     
+    def notify_store_batch_approval_request(self, store, ec_requests):
+        """一括登録された申請の承認依頼を店舗管理者ごとに1件の通知にまとめて送信"""
+        try:
+            store_managers = store.managers.filter(
+                status='active',
+                role='store_manager'
+            )
+            
+            if not store_managers.exists():
+                logger.warning(f"No active managers found for store {store.name}")
+                return False
+            
+            total_amount = sum(ec_request.purchase_amount for ec_request in ec_requests)
+            total_points = sum(ec_request.points_to_award for ec_request in ec_requests)
+            message = f"""
+新しいポイント付与申請が{len(ec_requests)}件届いています。
+
+申請種別: Webhook申請（一括）
+購入金額合計: {total_amount}円
+予定ポイント合計: {total_points}ポイント
+
+管理画面から承認・拒否の処理をお願いします。
+            """.strip()
+            
+            self.send_bulk_notifications(
+                store_managers,
+                notification_type='ec_approval_request',
+                title=f'ポイント付与承認依頼（{len(ec_requests)}件）',
+                message=message
+            )
+            
+            logger.info(f"Batch approval request notifications sent for {len(ec_requests)} requests")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to send batch approval request notifications: {str(e)}")
+            return False
+    
     def notify_user_points_awarded(self, ec_request: ECPointRequest, payment_method: str):
         """ユーザーにポイント付与完了通知を送信"""
         try:
@@ -92,7 +130,57 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Failed to send points awarded notification: {str(e)}")
             return False
-    
+
+    def notify_users_points_awarded_bulk(self, store, ec_requests, payment_method: str, balances=None):
+        """一括承認した申請のユーザーにポイント付与完了通知を一括送信"""
+        try:
+            balances = balances or {}
+            notifications = []
+            for ec_request in ec_requests:
+                message = f"""
+{store.name}でのご購入により{ec_request.points_awarded}ポイントが付与されました。
+
+購入金額: {ec_request.purchase_amount}円
+付与ポイント: {ec_request.points_awarded}ポイント
+注文ID: {ec_request.order_id}
+支払方法: {payment_method}
+
+ご利用ありがとうございました。
+                """.strip()
+
+                notifications.append(Notification(
+                    user_id=ec_request.user_id,
+                    notification_type='point_received',
+                    title=f'{ec_request.points_awarded}ポイントが付与されました',
+                    message=message,
+                    email_template='points_awarded',
+                    email_context={
+                        'user_name': ec_request.user.username,
+                        'store_name': store.name,
+                        'purchase_amount': str(ec_request.purchase_amount),
+                        'points_awarded': ec_request.points_awarded,
+                        'order_id': ec_request.order_id,
+                        'payment_method': payment_method,
+                        'total_balance': balances.get(ec_request.user_id, ec_request.user.point_balance)
+                    },
+                    priority='normal'
+                ))
+
+            created_notifications = Notification.objects.bulk_create(notifications, batch_size=1000)
+
+            if hasattr(email_service, 'send_bulk_emails'):
+                try:
+                    email_service.send_bulk_emails(created_notifications)
+                except Exception as e:
+                    logger.error(f"Failed to send bulk emails: {str(e)}")
+
+            logger.info(f"Points awarded notifications sent to {len(created_notifications)} users")
+            return len(created_notifications)
+
+        except Exception as e:
+            logger.error(f"Failed to send bulk points awarded notifications: {str(e)}")
+            return 0
+
     def notify_user_rejection(self, ec_request: ECPointRequest):
         """ユーザーに申請拒否通知を送信"""
         try:
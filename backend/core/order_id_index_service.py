@@ -0,0 +1,215 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from collections import Counter, defaultdict
+import hashlib
+import logging
+import struct
+
+from .models import ECPointRequest, OrderIdSignature, OrderIdTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class OrderIdIndexService:
+    """注文IDの類似検索インデックス（MinHash + LSH）
+
+    注文IDを文字3-gramの集合とみなしてMinHashシグネチャを計算し、BANDS個のバンドに
+    分けて店舗ごとにインデックスする。いずれかのバンドが一致した注文IDのみを候補として
+    一致バンド数の多い順に返すため、ECPointRequestを走査せずにインデックス検索1回で
+    近似重複の候補が得られる。候補の類似度判定（レーベンシュタイン距離）は呼び出し側で行う。
+
+    店舗の大半の注文IDに共通するn-gram（"AMZ-" などの採番書式）は店舗ごとの書式として
+    学習し、シグネチャから除外する。書式を更新した店舗はシグネチャを再計算する（rebuild）。
+    """
+
+    NGRAM = 3
+    BANDS = 10
+    ROWS = 3  # 1バンドあたりのハッシュ数
+    BAND_FIELDS = [f'band_{band}' for band in range(BANDS)]
+    TEMPLATE_CACHE_KEY = 'order_id_template:{store_id}'
+
+    def __init__(self):
+        self.candidate_limit = 50  # 1回の検索で返す候補数の上限
+        self.stop_shingle_ratio = 0.05  # この割合を超える注文IDに現れるn-gramを書式とみなす
+        self.template_min_ids = 200  # 書式を学習する最小件数
+        self.template_sample_size = 20000  # 書式の学習に使う直近の注文ID数
+        self.rebuild_batch_size = 5000
+        self._unpack = struct.Struct(f'<{self.BANDS * self.ROWS}H').unpack
+
+    @property
+    def window_days(self):
+        """インデックス対象とする直近の日数"""
+        return getattr(settings, 'ORDER_ID_INDEX_DAYS', 90)
+
+    def shingles(self, order_id):
+        text = f'^{order_id.strip().lower()}$'
+        return {text[index:index + self.NGRAM] for index in range(max(len(text) - self.NGRAM + 1, 1))}
+
+    def signature(self, order_id, stop_shingles=frozenset()):
+        """注文IDのバンドごとのハッシュ値（BANDS個の整数）を返す
+
+        n-gramごとに1回だけハッシュを計算し、その出力を16bitずつ切り分けて
+        BANDS×ROWS 個の独立したハッシュ関数として扱う。
+        """
+        shingles = self.shingles(order_id)
+        distinctive = shingles - stop_shingles
+        if len(distinctive) >= 2:
+            shingles = distinctive
+
+        digest_size = self.BANDS * self.ROWS * 2
+        minimums = [
+            min(column) for column in zip(*(
+                self._unpack(hashlib.blake2b(shingle.encode('utf-8'), digest_size=digest_size).digest())
+                for shingle in shingles
+            ))
+        ]
+
+        bands = []
+        for band in range(self.BANDS):
+            value = 0
+            for row_value in minimums[band * self.ROWS:(band + 1) * self.ROWS]:
+                value = (value << 16) | row_value
+            bands.append(value)
+        return bands
+
+    def stop_shingles(self, store_id):
+        """店舗の書式n-gram（未学習の場合は空）"""
+        cache_key = self.TEMPLATE_CACHE_KEY.format(store_id=store_id)
+        stop_shingles = cache.get(cache_key)
+        if stop_shingles is None:
+            stop_shingles = OrderIdTemplate.objects.filter(store_id=store_id).values_list(
+                'stop_shingles', flat=True
+            ).first() or []
+            cache.set(cache_key, stop_shingles, timeout=None)
+        return frozenset(stop_shingles)
+
+    def learn_template(self, store_id, order_ids):
+        """注文IDの標本から店舗の書式n-gramを学習して保存"""
+        order_ids = order_ids[-self.template_sample_size:]
+        stop_shingles = []
+        if len(order_ids) >= self.template_min_ids:
+            frequency = Counter()
+            for order_id in order_ids:
+                frequency.update(self.shingles(order_id))
+            stop_shingles = sorted(
+                shingle for shingle, count in frequency.items()
+                if count / len(order_ids) > self.stop_shingle_ratio
+            )
+
+        OrderIdTemplate.objects.update_or_create(
+            store_id=store_id,
+            defaults={'stop_shingles': stop_shingles, 'sample_size': len(order_ids)}
+        )
+        cache.delete(self.TEMPLATE_CACHE_KEY.format(store_id=store_id))
+        transaction.on_commit(lambda: cache.delete(self.TEMPLATE_CACHE_KEY.format(store_id=store_id)))
+        return frozenset(stop_shingles)
+
+    def add(self, store_id, order_id, created_at=None):
+        """注文IDをインデックスに追加（登録済みの場合は何もしない）"""
+        self.add_many([(store_id, order_id, created_at)])
+
+    def add_many(self, rows):
+        """[(店舗ID, 注文ID, 作成日時), ...] を一括でインデックスに追加"""
+        templates = {}
+        signatures = []
+        for store_id, order_id, created_at in rows:
+            if store_id not in templates:
+                templates[store_id] = self.stop_shingles(store_id)
+            signatures.append(OrderIdSignature(
+                store_id=store_id,
+                order_id=order_id,
+                created_at=created_at or timezone.now(),
+                **dict(zip(self.BAND_FIELDS, self.signature(order_id, templates[store_id])))
+            ))
+        OrderIdSignature.objects.bulk_create(signatures, batch_size=1000, ignore_conflicts=True)
+
+    def candidates(self, store_id, order_id):
+        """同一店舗の注文IDのうち、いずれかのバンドが一致するものを一致数の多い順で返す
+
+        インデックスには直近の注文IDのみを保持する（期間外のシグネチャは rebuild で削除）。
+        """
+        signature = self.signature(order_id, self.stop_shingles(store_id))
+        # 店舗条件を各バンドの条件に含め、(店舗, バンド) インデックスごとの検索の和集合として実行させる
+        any_band = Q()
+        for field, value in zip(self.BAND_FIELDS, signature):
+            any_band |= Q(store_id=store_id, **{field: value})
+
+        # 一致バンド数による順位付けはSQL式にするとクエリの組み立てが検索より重くなるため取得後に行う
+        rows = OrderIdSignature.objects.filter(any_band).exclude(order_id=order_id).order_by('-id').values_list(
+            'order_id', *self.BAND_FIELDS
+        )[:self.candidate_limit * self.BANDS]
+        ranked = sorted(
+            rows, key=lambda row: -sum(mine == theirs for mine, theirs in zip(signature, row[1:]))
+        )
+        return [row[0] for row in ranked[:self.candidate_limit]]
+
+    def candidates_many(self, store_id, order_ids, chunk_size=1000):
+        """複数の注文IDの候補を {注文ID: 候補の一覧} で返す（チャンクごとに1クエリ）"""
+        stop_shingles = self.stop_shingles(store_id)
+        signatures = {order_id: self.signature(order_id, stop_shingles) for order_id in order_ids}
+        ranked = {order_id: {} for order_id in signatures}
+        order_ids = list(signatures)
+
+        for offset in range(0, len(order_ids), chunk_size):
+            chunk = order_ids[offset:offset + chunk_size]
+            # バンドごとに「ハッシュ値 → そのバンドを持つ注文ID」を作り、取得した行を照合する
+            band_values = [defaultdict(list) for _ in self.BAND_FIELDS]
+            for order_id in chunk:
+                for band, value in enumerate(signatures[order_id]):
+                    band_values[band][value].append(order_id)
+
+            any_band = Q()
+            for field, values in zip(self.BAND_FIELDS, band_values):
+                any_band |= Q(store_id=store_id, **{f'{field}__in': list(values)})
+
+            rows = OrderIdSignature.objects.filter(any_band).order_by('-id').values_list(
+                'order_id', *self.BAND_FIELDS
+            )
+            for row in rows:
+                for band, value in enumerate(row[1:]):
+                    for order_id in band_values[band].get(value, ()):
+                        if order_id != row[0]:
+                            ranked[order_id][row[0]] = ranked[order_id].get(row[0], 0) + 1
+
+        return {
+            order_id: sorted(matches, key=lambda candidate: -matches[candidate])[:self.candidate_limit]
+            for order_id, matches in ranked.items()
+        }
+
+    def rebuild(self, days=None, dry_run=False, progress_callback=None):
+        """直近の申請から店舗ごとに書式を学習し直してインデックスを再構築し、期間外のシグネチャを削除する"""
+        days = days or self.window_days
+        cutoff = timezone.now() - timezone.timedelta(days=days)
+        requests = ECPointRequest.objects.filter(created_at__gte=cutoff)
+        if dry_run:
+            return requests.count()
+
+        pruned, _ = OrderIdSignature.objects.filter(created_at__lt=cutoff).delete()
+
+        indexed = 0
+        store_ids = requests.order_by('store_id').values_list('store_id', flat=True).distinct()
+        for store_id in store_ids:
+            rows = list(
+                requests.filter(store_id=store_id).order_by('id').values_list('order_id', 'created_at')
+            )
+            with transaction.atomic():
+                self.learn_template(store_id, [order_id for order_id, _ in rows])
+                OrderIdSignature.objects.filter(store_id=store_id).delete()
+                for offset in range(0, len(rows), self.rebuild_batch_size):
+                    self.add_many([
+                        (store_id, order_id, created_at)
+                        for order_id, created_at in rows[offset:offset + self.rebuild_batch_size]
+                    ])
+            indexed += len(rows)
+            if progress_callback:
+                progress_callback(indexed)
+
+        logger.info(f"Order ID index rebuilt: {indexed} requests indexed, {pruned} expired signatures pruned")
+        return indexed
+
+
+# グローバルインスタンス
+order_id_index_service = OrderIdIndexService()
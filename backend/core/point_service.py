@@ -1,11 +1,18 @@
 from django.db import transaction
 from django.utils import timezone
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import Sum, Q, FilteredRelation, OuterRef, Subquery, IntegerField, Value
+from django.db.models.functions import Coalesce
 import logging
+import time
+from collections import defaultdict
+from datetime import datetime
 from decimal import Decimal
 
-from .models import User, Store, PointTransaction, UserPoint, PointTransfer, Notification
+from .models import (
+    User, Store, PointTransaction, UserPoint, PointTransfer, Notification, PointExpiryRun
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +24,9 @@ class PointService:
         self.transfer_fee_rate = Decimal('0.10')  # 転送手数料率（10%）
         self.min_transfer_amount = 100  # 最小転送ポイント
         self.max_transfer_amount = 50000  # 最大転送ポイント
+        self.max_bulk_grant_rows = 50000  # 一括付与の最大行数
+        self.summary_cache_timeout = 60 * 60 * 24  # ポイントサマリーのキャッシュ保持時間（秒）
+        self.soon_expire_days = 30  # 近日失効とみなす日数
     
     @transaction.atomic
     def grant_points_to_user(self, user: User, points: int, store: Store = None, 
@@ -56,28 +66,18 @@ class PointService:
             if points <= 0:
                 raise ValidationError("付与ポイントは1以上である必要があります")
             
-            # ユーザーの残高を取得
-            balance_before = user.point_balance
-            
-            # ポイント付与
-            user_point = user.add_points(
-                points=points,
+            # ポイント付与（ロット・取引履歴・保存済み残高を同時に更新）
+            _, point_transaction = user.record_point_grant(
+                points,
                 expiry_months=6,  # 6ヶ月有効
-                source_description=description or f"EC購入ポイント付与: {points}pt"
-            )
-            
-            # PointTransaction記録を作成
-            point_transaction = PointTransaction.objects.create(
-                user=user,
+                description=description or f"EC購入ポイント付与: {points}pt",
                 store=store,
-                points=points,  # 正の値で付与
-                transaction_type='grant',
-                description=description,
-                balance_before=balance_before,
-                balance_after=user.point_balance,
                 reference_id=reference_id
             )
             
+            # ランクアップチェック
+            user.check_and_update_rank()
+            
             # 通知作成
             Notification.objects.create(
                 user=user,
@@ -94,31 +94,207 @@ class PointService:
             logger.error(f"Failed to award EC points: {str(e)}")
             raise
     
+    @transaction.atomic
+    def grant_points_bulk(self, grants, store: Store = None, description: str = "",
+                          expiry_months: int = 6, processed_by: User = None):
+        """キャンペーン等の一括ポイント付与
+        
+        grants: [{'user_id' または 'member_id', 'points', 'reference_id'}, ...]
+        1パスで検証した後、UserPoint / PointTransaction / Notification を一括作成し、
+        店舗デポジットはバッチ全体で1回だけ課金する。戻り値は入力行と同順の結果リスト。
+        """
+        if len(grants) > self.max_bulk_grant_rows:
+            raise ValidationError(f"一括付与は{self.max_bulk_grant_rows}件以下である必要があります")
+        
+        # 1. ユーザー解決（ID・会員IDそれぞれ1クエリ）
+        # ユーザーIDは文字列の数値も受け付けて整数に揃える（数値以外は None として行エラー）
+        row_user_ids = [self._parse_user_id(row['user_id']) if row.get('user_id') else None for row in grants]
+        user_ids = {user_id for user_id in row_user_ids if user_id is not None}
+        member_ids = {row.get('member_id') for row in grants if row.get('member_id') and not row.get('user_id')}
+        users_by_id = dict(
+            User.objects.filter(pk__in=user_ids, is_active=True).values_list('pk', 'pk')
+        ) if user_ids else {}
+        users_by_member_id = dict(
+            User.objects.filter(member_id__in=member_ids, is_active=True).values_list('member_id', 'pk')
+        ) if member_ids else {}
+        
+        # 2. 行ごとの検証
+        results = []
+        valid_rows = []
+        for index, row in enumerate(grants):
+            reference_id = str(row.get('reference_id') or '')[:100]
+            result = {'index': index, 'reference_id': reference_id, 'success': False}
+            results.append(result)
+            
+            try:
+                points = int(row.get('points'))
+            except (TypeError, ValueError):
+                result['error'] = 'ポイント数が不正です'
+                continue
+            if points <= 0:
+                result['error'] = '付与ポイントは1以上である必要があります'
+                continue
+            
+            if row.get('user_id'):
+                if row_user_ids[index] is None:
+                    result['error'] = 'ユーザーIDが不正です'
+                    continue
+                user_id = users_by_id.get(row_user_ids[index])
+            else:
+                user_id = users_by_member_id.get(row.get('member_id'))
+            if user_id is None:
+                result['error'] = 'ユーザーが見つかりません'
+                continue
+            
+            result['user_id'] = user_id
+            result['points'] = points
+            valid_rows.append((result, {
+                'user_id': user_id,
+                'points': points,
+                'reference_id': reference_id,
+            }))
+        
+        if not valid_rows:
+            return results
+        
+        total_points = sum(grant['points'] for _, grant in valid_rows)
+        
+        # 3. 店舗デポジットをバッチ全体で1回だけ課金
+        if store:
+            store = Store.objects.select_for_update().get(pk=store.pk)
+            charge_amount = Decimal(total_points) * Decimal('0.01')  # 1pt = 1円の従量課金
+            store.deduct_deposit(
+                amount=charge_amount,
+                description=f"ポイント一括付与従量課金: {len(valid_rows)}件 / {total_points}pt"
+            )
+        
+        # 4. 台帳への一括書き込み
+        point_transactions = self._apply_bulk_grants(
+            [grant for _, grant in valid_rows],
+            store=store,
+            description=description,
+            expiry_months=expiry_months,
+            processed_by=processed_by
+        )
+        
+        for (result, _), point_transaction in zip(valid_rows, point_transactions):
+            result['success'] = True
+            result['transaction_id'] = point_transaction.pk
+            result['balance_after'] = point_transaction.balance_after
+        
+        logger.info(
+            f"Bulk points granted: {len(valid_rows)}/{len(grants)} rows, {total_points}pt "
+            f"from {store.name if store else 'system'}"
+        )
+        return results
+    
+    @staticmethod
+    def _parse_user_id(value):
+        """ユーザーIDを整数に変換（数値以外は None）"""
+        try:
+            return int(str(value).strip())
+        except ValueError:
+            return None
+    
+    def _apply_bulk_grants(self, grants, store: Store = None, description: str = "",
+                           expiry_months: int = 6, transaction_type: str = 'grant',
+                           processed_by: User = None, notify: bool = True):
+        """複数ユーザーへの付与を集合演算で台帳に反映し、PointTransactionを入力順で返す
+        
+        grants: [{'user_id', 'points', 'reference_id', 'description'(任意)}, ...]
+        呼び出し側のトランザクション内で実行すること。
+        """
+        from datetime import timedelta
+        from .rank_service import rank_service
+        
+        user_ids = sorted({grant['user_id'] for grant in grants})
+        states = {
+            user_id: [balance, lifetime, rank_id]
+            for user_id, balance, lifetime, rank_id in User.objects.select_for_update().filter(
+                pk__in=user_ids
+            ).order_by('pk').values_list('pk', 'stored_point_balance', 'lifetime_points_earned', 'rank_id')
+        }
+        
+        expiry_date = timezone.now() + timedelta(days=30 * expiry_months)
+        lots = []
+        ledger_rows = []
+        for grant in grants:
+            state = states[grant['user_id']]
+            balance_before = state[0]
+            state[0] += grant['points']
+            state[1] += grant['points']
+            row_description = grant.get('description') or description or f"{grant['points']}ポイント付与"
+            
+            lots.append(UserPoint(
+                user_id=grant['user_id'],
+                points=grant['points'],
+                expiry_date=expiry_date
+            ))
+            ledger_rows.append(PointTransaction(
+                user_id=grant['user_id'],
+                store=store,
+                points=grant['points'],
+                transaction_type=transaction_type,
+                description=row_description,
+                balance_before=balance_before,
+                balance_after=state[0],
+                reference_id=grant.get('reference_id', ''),
+                processed_by=processed_by
+            ))
+        
+        UserPoint.objects.bulk_create(lots, batch_size=1000)
+        PointTransaction.objects.bulk_create(ledger_rows, batch_size=1000)
+        User.objects.bulk_update(
+            [
+                User(pk=user_id, stored_point_balance=state[0], lifetime_points_earned=state[1])
+                for user_id, state in states.items()
+            ],
+            ['stored_point_balance', 'lifetime_points_earned'],
+            batch_size=1000
+        )
+        
+        self.invalidate_point_summary(*states.keys())
+        
+        # ランク判定（ランクごとの一括更新）
+        rank_service.evaluate_users_bulk({
+            user_id: (state[1], state[2]) for user_id, state in states.items()
+        })
+        
+        if notify:
+            source = store.name if store else "システム"
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=grant['user_id'],
+                    notification_type='point_received',
+                    title=f"{grant['points']}ポイントが付与されました",
+                    message=f"{source}から{grant['points']}ポイントが付与されました。\n{grant.get('description') or description}",
+                    priority='normal'
+                )
+                for grant in grants
+            ], batch_size=1000)
+        
+        return ledger_rows
+    
     @transaction.atomic
     def process_store_payment(self, customer: User, store: Store, points: int, 
-                            description: str = "", processed_by: User = None):
+                            description: str = "", processed_by: User = None,
+                            reference_id: str = ""):
         """店舗でのポイント決済処理"""
         try:
             if points <= 0:
                 raise ValidationError("消費ポイントは1以上である必要があります")
             
-            # ポイント消費
-            consumed_points = customer.consume_points(
-                points=points,
-                description=description or f"店舗決済: {store.name}で{points}pt使用"
+            # ポイント消費（店舗・処理者を含めて取引履歴を直接作成）
+            _, point_transaction = customer.record_point_consumption(
+                points,
+                description=description or f"店舗決済: {store.name}で{points}pt使用",
+                store=store,
+                processed_by=processed_by,
+                reference_id=reference_id
             )
             
-            # 取引履歴にstore情報を追加
-            latest_transaction = PointTransaction.objects.filter(
-                user=customer,
-                transaction_type='payment'
-            ).latest('created_at')
-            latest_transaction.store = store
-            latest_transaction.processed_by = processed_by
-            latest_transaction.save()
-            
             logger.info(f"Store payment processed: {customer.username} -{points}pt at {store.name}")
-            return latest_transaction
+            return point_transaction
             
         except Exception as e:
             logger.error(f"Failed to process store payment: {str(e)}")
@@ -179,38 +355,241 @@ class PointService:
             logger.error(f"Failed to execute point transfer: {str(e)}")
             raise
     
-    def check_expired_points(self):
-        """期限切れポイントをチェックして無効化"""
+    def execute_pending_transfers_in_batches(self, batch_size: int = 500, limit: int = None,
+                                             progress_callback=None):
+        """保留中のポイント転送をID順のバッチでまとめて実行
+        
+        バッチごとに関係ユーザーを主キー順でロックし、残高判定をメモリ上で行ってから
+        ロット・取引履歴・残高・転送ステータス・通知を集合演算で書き込む。
+        progress_callback にはバッチごとの集計（dict）が渡される。
+        """
+        totals = {'batches': 0, 'transfers': 0, 'completed': 0, 'failed': 0, 'elapsed': 0.0}
+        last_id = 0
+        
+        while limit is None or totals['transfers'] < limit:
+            size = batch_size if limit is None else min(batch_size, limit - totals['transfers'])
+            batch = self._execute_transfer_batch(last_id, size)
+            if batch is None:
+                break
+            
+            last_id = batch['last_id']
+            totals['batches'] += 1
+            for key in ('transfers', 'completed', 'failed', 'elapsed'):
+                totals[key] += batch[key]
+            
+            if progress_callback:
+                progress_callback(batch)
+        
+        totals['per_second'] = round(totals['transfers'] / totals['elapsed'], 1) if totals['elapsed'] else 0
+        logger.info(
+            f"Pending point transfers executed: {totals['completed']} completed, "
+            f"{totals['failed']} failed in {totals['batches']} batches ({totals['per_second']} transfers/s)"
+        )
+        return totals
+    
+    @transaction.atomic
+    def _execute_transfer_batch(self, after_id, batch_size):
+        """1バッチ分の保留中転送を実行し、バッチの集計を返す（対象がなければNone）"""
+        from datetime import timedelta
+        from .rank_service import rank_service
+        
+        started = time.monotonic()
+        
+        # 並行実行中の他の実行者が処理中の転送は飛ばす
+        transfers = list(
+            PointTransfer.objects.select_for_update(skip_locked=True).filter(
+                status='pending', pk__gt=after_id
+            ).order_by('pk').values('id', 'sender_id', 'recipient_id', 'points', 'transfer_fee')[:batch_size]
+        )
+        if not transfers:
+            return None
+        
+        # 送信者・受信者を主キー順でロック（通常の付与・消費処理とロック順序を揃える）
+        user_ids = sorted({t['sender_id'] for t in transfers} | {t['recipient_id'] for t in transfers})
+        states = {
+            user_id: {'balance': balance, 'lifetime': lifetime, 'rank_id': rank_id, 'username': username}
+            for user_id, balance, lifetime, rank_id, username in User.objects.select_for_update().filter(
+                pk__in=user_ids
+            ).order_by('pk').values_list(
+                'pk', 'stored_point_balance', 'lifetime_points_earned', 'rank_id', 'username'
+            )
+        }
+        
+        # 送信者の有効ロットを期限順でロック（消費はFIFO）
+        sender_ids = sorted({t['sender_id'] for t in transfers})
+        sender_lots = defaultdict(list)
+        for lot_id, user_id, lot_points in UserPoint.objects.select_for_update().filter(
+            user_id__in=sender_ids, is_expired=False
+        ).order_by('user_id', 'expiry_date', 'id').values_list('id', 'user_id', 'points').iterator(chunk_size=2000):
+            sender_lots[user_id].append([lot_id, lot_points])
+        lot_available = {
+            user_id: sum(lot[1] for lot in lots) for user_id, lots in sender_lots.items()
+        }
+        
+        now = timezone.now()
+        expiry_date = now + timedelta(days=30 * 6)
+        completed = []
+        failed_ids = []
+        debits = defaultdict(int)
+        credit_lots = defaultdict(list)  # 受信者ごとのバッチ内で作成するロット [ポイント, ...]
+        ledger_rows = []
+        
+        for transfer in transfers:
+            sender = states[transfer['sender_id']]
+            recipient = states[transfer['recipient_id']]
+            total_cost = transfer['points'] + int(transfer['transfer_fee'])
+            available = lot_available.get(transfer['sender_id'], 0) + sum(credit_lots[transfer['sender_id']])
+            if sender['balance'] < total_cost or available - debits[transfer['sender_id']] < total_cost:
+                failed_ids.append(transfer['id'])
+                continue
+            
+            debits[transfer['sender_id']] += total_cost
+            sender['balance'] -= total_cost
+            ledger_rows.append(PointTransaction(
+                user_id=transfer['sender_id'],
+                points=-total_cost,
+                transaction_type='transfer_out',
+                description=(
+                    f"ポイント転送: {recipient['username']}へ{transfer['points']}pt"
+                    f"（手数料{transfer['transfer_fee']}pt）"
+                ),
+                balance_before=sender['balance'] + total_cost,
+                balance_after=sender['balance'],
+                reference_id=f"transfer:{transfer['id']}"
+            ))
+            
+            recipient['balance'] += transfer['points']
+            recipient['lifetime'] += transfer['points']
+            credit_lots[transfer['recipient_id']].append(transfer['points'])
+            ledger_rows.append(PointTransaction(
+                user_id=transfer['recipient_id'],
+                points=transfer['points'],
+                transaction_type='grant',
+                description=f"ポイント受取: {sender['username']}から{transfer['points']}pt",
+                balance_before=recipient['balance'] - transfer['points'],
+                balance_after=recipient['balance'],
+                reference_id=f"transfer:{transfer['id']}"
+            ))
+            completed.append(transfer)
+        
+        # 送信者ごとの消費額を既存ロットからFIFOで差し引き、不足分はバッチ内の受取ロットから差し引く
+        fully_consumed_ids = []
+        partial_lots = []
+        for user_id, remaining in debits.items():
+            for lot_id, lot_points in sender_lots.get(user_id, []):
+                if remaining <= 0:
+                    break
+                if lot_points <= remaining:
+                    fully_consumed_ids.append(lot_id)
+                    remaining -= lot_points
+                else:
+                    partial_lots.append(UserPoint(pk=lot_id, points=lot_points - remaining))
+                    remaining = 0
+            new_lots = credit_lots[user_id]
+            for index, lot_points in enumerate(new_lots):
+                if remaining <= 0:
+                    break
+                used = min(lot_points, remaining)
+                new_lots[index] -= used
+                remaining -= used
+        
+        if fully_consumed_ids:
+            UserPoint.objects.filter(pk__in=fully_consumed_ids).delete()
+        if partial_lots:
+            UserPoint.objects.bulk_update(partial_lots, ['points'], batch_size=1000)
+        UserPoint.objects.bulk_create([
+            UserPoint(user_id=user_id, points=lot_points, expiry_date=expiry_date)
+            for user_id, new_lots in credit_lots.items()
+            for lot_points in new_lots if lot_points > 0
+        ], batch_size=1000)
+        PointTransaction.objects.bulk_create(ledger_rows, batch_size=1000)
+        
+        changed_ids = set(debits) | {t['recipient_id'] for t in completed}
+        User.objects.bulk_update(
+            [
+                User(pk=user_id, stored_point_balance=states[user_id]['balance'],
+                     lifetime_points_earned=states[user_id]['lifetime'])
+                for user_id in changed_ids
+            ],
+            ['stored_point_balance', 'lifetime_points_earned'],
+            batch_size=1000
+        )
+        self.invalidate_point_summary(*changed_ids)
+        
+        if completed:
+            PointTransfer.objects.filter(pk__in=[t['id'] for t in completed]).update(
+                status='completed', processed_at=now
+            )
+        if failed_ids:
+            PointTransfer.objects.filter(pk__in=failed_ids).update(status='failed')
+        
+        # ランク判定（受信者のみ累計ポイントが増える）
+        rank_service.evaluate_users_bulk({
+            t['recipient_id']: (states[t['recipient_id']]['lifetime'], states[t['recipient_id']]['rank_id'])
+            for t in completed
+        })
+        
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=t['recipient_id'],
+                notification_type='point_received',
+                title='ポイントを受け取りました',
+                message=f"{states[t['sender_id']]['username']}さんから{t['points']}ポイントを受け取りました。",
+                priority='normal'
+            )
+            for t in completed
+        ], batch_size=1000)
+        
+        elapsed = time.monotonic() - started
+        return {
+            'last_id': transfers[-1]['id'],
+            'transfers': len(transfers),
+            'completed': len(completed),
+            'failed': len(failed_ids),
+            'elapsed': elapsed,
+            'per_second': round(len(transfers) / elapsed, 1) if elapsed else 0,
+        }
+    
+    def check_expired_points(self, user_ids=None):
+        """期限切れポイントをチェックして無効化（user_ids 指定時はそのユーザーのロットのみ）"""
         try:
             expired_points = UserPoint.objects.filter(
                 expiry_date__lt=timezone.now(),
                 is_expired=False
             )
+            if user_ids is not None:
+                expired_points = expired_points.filter(user_id__in=user_ids)
             
             expired_count = 0
-            for user_point in expired_points:
-                # 失効ポイントの取引履歴記録
-                PointTransaction.objects.create(
-                    user=user_point.user,
-                    points=-user_point.points,
-                    transaction_type='expire',
-                    description=f"ポイント失効: {user_point.points}pt（期限: {user_point.expiry_date}）",
-                    balance_before=user_point.user.point_balance,
-                    balance_after=user_point.user.point_balance - user_point.points
-                )
-                
-                # 失効通知
-                Notification.objects.create(
-                    user=user_point.user,
-                    notification_type='system',
-                    title='ポイントが失効しました',
-                    message=f'{user_point.points}ポイントが有効期限切れで失効しました。',
-                    priority='normal'
-                )
-                
-                # ポイント無効化
-                user_point.is_expired = True
-                user_point.save()
+            for user_point in expired_points.select_related('user'):
+                with transaction.atomic():
+                    # ポイント無効化（並行実行時の二重失効を防止）
+                    updated = UserPoint.objects.filter(
+                        pk=user_point.pk, is_expired=False
+                    ).update(is_expired=True)
+                    if not updated:
+                        continue
+                    
+                    balance_before, balance_after = user_point.user.apply_point_delta(-user_point.points)
+                    
+                    # 失効ポイントの取引履歴記録
+                    PointTransaction.objects.create(
+                        user=user_point.user,
+                        points=-user_point.points,
+                        transaction_type='expire',
+                        description=f"ポイント失効: {user_point.points}pt（期限: {user_point.expiry_date}）",
+                        balance_before=balance_before,
+                        balance_after=balance_after
+                    )
+                    
+                    # 失効通知
+                    Notification.objects.create(
+                        user=user_point.user,
+                        notification_type='system',
+                        title='ポイントが失効しました',
+                        message=f'{user_point.points}ポイントが有効期限切れで失効しました。',
+                        priority='normal'
+                    )
                 expired_count += 1
             
             logger.info(f"Expired points processed: {expired_count} point records")
@@ -220,60 +599,254 @@ class PointService:
             logger.error(f"Failed to check expired points: {str(e)}")
             raise
     
-    def get_user_point_summary(self, user: User):
-        """ユーザーのポイント詳細情報を取得"""
-        try:
-            # 有効ポイント
-            valid_points = user.user_points.filter(is_expired=False)
-            total_valid = valid_points.aggregate(total=Sum('points'))['total'] or 0
-            
-            # 近日失効予定ポイント（30日以内）
-            soon_expire_date = timezone.now() + timezone.timedelta(days=30)
-            soon_expire_points = valid_points.filter(
-                expiry_date__lte=soon_expire_date
-            ).aggregate(total=Sum('points'))['total'] or 0
-            
-            # 今月の取引統計
-            month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            month_transactions = PointTransaction.objects.filter(
-                user=user,
-                created_at__gte=month_start
+    def expire_points_in_batches(self, chunk_size: int = 500, resume: bool = True,
+                                 progress_callback=None):
+        """期限切れポイントをユーザー単位のチャンクで一括失効
+        
+        ユーザーIDのキーセットページングでチャンクを切り出し、チャンクごとに
+        ロット更新・取引履歴・通知を一括書き込みする。進捗はPointExpiryRunに
+        チャンクと同一トランザクションで記録されるため、中断後は続きから再開できる。
+        """
+        run = None
+        if resume:
+            run = PointExpiryRun.objects.filter(status='running').order_by('-started_at').first()
+        else:
+            # 再開しない場合、中断中の実行は破棄扱いにする
+            PointExpiryRun.objects.filter(status='running').update(
+                status='failed', finished_at=timezone.now()
             )
+        if run is None:
+            run = PointExpiryRun.objects.create(cutoff=timezone.now())
+        else:
+            logger.info(f"Resuming point expiry run {run.id} after user {run.last_user_id}")
+        
+        try:
+            while True:
+                user_ids = list(
+                    UserPoint.objects.filter(
+                        expiry_date__lt=run.cutoff,
+                        is_expired=False,
+                        user_id__gt=run.last_user_id
+                    ).order_by('user_id').values_list('user_id', flat=True).distinct()[:chunk_size]
+                )
+                if not user_ids:
+                    break
+                
+                self._expire_user_chunk(run, user_ids)
+                
+                if progress_callback:
+                    progress_callback(run)
             
-            month_granted = month_transactions.filter(
-                transaction_type__in=['grant', 'bonus'],
-                points__gt=0
-            ).aggregate(total=Sum('points'))['total'] or 0
+            run.status = 'completed'
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'finished_at', 'updated_at'])
             
-            month_used = abs(month_transactions.filter(
-                transaction_type__in=['payment', 'transfer_out'],
-                points__lt=0
-            ).aggregate(total=Sum('points'))['total'] or 0)
+            logger.info(
+                f"Point expiry run {run.id} completed: {run.lots_expired} lots, "
+                f"{run.points_expired}pt, {run.users_processed} users, {run.lots_per_second} lots/s"
+            )
+            return run
             
+        except Exception as e:
+            # 実行中のまま残し、次回は最終チェックポイントから再開する
+            PointExpiryRun.objects.filter(pk=run.pk).update(error_message=str(e))
+            logger.error(f"Point expiry run {run.id} interrupted: {str(e)}")
+            raise
+    
+    @transaction.atomic
+    def _expire_user_chunk(self, run: PointExpiryRun, user_ids):
+        """1チャンク分のユーザーの期限切れロットを一括失効"""
+        started = time.monotonic()
+        
+        # ユーザー行 → ロットの順でロックし、通常の付与・消費処理と順序を揃える
+        balances = dict(
+            User.objects.select_for_update().filter(pk__in=user_ids)
+            .order_by('pk').values_list('pk', 'stored_point_balance')
+        )
+        lots = list(
+            UserPoint.objects.select_for_update().filter(
+                user_id__in=user_ids,
+                expiry_date__lt=run.cutoff,
+                is_expired=False
+            ).order_by('user_id', 'expiry_date', 'id').values_list('id', 'user_id', 'points', 'expiry_date')
+        )
+        
+        UserPoint.objects.filter(pk__in=[lot[0] for lot in lots]).update(is_expired=True)
+        
+        ledger_rows = []
+        expired_by_user = defaultdict(int)
+        for lot_id, user_id, points, expiry_date in lots:
+            balance_before = balances[user_id]
+            balance_after = balance_before - points
+            balances[user_id] = balance_after
+            expired_by_user[user_id] += points
+            
+            ledger_rows.append(PointTransaction(
+                user_id=user_id,
+                points=-points,
+                transaction_type='expire',
+                description=f"ポイント失効: {points}pt（期限: {expiry_date}）",
+                balance_before=balance_before,
+                balance_after=balance_after
+            ))
+        
+        PointTransaction.objects.bulk_create(ledger_rows, batch_size=1000)
+        
+        # 保存済み残高を一括更新
+        users = [
+            User(pk=user_id, stored_point_balance=balances[user_id])
+            for user_id in expired_by_user
+        ]
+        User.objects.bulk_update(users, ['stored_point_balance'], batch_size=1000)
+        self.invalidate_point_summary(*expired_by_user.keys())
+        
+        # 失効通知はユーザーごとに1件へ集約
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                notification_type='system',
+                title='ポイントが失効しました',
+                message=f'{points}ポイントが有効期限切れで失効しました。',
+                priority='normal'
+            )
+            for user_id, points in expired_by_user.items()
+        ], batch_size=1000)
+        
+        # チェックポイントを同一トランザクションで記録
+        run.last_user_id = user_ids[-1]
+        run.chunks_processed += 1
+        run.users_processed += len(expired_by_user)
+        run.lots_expired += len(lots)
+        run.points_expired += sum(expired_by_user.values())
+        run.save(update_fields=[
+            'last_user_id', 'chunks_processed', 'users_processed',
+            'lots_expired', 'points_expired', 'updated_at'
+        ])
+        
+        logger.debug(
+            f"Point expiry chunk: {len(lots)} lots / {len(expired_by_user)} users "
+            f"in {int((time.monotonic() - started) * 1000)}ms"
+        )
+    
+    SUMMARY_CACHE_KEY = 'point_summary:{user_id}'
+    
+    def invalidate_point_summary(self, *user_ids):
+        """ポイントサマリーのキャッシュを無効化
+        
+        台帳書き込みと同じトランザクション内から呼ばれるため、即時に加えてコミット後にも削除し、
+        コミット前の値が他リクエストによって再キャッシュされるのを防ぐ。
+        """
+        keys = [self.SUMMARY_CACHE_KEY.format(user_id=user_id) for user_id in user_ids]
+        if not keys:
+            return
+        
+        def delete_keys():
+            try:
+                cache.delete_many(keys)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate point summary cache: {str(e)}")
+        
+        delete_keys()
+        transaction.on_commit(delete_keys)
+    
+    def get_user_point_summary(self, user: User):
+        """ユーザーのポイント詳細情報を取得
+        
+        有効ロット一覧と今月の付与・利用合計を1クエリで読み出してキャッシュし、
+        近日失効ポイントや残り日数など時刻に依存する値は読み出し時に算出する。
+        期限切れ未処理のロット（日次バッチ実行前）は書き込みを行わずに集計から除き、
+        失効の記録は expire_points に任せる。
+        """
+        try:
+            now = timezone.now()
+            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            cache_key = self.SUMMARY_CACHE_KEY.format(user_id=user.pk)
+            
+            summary = cache.get(cache_key)
+            if summary is None or summary['month'] != month_start.isoformat():
+                summary = self._load_point_summary(user.pk, month_start)
+                cache.set(cache_key, summary, self.summary_cache_timeout)
+            
+            lots = []
+            for lot in summary['lots']:
+                # 有効期限のないロットは失効しない
+                expiry_date = datetime.fromisoformat(lot['expiry_date']) if lot['expiry_date'] else None
+                if expiry_date is not None and expiry_date < now:
+                    continue
+                lots.append({
+                    'id': lot['id'],
+                    'points': lot['points'],
+                    'expiry_date': expiry_date,
+                    'created_at': datetime.fromisoformat(lot['created_at']),
+                    'days_until_expiry': (expiry_date - now).days if expiry_date else None,
+                })
+            
+            soon_expire_date = now + timezone.timedelta(days=self.soon_expire_days)
+            
+            from .rank_service import rank_service
             return {
-                'total_balance': total_valid,
-                'soon_expire_points': soon_expire_points,
+                'total_balance': sum(lot['points'] for lot in lots),
+                'soon_expire_points': sum(
+                    lot['points'] for lot in lots
+                    if lot['expiry_date'] is not None and lot['expiry_date'] <= soon_expire_date
+                ),
                 'soon_expire_date': soon_expire_date,
-                'current_rank': user.rank,
+                'current_rank': rank_service.rank_name(user.rank_id),
                 'month_stats': {
-                    'granted': month_granted,
-                    'used': month_used,
-                    'net': month_granted - month_used
+                    'granted': summary['month_granted'],
+                    'used': summary['month_used'],
+                    'net': summary['month_granted'] - summary['month_used']
                 },
-                'point_details': [
-                    {
-                        'points': up.points,
-                        'expiry_date': up.expiry_date,
-                        'created_at': up.created_at,
-                        'days_until_expiry': (up.expiry_date - timezone.now()).days if up.expiry_date else None
-                    }
-                    for up in valid_points.order_by('expiry_date')
-                ]
+                'point_details': lots
             }
             
         except Exception as e:
             logger.error(f"Failed to get user point summary: {str(e)}")
             raise
+    
+    def _load_point_summary(self, user_id, month_start):
+        """有効ロットと今月の取引集計を1クエリで取得し、キャッシュ可能な形式で返す"""
+        def month_total(transaction_types, points_filter):
+            return Coalesce(Subquery(
+                PointTransaction.objects.filter(
+                    user=OuterRef('pk'),
+                    created_at__gte=month_start,
+                    transaction_type__in=transaction_types,
+                    **points_filter
+                ).order_by().values('user').annotate(total=Sum('points')).values('total')[:1],
+                output_field=IntegerField()
+            ), Value(0))
+        
+        # 有効ロットをLEFT JOINし、ロットごとの行に今月の集計を添えて取得
+        rows = list(
+            User.objects.filter(pk=user_id).annotate(
+                valid_lot=FilteredRelation(
+                    'user_points', condition=Q(user_points__is_expired=False)
+                ),
+                month_granted=month_total(['grant', 'bonus'], {'points__gt': 0}),
+                month_used=month_total(['payment', 'transfer_out'], {'points__lt': 0}),
+            ).order_by('valid_lot__expiry_date', 'valid_lot__id').values_list(
+                'month_granted', 'month_used',
+                'valid_lot__id', 'valid_lot__points', 'valid_lot__expiry_date', 'valid_lot__created_at'
+            )
+        )
+        
+        month_granted, month_used = (rows[0][0], rows[0][1]) if rows else (0, 0)
+        return {
+            'month': month_start.isoformat(),
+            'month_granted': month_granted,
+            'month_used': abs(month_used),
+            'lots': [
+                {
+                    'id': lot_id,
+                    'points': points,
+                    'expiry_date': expiry_date.isoformat() if expiry_date else None,
+                    'created_at': created_at.isoformat(),
+                }
+                for _, _, lot_id, points, expiry_date, created_at in rows
+                if lot_id is not None
+            ]
+        }
 
 
 # グローバルインスタンス
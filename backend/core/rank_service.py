@@ -0,0 +1,202 @@
+from django.core.cache import cache
+from django.db import transaction
+from bisect import bisect_right
+import logging
+import threading
+import time
+
+from .models import User, UserRank, Notification
+
+logger = logging.getLogger(__name__)
+
+
+class RankService:
+    """会員ランク判定サービス
+
+    ランク閾値（UserRank.required_points）をプロセス内のソート済みテーブルに保持し、
+    累計獲得ポイント（User.lifetime_points_earned）から二分探索でランクを決定する。
+    UserRankの変更時は共有キャッシュのバージョンを更新し、各プロセスのテーブルを無効化する。
+    """
+
+    VERSION_CACHE_KEY = 'rank_table_version'
+
+    def __init__(self):
+        self.version_check_interval = 30  # 共有バージョン確認間隔（秒）
+        self.update_batch_size = 1000  # 一括更新1クエリあたりの件数
+        self._lock = threading.Lock()
+        self._thresholds = None  # [required_points, ...] 昇順
+        self._ranks = None  # [(rank_id, rank_name), ...] thresholdsと同順
+        self._version = None
+        self._checked_at = 0.0
+
+    def _shared_version(self):
+        try:
+            return cache.get(self.VERSION_CACHE_KEY, 0)
+        except Exception:
+            return 0
+
+    def _load_table(self):
+        rows = list(UserRank.objects.order_by('required_points', 'id').values_list(
+            'id', 'name', 'required_points'
+        ))
+        self._thresholds = [required for _, _, required in rows]
+        self._ranks = [(rank_id, name) for rank_id, name, _ in rows]
+
+    def _get_table(self):
+        """必要に応じて再読み込みした閾値テーブルを返す"""
+        now = time.monotonic()
+        with self._lock:
+            if self._thresholds is not None and now - self._checked_at < self.version_check_interval:
+                return self._thresholds, self._ranks
+
+            version = self._shared_version()
+            if self._thresholds is None or version != self._version:
+                self._load_table()
+                self._version = version
+            self._checked_at = now
+            return self._thresholds, self._ranks
+
+    def invalidate(self):
+        """閾値テーブルを無効化（全プロセスへ伝播）"""
+        with self._lock:
+            self._thresholds = None
+            self._ranks = None
+        try:
+            cache.set(self.VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+        except Exception as e:
+            logger.warning(f"Failed to publish rank table version: {str(e)}")
+
+    def rank_for_points(self, lifetime_points: int):
+        """累計ポイントに対応する (rank_id, rank_name) を返す（該当なしはNone）"""
+        thresholds, ranks = self._get_table()
+        index = bisect_right(thresholds, lifetime_points) - 1
+        if index < 0:
+            return None
+        return ranks[index]
+
+    def rank_name(self, rank_id):
+        """ランクIDから表示名を取得"""
+        if rank_id is None:
+            return None
+        _, ranks = self._get_table()
+        for candidate_id, name in ranks:
+            if candidate_id == rank_id:
+                return name
+        return None
+
+    def _rank_order(self):
+        """ランクIDごとの閾値の順位（閾値の低い順に0から）"""
+        _, ranks = self._get_table()
+        return {rank_id: index for index, (rank_id, _) in enumerate(ranks)}
+
+    def _promotion_notification(self, user_id, old_rank_id, new_rank_name):
+        """ランクアップ通知（ランクが未設定・削除済みの場合は変更前のランク名を含めない）"""
+        old_rank_name = self.rank_name(old_rank_id)
+        if old_rank_name:
+            message = f'おめでとうございます！{old_rank_name}から{new_rank_name}にランクアップしました！'
+        else:
+            message = f'おめでとうございます！{new_rank_name}にランクアップしました！'
+        return Notification(
+            user_id=user_id,
+            notification_type='system',
+            title='ランクアップ！',
+            message=message,
+            priority='high'
+        )
+
+    def evaluate_user(self, user: User):
+        """ユーザーのランクを累計ポイントから判定し、変更があれば更新（昇格時のみ通知）"""
+        suitable = self.rank_for_points(user.lifetime_points_earned)
+        if suitable is None or suitable[0] == user.rank_id:
+            return False
+
+        old_rank_id = user.rank_id
+        new_rank_id, new_rank_name = suitable
+
+        User.objects.filter(pk=user.pk).update(rank_id=new_rank_id)
+        user.rank_id = new_rank_id
+
+        # ランクアップ通知（閾値の変更などによる降格は通知しない）
+        rank_order = self._rank_order()
+        if rank_order.get(old_rank_id, -1) < rank_order.get(new_rank_id, -1):
+            self._promotion_notification(user.pk, old_rank_id, new_rank_name).save()
+        return True
+
+    def evaluate_users_bulk(self, user_states):
+        """複数ユーザーのランクをまとめて判定・更新
+
+        user_states: {user_id: (lifetime_points_earned, current_rank_id)}
+        ランクごとに1回の一括更新と通知の一括作成を行い、更新件数を返す。
+        """
+        rank_order = self._rank_order()
+        promotions = {}
+
+        for user_id, (lifetime_points, current_rank_id) in user_states.items():
+            suitable = self.rank_for_points(lifetime_points)
+            if suitable is None or suitable[0] == current_rank_id:
+                continue
+            promotions.setdefault(suitable, []).append((user_id, current_rank_id))
+
+        for (rank_id, rank_name), changed in promotions.items():
+            changed_ids = [user_id for user_id, _ in changed]
+            for offset in range(0, len(changed_ids), self.update_batch_size):
+                User.objects.filter(
+                    pk__in=changed_ids[offset:offset + self.update_batch_size]
+                ).update(rank_id=rank_id)
+
+            # 通知は昇格したユーザーのみ
+            Notification.objects.bulk_create([
+                self._promotion_notification(user_id, old_rank_id, rank_name)
+                for user_id, old_rank_id in changed
+                if rank_order.get(old_rank_id, -1) < rank_order[rank_id]
+            ], batch_size=1000)
+
+        return sum(len(changed) for changed in promotions.values())
+
+    def bulk_rerank(self, dry_run: bool = False):
+        """全顧客のランクを集合演算で再計算
+
+        ランク帯ごとに「対象ID取得 → 一括更新」を行うため、クエリ数はランク数に比例し
+        ユーザー数には依存しない。戻り値は {ランク名: 更新件数}。
+        """
+        thresholds, ranks = self._get_table()
+        rank_order = {rank_id: index for index, (rank_id, _) in enumerate(ranks)}
+        customers = User.objects.filter(role='customer')
+        results = {}
+
+        with transaction.atomic():
+            for index, (rank_id, rank_name) in enumerate(ranks):
+                band = customers.filter(lifetime_points_earned__gte=thresholds[index])
+                if index + 1 < len(thresholds):
+                    band = band.filter(lifetime_points_earned__lt=thresholds[index + 1])
+                band = band.exclude(rank_id=rank_id)
+
+                if dry_run:
+                    results[rank_name] = band.count()
+                    continue
+
+                changed = list(band.values_list('id', 'rank_id'))
+                if not changed:
+                    results[rank_name] = 0
+                    continue
+
+                changed_ids = [user_id for user_id, _ in changed]
+                for offset in range(0, len(changed_ids), self.update_batch_size):
+                    User.objects.filter(
+                        pk__in=changed_ids[offset:offset + self.update_batch_size]
+                    ).update(rank_id=rank_id)
+
+                # 通知は昇格したユーザーのみ（閾値変更による降格は通知しない）
+                Notification.objects.bulk_create([
+                    self._promotion_notification(user_id, old_rank_id, rank_name)
+                    for user_id, old_rank_id in changed
+                    if rank_order.get(old_rank_id, -1) < index
+                ], batch_size=1000)
+                results[rank_name] = len(changed)
+
+        logger.info(f"Bulk rerank {'(dry run) ' if dry_run else ''}completed: {results}")
+        return results
+
+
+# グローバルインスタンス
+rank_service = RankService()
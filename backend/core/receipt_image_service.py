@@ -0,0 +1,224 @@
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.parsers import MultiPartParser
+from PIL import Image, ImageOps
+import hashlib
+import io
+import logging
+
+from .models import ReceiptImage, DuplicateDetection
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptHashUploadHandler(FileUploadHandler):
+    """受信中のチャンクから内容ハッシュ（SHA-256）を計算するアップロードハンドラー
+
+    データは後続のハンドラーにそのまま渡し、ファイルの保存は行わない。
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hashes = {}
+        self._hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.hashes[self.field_name] = self._hasher.hexdigest()
+        return None
+
+
+class ReceiptMultiPartParser(MultiPartParser):
+    """アップロードされたファイルに受信中に計算した内容ハッシュ（content_hash）を付与するパーサー"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        hash_handler = ReceiptHashUploadHandler(request._request)
+        request._request.upload_handlers.insert(0, hash_handler)
+
+        data_and_files = super().parse(stream, media_type, parser_context)
+        for field_name, uploaded in data_and_files.files.items():
+            uploaded.content_hash = hash_handler.hashes.get(field_name)
+        return data_and_files
+
+
+class ReceiptImageService:
+    """レシート画像の指紋（内容ハッシュ・知覚ハッシュ）による重複検知とサムネイル作成"""
+
+    HASH_SIZE = 8  # dHashの一辺（64bit）
+    BAND_FIELDS = ['phash_band_0', 'phash_band_1', 'phash_band_2', 'phash_band_3']
+
+    def __init__(self):
+        self.similar_distance = 3  # 類似とみなすハミング距離（バンド数未満であれば検索漏れはない）
+        self.candidate_limit = 50
+        self.thumbnail_size = (320, 320)
+        self.thumbnail_quality = 70
+        self.batch_size = 20
+        self.max_attempts = 3
+
+    # === 指紋 ===
+
+    def fingerprint(self, uploaded):
+        """アップロード画像の内容ハッシュ・知覚ハッシュ・サイズ
+
+        内容ハッシュは ReceiptMultiPartParser が受信中に計算したものを使い、
+        他の経路でアップロードされた場合のみファイルを読み直して計算する。
+        """
+        content_hash = getattr(uploaded, 'content_hash', None)
+        if not content_hash:
+            hasher = hashlib.sha256()
+            for chunk in uploaded.chunks():
+                hasher.update(chunk)
+            content_hash = hasher.hexdigest()
+
+        uploaded.seek(0)
+        perceptual_hash = self.perceptual_hash(uploaded)
+        uploaded.seek(0)
+        return {
+            'content_hash': content_hash,
+            'perceptual_hash': f'{perceptual_hash:016x}',
+            'file_size': uploaded.size or 0,
+        }
+
+    def perceptual_hash(self, fileobj):
+        """画像の64bit dHash（縮小したグレースケール画像の隣接画素の大小）"""
+        with Image.open(fileobj) as image:
+            # JPEGは縮小デコード（DCTスケーリング）で読み込み、全画素の展開を避ける
+            image.draft('L', (self.HASH_SIZE * 8, self.HASH_SIZE * 8))
+            pixels = image.convert('L').resize(
+                (self.HASH_SIZE + 1, self.HASH_SIZE), Image.Resampling.BILINEAR
+            ).tobytes()
+
+        value = 0
+        for row in range(self.HASH_SIZE):
+            offset = row * (self.HASH_SIZE + 1)
+            for column in range(self.HASH_SIZE):
+                value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+        return value
+
+    def bands(self, perceptual_hash):
+        value = int(perceptual_hash, 16)
+        return [(value >> (16 * band)) & 0xFFFF for band in range(len(self.BAND_FIELDS))]
+
+    # === 重複検知 ===
+
+    def find_matches(self, fingerprint):
+        """同一画像・類似画像の申請を [{'request_id', 'match', 'distance'}, ...] で返す（インデックス検索2回）
+
+        同一画像（内容ハッシュ）は件数によらずすべて返し、候補数の上限は知覚ハッシュの
+        バンドが一致した類似画像の候補にのみ適用する。
+        """
+        matches = [
+            {'request_id': request_id, 'match': 'exact', 'distance': 0}
+            for request_id in ReceiptImage.objects.filter(
+                content_hash=fingerprint['content_hash']
+            ).order_by('-id').values_list('ec_request_id', flat=True)
+        ]
+
+        any_band = Q()
+        for field, value in zip(self.BAND_FIELDS, self.bands(fingerprint['perceptual_hash'])):
+            any_band |= Q(**{field: value})
+        rows = ReceiptImage.objects.filter(any_band).exclude(
+            content_hash=fingerprint['content_hash']
+        ).order_by('-id').values_list('ec_request_id', 'perceptual_hash')[:self.candidate_limit]
+
+        perceptual_hash = int(fingerprint['perceptual_hash'], 16)
+        for request_id, other_hash in rows:
+            distance = bin(perceptual_hash ^ int(other_hash, 16)).count('1')
+            if distance <= self.similar_distance:
+                matches.append({'request_id': request_id, 'match': 'similar', 'distance': distance})
+        return sorted(matches, key=lambda match: match['distance'])
+
+    def register(self, ec_request, fingerprint, matches=()):
+        """申請の画像指紋を登録し、一致した画像を重複として記録（サムネイルはワーカーが作成）"""
+        record = ReceiptImage.objects.create(
+            ec_request=ec_request,
+            content_hash=fingerprint['content_hash'],
+            perceptual_hash=fingerprint['perceptual_hash'],
+            file_size=fingerprint['file_size'],
+            **dict(zip(self.BAND_FIELDS, self.bands(fingerprint['perceptual_hash'])))
+        )
+
+        DuplicateDetection.objects.bulk_create([
+            DuplicateDetection(
+                detection_type='image_match',
+                original_request_id=match['request_id'],
+                duplicate_request=ec_request,
+                detection_details={
+                    'match': match['match'],
+                    'hamming_distance': match['distance'],
+                    'content_hash': fingerprint['content_hash'],
+                },
+                severity='high' if match['match'] == 'exact' else 'medium'
+            )
+            for match in matches
+        ])
+        return record
+
+    # === サムネイル ===
+
+    def process_pending(self, batch_size=None):
+        """サムネイル作成待ちの画像を古い順に処理し、件数を返す"""
+        totals = {'completed': 0, 'retried': 0, 'failed': 0}
+        records = list(
+            ReceiptImage.objects.filter(thumbnail_status='pending').select_related('ec_request').order_by('id')[
+                :batch_size or self.batch_size
+            ]
+        )
+
+        for record in records:
+            try:
+                with transaction.atomic():
+                    self.create_thumbnail(record)
+                    record.thumbnail_status = 'completed'
+                    record.processed_at = timezone.now()
+                    record.save(update_fields=['thumbnail', 'thumbnail_status', 'processed_at'])
+                totals['completed'] += 1
+            except Exception as e:
+                record.attempts += 1
+                record.last_error = str(e)
+                if record.attempts >= self.max_attempts:
+                    record.thumbnail_status = 'failed'
+                    totals['failed'] += 1
+                    logger.error(f"Receipt thumbnail failed for request {record.ec_request_id}: {str(e)}")
+                else:
+                    totals['retried'] += 1
+                record.save(update_fields=['attempts', 'last_error', 'thumbnail_status'])
+        return totals
+
+    def drain(self, batch_size=None):
+        """作成待ちがなくなるまで処理し、件数の合計を返す"""
+        totals = {'completed': 0, 'retried': 0, 'failed': 0}
+        while True:
+            processed = self.process_pending(batch_size)
+            for key, value in processed.items():
+                totals[key] += value
+            if not processed['completed'] and not processed['failed']:
+                return totals
+
+    def create_thumbnail(self, record):
+        """承認画面用の縮小JPEGを作成して record.thumbnail に保存（record自体の保存は呼び出し側）"""
+        receipt_image = record.ec_request.receipt_image
+        with receipt_image.open('rb'), Image.open(receipt_image) as image:
+            image.draft('RGB', self.thumbnail_size)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail(self.thumbnail_size, Image.Resampling.LANCZOS)
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=self.thumbnail_quality, optimize=True)
+
+        record.thumbnail.save(f'{record.ec_request_id}.jpg', ContentFile(output.getvalue()), save=False)
+
+
+# グローバルインスタンス
+receipt_image_service = ReceiptImageService()
@@ -290,7 +290,7 @@ class DetailedReviewViewSet(viewsets.ModelViewSet):
             
             # ユーザーの最終活動日時を更新
             request.user.last_active_at = timezone.now()
-            request.user.save()
+            request.user.save(update_fields=['last_active_at'])
             
             # 店舗の評価情報を更新
             self.update_store_ratings(review.store)
@@ -353,7 +353,7 @@ class DetailedReviewViewSet(viewsets.ModelViewSet):
         
         # ユーザーのレビュー数をデクリメント
         request.user.reviews_count = max(0, request.user.reviews_count - 1)
-        request.user.save()
+        request.user.save(update_fields=['reviews_count'])
         
         # 店舗の評価情報を更新
         self.update_store_ratings(instance.store)
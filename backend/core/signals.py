@@ -1,9 +1,9 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
 import logging
 
-from .models import Store, User, Notification
+from .models import Store, User, Notification, UserRank, ECPointRequest, StoreWebhookKey
 from .email_service import send_store_registration_notification, send_store_status_notification
 
 logger = logging.getLogger(__name__)
@@ -36,6 +36,12 @@ def handle_store_status_change(sender, instance, **kwargs):
                 transaction.on_commit(
                     lambda: send_store_status_notification(instance, instance.status)
                 )
+            
+            # Webhookキーのキャッシュは店舗のステータス・店舗名を保持するため無効化
+            if old_instance.status != instance.status or old_instance.name != instance.name:
+                from .webhook_key_service import webhook_key_service
+                webhook_key_service.invalidate()
+                transaction.on_commit(webhook_key_service.invalidate)
                 
         except Store.DoesNotExist:
             pass
@@ -55,4 +61,75 @@ def handle_user_creation(sender, instance, created, **kwargs):
             message='biid Store店舗管理システムへのご登録ありがとうございます。店舗運営を成功させるためのツールをご活用ください。',
             email_template='store_manager_welcome',
             priority='normal'
-        )
\ No newline at end of file
+        )
+
+
+@receiver(post_save, sender=UserRank)
+@receiver(post_delete, sender=UserRank)
+def invalidate_rank_table(sender, instance, **kwargs):
+    """ランク設定変更時に閾値テーブルを無効化"""
+    from .rank_service import rank_service
+    rank_service.invalidate()
+    # コミット前に他スレッドが旧設定を読み込んだ場合に備え、コミット後にも無効化
+    transaction.on_commit(rank_service.invalidate)
+
+
+@receiver(post_save, sender=StoreWebhookKey)
+@receiver(post_delete, sender=StoreWebhookKey)
+def invalidate_webhook_keys(sender, instance, update_fields=None, **kwargs):
+    """Webhookキーの発行・再発行・無効化・削除時にキャッシュを無効化"""
+    if update_fields and set(update_fields) == {'last_used_at'}:
+        return
+    from .webhook_key_service import webhook_key_service
+    webhook_key_service.invalidate()
+    # コミット前に他スレッドが旧キーを読み込んだ場合に備え、コミット後にも無効化
+    transaction.on_commit(webhook_key_service.invalidate)
+
+
+@receiver(post_save, sender=ECPointRequest)
+def index_ec_request(sender, instance, created, **kwargs):
+    """EC申請作成時に不審パターン判定用のカウンターと注文ID類似検索インデックスを更新（ロールバック時は更新しない）"""
+    if created:
+        from .velocity_counter_service import velocity_counter_service
+        from .order_id_index_service import order_id_index_service
+
+        def on_commit():
+            # コミット後の失敗で申請作成のレスポンスをエラーにしない
+            try:
+                velocity_counter_service.record_request(instance)
+            except Exception as e:
+                logger.error(f"Failed to record velocity counters for EC request {instance.id}: {str(e)}")
+            try:
+                order_id_index_service.add(instance.store_id, instance.order_id, instance.created_at)
+            except Exception as e:
+                # 登録できなかった注文IDは rebuild_order_id_index で再登録される
+                logger.error(f"Failed to index order ID for EC request {instance.id}: {str(e)}")
+
+        transaction.on_commit(on_commit)
+
+
+@receiver(pre_save, sender=ECPointRequest)
+def snapshot_ec_request_stats(sender, instance, raw=False, **kwargs):
+    """EC申請の保存前の集計上の状態を記録（日次集計の差分更新用）"""
+    if raw:
+        return
+    from .ec_stats_service import ec_stats_service
+    instance._stats_before = ec_stats_service.fetch_snapshot(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=ECPointRequest)
+def update_ec_request_stats(sender, instance, raw=False, **kwargs):
+    """EC申請の作成・状態変更を日次集計に反映（申請の保存と同じトランザクションで更新）"""
+    if raw:
+        return
+    from .ec_stats_service import ec_stats_service
+    ec_stats_service.record_changes([
+        (getattr(instance, '_stats_before', None), ec_stats_service.snapshot(instance))
+    ])
+
+
+@receiver(post_delete, sender=ECPointRequest)
+def remove_ec_request_stats(sender, instance, **kwargs):
+    """削除したEC申請を日次集計から除外"""
+    from .ec_stats_service import ec_stats_service
+    ec_stats_service.record_changes([(ec_stats_service.snapshot(instance), None)])
@@ -0,0 +1,114 @@
+from django.db.models import Q, Exists, OuterRef
+from django.utils.dateparse import parse_datetime
+import base64
+import logging
+
+from .social_models import SocialPost, SocialPostLike, SocialPostShare, Friendship, UserBlock
+
+logger = logging.getLogger(__name__)
+
+
+class SocialFeedService:
+    """ソーシャル投稿の表示範囲の判定（SQL）とカーソル（作成日時・ID）によるページ送り
+
+    公開範囲（public / friends / limited / private）とブロック関係をすべてサブクエリで表現するため、
+    投稿をPythonに読み込んで判定する必要はなく、1ページの取得コストは投稿の総数ではなく
+    ページサイズに比例する。
+    """
+
+    def __init__(self):
+        self.default_page_size = 20
+        self.max_page_size = 100
+
+    def _relations(self, viewer):
+        """投稿者・投稿と viewer の関係（フレンド・閲覧許可・ブロック）のサブクエリ"""
+        author = OuterRef('author_id')
+        return {
+            'is_friend': Exists(Friendship.objects.filter(
+                Q(from_user_id=viewer.id, to_user_id=author) | Q(from_user_id=author, to_user_id=viewer.id),
+                status='accepted'
+            )),
+            'is_allowed': Exists(SocialPost.allowed_users.through.objects.filter(
+                socialpost_id=OuterRef('pk'), user_id=viewer.id
+            )),
+            'is_blocked': Exists(UserBlock.objects.filter(
+                Q(blocker_id=viewer.id, blocked_id=author) | Q(blocker_id=author, blocked_id=viewer.id)
+            )),
+        }
+
+    def visible_posts(self, viewer):
+        """viewer が閲覧できる未削除の投稿（新しい順）"""
+        relations = self._relations(viewer)
+        return SocialPost.objects.filter(
+            Q(author_id=viewer.id)
+            | Q(visibility='public')
+            | (Q(visibility='friends') & relations['is_friend'])
+            | (Q(visibility='limited') & relations['is_allowed']),
+            ~relations['is_blocked'],
+            is_deleted=False
+        ).select_related('author', 'location').order_by('-created_at', '-id')
+
+    def home_posts(self, viewer):
+        """viewer のホームタイムラインの投稿（自分・フレンドの投稿と、閲覧を許可された制限公開の投稿）"""
+        relations = self._relations(viewer)
+        return SocialPost.objects.filter(
+            Q(author_id=viewer.id)
+            | (Q(visibility__in=['public', 'friends']) & relations['is_friend'])
+            | (Q(visibility='limited') & relations['is_allowed']),
+            ~relations['is_blocked'],
+            is_deleted=False
+        ).select_related('author', 'location').order_by('-created_at', '-id')
+
+    def with_viewer_flags(self, queryset, viewer):
+        """シリアライザーが投稿ごとに問い合わせないよう、いいね・シェア済みかを付与"""
+        return queryset.annotate(
+            viewer_liked=Exists(SocialPostLike.objects.filter(post_id=OuterRef('pk'), user_id=viewer.id)),
+            viewer_shared=Exists(SocialPostShare.objects.filter(post_id=OuterRef('pk'), user_id=viewer.id)),
+        )
+
+    # === カーソル ===
+
+    def encode_cursor(self, post):
+        return self.make_cursor(post.created_at, post.id)
+
+    def make_cursor(self, created_at, post_id):
+        value = f'{created_at.isoformat()}|{post_id}'
+        return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
+
+    def clamp_page_size(self, page_size):
+        return min(max(int(page_size or self.default_page_size), 1), self.max_page_size)
+
+    def decode_cursor(self, cursor):
+        """カーソルを (作成日時, ID) に戻す（不正な場合は ValueError）"""
+        try:
+            created_at, post_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            post_id = int(post_id)
+        except Exception:
+            raise ValueError('無効なカーソルです')
+        if created_at is None:
+            raise ValueError('無効なカーソルです')
+        return created_at, post_id
+
+    def page(self, queryset, cursor=None, page_size=None):
+        """カーソル以降の1ページを取得し、(投稿のリスト, 次ページのカーソル) を返す
+
+        queryset は visible_posts の並び順（作成日時・IDの降順）である必要がある。
+        """
+        page_size = self.clamp_page_size(page_size)
+        if cursor:
+            created_at, post_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id)
+            )
+
+        # 1件多く取得して次ページの有無を判定
+        posts = list(queryset[:page_size + 1])
+        if len(posts) > page_size:
+            posts = posts[:page_size]
+            return posts, self.encode_cursor(posts[-1])
+        return posts, None
+
+
+# グローバルインスタンス
+social_feed_service = SocialFeedService()
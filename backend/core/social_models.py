@@ -276,8 +276,8 @@ class Friendship(models.Model):
             # フレンド数を更新
             self.from_user.friends_count += 1
             self.to_user.friends_count += 1
-            self.from_user.save()
-            self.to_user.save()
+            self.from_user.save(update_fields=['friends_count'])
+            self.to_user.save(update_fields=['friends_count'])
             
             self.save()
     
@@ -295,8 +295,8 @@ class Friendship(models.Model):
         if hasattr(self, 'friends_since') and self.friends_since:
             self.from_user.friends_count = max(0, self.from_user.friends_count - 1)
             self.to_user.friends_count = max(0, self.to_user.friends_count - 1)
-            self.from_user.save()
-            self.to_user.save()
+            self.from_user.save(update_fields=['friends_count'])
+            self.to_user.save(update_fields=['friends_count'])
         
         self.save()
 
@@ -439,6 +439,7 @@ class SocialPost(models.Model):
             models.Index(fields=['author', '-created_at']),
             models.Index(fields=['visibility', '-created_at']),
             models.Index(fields=['post_type', '-created_at']),
+            models.Index(fields=['-created_at', '-id']),  # フィードのカーソル（作成日時・ID）用
         ]
     
     def __str__(self):
@@ -843,4 +844,8 @@ class ReviewHelpful(models.Model):
         unique_together = ('user', 'review')
     
     def __str__(self):
-        return f"{self.user.username} → {self.review}が役に立った"
\ No newline at end of file
+        return f"{self.user.username} → {self.review}が役に立った"
+
+
+# ホームタイムライン更新のシグナルを接続（モデル定義後に読み込む）
+from . import social_signals  # noqa: E402,F401
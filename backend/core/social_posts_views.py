@@ -16,6 +16,8 @@ from .social_serializers import (
     SocialPostCommentSerializer, DetailedReviewSerializer
 )
 from .models import User, Store, Notification
+from .social_feed_service import social_feed_service
+from .social_timeline_service import social_timeline_service
 
 
 class SocialPostViewSet(viewsets.ModelViewSet):
@@ -25,87 +27,41 @@ class SocialPostViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        """プライバシー設定を考慮した投稿取得"""
-        user = self.request.user
-        
-        # フレンドリストを取得
-        friend_ids = set()
-        friendships = Friendship.objects.filter(
-            Q(from_user=user, status='accepted') | 
-            Q(to_user=user, status='accepted')
-        ).values_list('from_user_id', 'to_user_id')
-        
-        for from_id, to_id in friendships:
-            friend_ids.add(from_id if from_id != user.id else to_id)
-        
-        # ブロックユーザーを除外
-        blocked_ids = set()
-        blocks = UserBlock.objects.filter(
-            Q(blocker=user) | Q(blocked=user)
-        ).values_list('blocker_id', 'blocked_id')
-        
-        for blocker_id, blocked_id in blocks:
-            blocked_ids.add(blocker_id)
-            blocked_ids.add(blocked_id)
-        
-        # 表示可能な投稿を取得
-        queryset = SocialPost.objects.filter(
-            is_deleted=False
-        ).exclude(
-            author_id__in=blocked_ids
-        ).select_related('author', 'location').prefetch_related(
-            'likes', 'comments', 'shares'
-        )
-        
-        # プライバシー設定を考慮してフィルタリング
-        visible_posts = []
-        for post in queryset:
-            if self.can_view_post(user, post, friend_ids):
-                visible_posts.append(post.id)
-        
-        return SocialPost.objects.filter(id__in=visible_posts).order_by('-created_at')
-    
-    def can_view_post(self, user, post, friend_ids=None):
-        """投稿の表示権限をチェック"""
-        if post.author == user:
-            return True
-        
-        if post.visibility == 'public':
-            return True
-        elif post.visibility == 'friends':
-            if friend_ids is None:
-                return self.are_friends(user, post.author)
-            return post.author_id in friend_ids
-        elif post.visibility == 'limited':
-            return post.allowed_users.filter(id=user.id).exists()
-        else:  # private
-            return False
+        """プライバシー設定・ブロック関係を考慮した投稿取得（判定はすべてSQL側で行う）"""
+        return social_feed_service.visible_posts(self.request.user)
     
     @action(detail=False, methods=['get'])
     def feed(self, request):
-        """フレンドのフィード取得"""
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 20))
-        
-        # ページネーション
-        queryset = self.get_queryset()
-        paginator = Paginator(queryset, page_size)
-        
+        """フレンドのフィード取得（ホームタイムラインのキャッシュから取得、cursor に前ページの next_cursor を指定）
+
+        自分・フレンドの投稿と閲覧を許可された制限公開の投稿を返し、フレンド以外のユーザーの
+        公開投稿は含めない（user_posts で閲覧する）。
+        """
+        return self.paginated_posts_response(
+            request, lambda cursor, page_size: social_timeline_service.feed_page(request.user, cursor, page_size)
+        )
+    
+    def paginated_posts_response(self, request, fetch_page, **extra):
+        """カーソル（作成日時・ID）によるページ送りのレスポンス
+
+        fetch_page(cursor, page_size) は (投稿のリスト, 次ページのカーソル) を返す。
+        """
         try:
-            posts_page = paginator.page(page)
-        except:
-            posts_page = paginator.page(1)
+            posts, next_cursor = fetch_page(request.GET.get('cursor'), request.GET.get('page_size'))
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': '無効なカーソルまたはページサイズです'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = self.get_serializer(posts_page.object_list, many=True)
+        serializer = self.get_serializer(posts, many=True)
         
         return Response({
             'success': True,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': paginator.num_pages,
-            'total_posts': paginator.count,
-            'has_next': posts_page.has_next(),
-            'has_previous': posts_page.has_previous(),
+            **extra,
+            'count': len(posts),
+            'has_next': next_cursor is not None,
+            'next_cursor': next_cursor,
             'posts': serializer.data
         })
     
@@ -154,48 +110,20 @@ class SocialPostViewSet(viewsets.ModelViewSet):
                 'error': 'User not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # フレンド関係をチェック
-        friend_ids = set()
-        if target_user != request.user:
-            friendships = Friendship.objects.filter(
-                Q(from_user=request.user, status='accepted') | 
-                Q(to_user=request.user, status='accepted')
-            ).values_list('from_user_id', 'to_user_id')
-            
-            for from_id, to_id in friendships:
-                friend_ids.add(from_id if from_id != request.user.id else to_id)
-        
         # 表示可能な投稿を取得
-        posts = SocialPost.objects.filter(
-            author=target_user,
-            is_deleted=False
-        ).order_by('-created_at')
-        
-        visible_posts = []
-        for post in posts:
-            if self.can_view_post(request.user, post, friend_ids):
-                visible_posts.append(post)
-        
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 20))
-        paginator = Paginator(visible_posts, page_size)
-        
-        try:
-            posts_page = paginator.page(page)
-        except:
-            posts_page = paginator.page(1)
-        
-        serializer = self.get_serializer(posts_page.object_list, many=True)
+        queryset = social_feed_service.with_viewer_flags(
+            self.get_queryset().filter(author=target_user), request.user
+        )
         
-        return Response({
-            'success': True,
-            'user': {
+        return self.paginated_posts_response(
+            request,
+            lambda cursor, page_size: social_feed_service.page(queryset, cursor, page_size),
+            user={
                 'id': target_user.id,
                 'username': target_user.username,
                 'avatar': target_user.avatar
-            },
-            'posts': serializer.data
-        })
+            }
+        )
     
     def create(self, request, *args, **kwargs):
         """投稿作成"""
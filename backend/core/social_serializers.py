@@ -142,6 +142,9 @@ class SocialPostSerializer(serializers.ModelSerializer):
         if not request or not request.user.is_authenticated:
             return False
         
+        # フィードでは取得時に付与済み（social_feed_service.with_viewer_flags）
+        if hasattr(obj, 'viewer_liked'):
+            return obj.viewer_liked
         return SocialPostLike.objects.filter(user=request.user, post=obj).exists()
     
     def get_user_shared(self, obj):
@@ -150,6 +153,8 @@ class SocialPostSerializer(serializers.ModelSerializer):
         if not request or not request.user.is_authenticated:
             return False
         
+        if hasattr(obj, 'viewer_shared'):
+            return obj.viewer_shared
         return SocialPostShare.objects.filter(user=request.user, post=obj).exists()
     
     def validate_content(self, value):
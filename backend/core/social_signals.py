@@ -0,0 +1,72 @@
+from django.db.models.signals import post_save, pre_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.db import transaction
+
+from .social_models import SocialPost, Friendship, UserBlock
+
+
+@receiver(post_save, sender=SocialPost)
+def fan_out_social_post(sender, instance, created, raw=False, **kwargs):
+    """投稿作成時に投稿者・フレンドのホームタイムラインへ配信（ロールバック時は配信しない）"""
+    if created and not raw:
+        from .social_timeline_service import social_timeline_service
+        transaction.on_commit(lambda: social_timeline_service.fan_out(instance))
+
+
+@receiver(m2m_changed, sender=SocialPost.allowed_users.through)
+def fan_out_limited_social_post(sender, instance, action, pk_set, reverse=False, **kwargs):
+    """制限公開の投稿の閲覧を許可したユーザーのホームタイムラインへ配信"""
+    if action == 'post_add' and not reverse and pk_set and instance.visibility == 'limited':
+        from .social_timeline_service import social_timeline_service
+        user_ids = set(pk_set)
+        transaction.on_commit(lambda: social_timeline_service.fan_out(instance, user_ids))
+
+
+@receiver(pre_save, sender=Friendship)
+def snapshot_friendship_status(sender, instance, raw=False, **kwargs):
+    """フレンド関係の保存前の状態を記録（タイムラインの更新用）"""
+    if raw:
+        return
+    instance._previous_status = sender.objects.filter(pk=instance.pk).values_list(
+        'status', flat=True
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Friendship)
+def update_timelines_on_friendship(sender, instance, raw=False, **kwargs):
+    """フレンド成立時はタイムラインを作成し直し、解除時は互いの投稿を取り除く"""
+    previous_status = getattr(instance, '_previous_status', None)
+    if raw or previous_status == instance.status:
+        return
+    from .social_timeline_service import social_timeline_service
+    user_ids = [instance.from_user_id, instance.to_user_id]
+    if instance.status == 'accepted':
+        social_timeline_service.invalidate(user_ids)
+        # コミット前に他スレッドが作成し直した場合に備え、コミット後にも破棄
+        transaction.on_commit(lambda: social_timeline_service.invalidate(user_ids))
+    elif previous_status == 'accepted':
+        transaction.on_commit(lambda: social_timeline_service.prune(*user_ids))
+
+
+@receiver(post_delete, sender=Friendship)
+def prune_timelines_on_unfriend(sender, instance, **kwargs):
+    """フレンド解除時に互いのタイムラインから相手の投稿を取り除く"""
+    if instance.status == 'accepted':
+        from .social_timeline_service import social_timeline_service
+        transaction.on_commit(lambda: social_timeline_service.prune(instance.from_user_id, instance.to_user_id))
+
+
+@receiver(post_save, sender=UserBlock)
+def prune_timelines_on_block(sender, instance, created, raw=False, **kwargs):
+    """ブロック時に互いのタイムラインから相手の投稿を取り除く"""
+    if created and not raw:
+        from .social_timeline_service import social_timeline_service
+        transaction.on_commit(lambda: social_timeline_service.prune(instance.blocker_id, instance.blocked_id))
+
+
+@receiver(post_delete, sender=UserBlock)
+def invalidate_timelines_on_unblock(sender, instance, **kwargs):
+    """ブロック解除時はタイムラインを作成し直す（フレンドの過去の投稿を含めるため）"""
+    from .social_timeline_service import social_timeline_service
+    user_ids = [instance.blocker_id, instance.blocked_id]
+    transaction.on_commit(lambda: social_timeline_service.invalidate(user_ids))
@@ -0,0 +1,330 @@
+from django.conf import settings
+from django.db.models import Q
+from datetime import datetime, timedelta, timezone
+import bisect
+import logging
+import threading
+
+from .social_models import Friendship, UserBlock
+from .social_feed_service import social_feed_service
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class LocalTimelineStore:
+    """プロセス内のタイムライン（開発・テスト用、共有キャッシュに Redis を使わない環境での代替）
+
+    ユーザーごとに (スコア, 投稿ID, 投稿者ID) の昇順リストと、保持件数を超えて古い投稿を
+    切り詰めたかどうかを保持する。
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._timelines = {}
+        self._truncated = set()
+
+    def get(self, user_id, max_score, count):
+        """スコアが max_score 以下の項目を新しい順に count 件と、切り詰め済みかどうか（未作成の場合は None）"""
+        with self._lock:
+            entries = self._timelines.get(user_id)
+            if entries is None:
+                return None
+            end = len(entries) if max_score is None else bisect.bisect_right(entries, (max_score, float('inf')))
+            return entries[max(end - count, 0):end][::-1], user_id in self._truncated
+
+    def add(self, user_ids, entry, max_length):
+        """作成済みのタイムラインにのみ項目を追加（未作成のタイムラインは次回の読み込み時に作成）"""
+        with self._lock:
+            for user_id in user_ids:
+                entries = self._timelines.get(user_id)
+                if entries is None:
+                    continue
+                index = bisect.bisect_left(entries, entry)
+                if index == len(entries) or entries[index] != entry:
+                    entries.insert(index, entry)
+                    if len(entries) > max_length:
+                        del entries[:-max_length]
+                        self._truncated.add(user_id)
+
+    def remove_author(self, user_id, author_id):
+        with self._lock:
+            entries = self._timelines.get(user_id)
+            if entries is not None:
+                entries[:] = [entry for entry in entries if entry[2] != author_id]
+
+    def replace(self, user_id, entries, truncated=False):
+        with self._lock:
+            if user_id not in self._timelines and len(self._timelines) >= self.max_users:
+                self._timelines = {}
+                self._truncated = set()
+            self._timelines[user_id] = sorted(entries)
+            if truncated:
+                self._truncated.add(user_id)
+            else:
+                self._truncated.discard(user_id)
+
+    def delete(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._timelines.pop(user_id, None)
+                self._truncated.discard(user_id)
+
+
+class RedisTimelineStore:
+    """共有キャッシュ（Redis）のソート済みセットによるタイムライン
+
+    メンバーは "投稿ID:投稿者ID"、スコアは投稿の作成日時（マイクロ秒）。作成済みであることを
+    示す番兵（スコア +inf）を常に含めるため、投稿のない作成済みタイムラインと未作成を区別できる。
+    保持件数を超えて古い投稿を切り詰めた場合は、切り詰めを示す番兵（スコア +inf）も追加する。
+    """
+
+    KEY = 'social_timeline:{user_id}'
+    SENTINEL = '0:0'
+    TRUNCATED = '0:-1'
+    # 作成済みのタイムラインにのみ追加し、番兵を除いて max_length 件に切り詰める
+    ADD_SCRIPT = """
+        for _, key in ipairs(KEYS) do
+            if redis.call('exists', key) == 1 then
+                redis.call('zadd', key, ARGV[1], ARGV[2])
+                local excess = redis.call('zcard', key) - redis.call('zcount', key, '+inf', '+inf') - tonumber(ARGV[3])
+                if excess > 0 then
+                    redis.call('zremrangebyrank', key, 0, excess - 1)
+                    redis.call('zadd', key, '+inf', ARGV[4])
+                end
+            end
+        end
+        return 0
+    """
+
+    def __init__(self, alias='default', ttl=7 * 24 * 60 * 60, chunk_size=500):
+        self.alias = alias
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._client = None
+        self._add_script = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from django_redis import get_redis_connection
+            self._client = get_redis_connection(self.alias)
+        return self._client
+
+    @property
+    def add_script(self):
+        if self._add_script is None:
+            self._add_script = self.client.register_script(self.ADD_SCRIPT)
+        return self._add_script
+
+    def _key(self, user_id):
+        return self.KEY.format(user_id=user_id)
+
+    def _entry(self, member, score):
+        post_id, author_id = (member.decode() if isinstance(member, bytes) else member).split(':')
+        return int(score), int(post_id), int(author_id)
+
+    def get(self, user_id, max_score, count):
+        key = self._key(user_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.zrevrangebyscore(key, '(+inf' if max_score is None else max_score, '-inf', start=0, num=count, withscores=True)
+        pipe.zscore(key, self.TRUNCATED)
+        pipe.expire(key, self.ttl)
+        exists, rows, truncated, _ = pipe.execute()
+        if not exists:
+            return None
+        return [self._entry(member, score) for member, score in rows], truncated is not None
+
+    def add(self, user_ids, entry, max_length):
+        score, post_id, author_id = entry
+        keys = [self._key(user_id) for user_id in user_ids]
+        for index in range(0, len(keys), self.chunk_size):
+            self.add_script(
+                keys=keys[index:index + self.chunk_size],
+                args=[score, f'{post_id}:{author_id}', max_length, self.TRUNCATED]
+            )
+
+    def remove_author(self, user_id, author_id):
+        key = self._key(user_id)
+        # 番兵（スコア +inf）は対象外
+        members = [
+            member for member in self.client.zrangebyscore(key, '-inf', '(+inf')
+            if (member.decode() if isinstance(member, bytes) else member).endswith(f':{author_id}')
+        ]
+        if members:
+            self.client.zrem(key, *members)
+
+    def replace(self, user_id, entries, truncated=False):
+        key = self._key(user_id)
+        mapping = {f'{post_id}:{author_id}': score for score, post_id, author_id in entries}
+        mapping[self.SENTINEL] = float('inf')
+        if truncated:
+            mapping[self.TRUNCATED] = float('inf')
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.zadd(key, mapping)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def delete(self, user_ids):
+        keys = [self._key(user_id) for user_id in user_ids]
+        for index in range(0, len(keys), self.chunk_size):
+            self.client.delete(*keys[index:index + self.chunk_size])
+
+
+class SocialTimelineService:
+    """ホームタイムラインのキャッシュ（投稿時にフレンドへ配信する fan-out-on-write）
+
+    投稿の作成時に投稿者とフレンド（制限公開は閲覧を許可されたユーザー）のタイムラインへ
+    投稿IDを追加し、フィードはタイムラインから1ページ分のIDを取り出して1回のクエリで
+    投稿を読み込む。読み込み時に home_posts の条件で絞り込むため、削除・公開範囲の変更・
+    フレンド解除・ブロックがタイムラインに未反映でも表示されることはない。
+    タイムラインがない場合（期限切れ・フレンド追加による破棄）は読み込み時に作成し直す。
+
+    ホームタイムラインは自分・フレンドの投稿と閲覧を許可された制限公開の投稿で構成し、
+    フレンド以外のユーザーの公開投稿は含めない（ユーザー別の投稿一覧 user_posts で閲覧する）。
+    """
+
+    def __init__(self):
+        self.max_length = 800  # 1ユーザーのタイムラインに保持する投稿数
+        self.tie_slack = 8  # 同一時刻の投稿がカーソルをまたぐ場合に余分に取得する件数
+        self._store = None
+
+    @property
+    def store(self):
+        """タイムラインの保存先（SOCIAL_TIMELINE_BACKEND 未設定時は共有キャッシュが Redis かどうかで選択）"""
+        if self._store is None:
+            backend = getattr(settings, 'SOCIAL_TIMELINE_BACKEND', None)
+            if backend is None:
+                backend = 'redis' if 'redis' in settings.CACHES['default']['BACKEND'].lower() else 'local'
+            self._store = RedisTimelineStore() if backend == 'redis' else LocalTimelineStore()
+        return self._store
+
+    def score(self, created_at):
+        return (created_at - EPOCH) // timedelta(microseconds=1)
+
+    def created_at(self, score):
+        return EPOCH + timedelta(microseconds=score)
+
+    # === 書き込み ===
+
+    def recipients(self, post):
+        """投稿を配信するユーザーID（投稿者を含む）"""
+        if post.visibility == 'private':
+            return [post.author_id]
+        if post.visibility == 'limited':
+            user_ids = set(post.allowed_users.values_list('id', flat=True))
+        else:
+            user_ids = set()
+            for from_id, to_id in Friendship.objects.filter(
+                Q(from_user_id=post.author_id) | Q(to_user_id=post.author_id), status='accepted'
+            ).values_list('from_user_id', 'to_user_id'):
+                user_ids.add(to_id if from_id == post.author_id else from_id)
+
+        for blocker_id, blocked_id in UserBlock.objects.filter(
+            Q(blocker_id=post.author_id) | Q(blocked_id=post.author_id)
+        ).values_list('blocker_id', 'blocked_id'):
+            user_ids.discard(blocked_id if blocker_id == post.author_id else blocker_id)
+        return [post.author_id] + sorted(user_ids - {post.author_id})
+
+    def fan_out(self, post, user_ids=None):
+        """投稿を投稿者・フレンドのタイムラインに追加（投稿作成のコミット後に呼び出す）"""
+        if post.is_deleted:
+            return 0
+        try:
+            user_ids = self.recipients(post) if user_ids is None else list(user_ids)
+            self.store.add(user_ids, (self.score(post.created_at), post.id, post.author_id), self.max_length)
+        except Exception as e:
+            # 追加できなかったタイムラインは破棄し、次回の読み込み時に作成し直す
+            # （配信先を取得できなかった場合は投稿者のタイムラインのみ）
+            logger.error(f"Social timeline fan-out failed for post {post.id}: {str(e)}")
+            self.invalidate([post.author_id] if user_ids is None else user_ids)
+            return 0
+        return len(user_ids)
+
+    def prune(self, user_id, other_user_id):
+        """フレンド解除・ブロック時に、互いのタイムラインから相手の投稿を取り除く"""
+        try:
+            self.store.remove_author(user_id, other_user_id)
+            self.store.remove_author(other_user_id, user_id)
+        except Exception as e:
+            logger.error(f"Social timeline prune failed for users {user_id}/{other_user_id}: {str(e)}")
+            self.invalidate([user_id, other_user_id])
+
+    def invalidate(self, user_ids):
+        """タイムラインを破棄（フレンド追加・ブロック解除時など、過去の投稿が増える場合）"""
+        try:
+            self.store.delete(list(user_ids))
+        except Exception as e:
+            logger.error(f"Social timeline invalidation failed: {str(e)}")
+
+    def rebuild(self, viewer):
+        """DBからタイムラインを作成し直し、(項目（新しい順）, 切り詰め済みか) を返す"""
+        rows = social_feed_service.home_posts(viewer).select_related(None).values_list(
+            'created_at', 'id', 'author_id'
+        )[:self.max_length]
+        entries = [(self.score(created_at), post_id, author_id) for created_at, post_id, author_id in rows]
+        # 保持件数ちょうどの場合はそれより古い投稿があるものとして扱う
+        truncated = len(entries) >= self.max_length
+        self.store.replace(viewer.id, entries, truncated)
+        return entries, truncated
+
+    # === 読み込み ===
+
+    def feed_page(self, viewer, cursor=None, page_size=None):
+        """ホームタイムラインの1ページを取得し、(投稿のリスト, 次ページのカーソル) を返す
+
+        カーソルは social_feed_service.page と共通。切り詰めたタイムラインの末尾を超えて遡る場合や、
+        保存先に障害がある場合はDBから直接取得する。
+        """
+        page_size = social_feed_service.clamp_page_size(page_size)
+        after = None
+        if cursor:
+            created_at, post_id = social_feed_service.decode_cursor(cursor)
+            after = (self.score(created_at), post_id)
+
+        try:
+            found = self.store.get(viewer.id, after and after[0], page_size + 1 + self.tie_slack)
+            if found is None:
+                entries, truncated = self.rebuild(viewer)
+                if after:
+                    entries = [entry for entry in entries if entry[0] <= after[0]]
+            else:
+                entries, truncated = found
+        except Exception as e:
+            logger.warning(f"Social timeline unavailable, reading feed from database: {str(e)}")
+            return self.database_page(viewer, cursor, page_size)
+
+        if after:
+            entries = [entry for entry in entries if entry[:2] < after]
+        if len(entries) <= page_size and truncated:
+            # 切り詰めた（タイムラインに保持していない）古い投稿はDBから取得
+            return self.database_page(viewer, cursor, page_size)
+
+        page_entries = entries[:page_size]
+        posts = self.hydrate(viewer, [post_id for _, post_id, _ in page_entries])
+        next_cursor = None
+        if len(entries) > page_size:
+            last_score, last_id, _ = page_entries[-1]
+            next_cursor = social_feed_service.make_cursor(self.created_at(last_score), last_id)
+        return posts, next_cursor
+
+    def database_page(self, viewer, cursor, page_size):
+        queryset = social_feed_service.with_viewer_flags(social_feed_service.home_posts(viewer), viewer)
+        return social_feed_service.page(queryset, cursor, page_size)
+
+    def hydrate(self, viewer, post_ids):
+        """投稿IDの投稿を1回のクエリで読み込み、IDの順に返す（閲覧できなくなった投稿は除く）"""
+        if not post_ids:
+            return []
+        posts = social_feed_service.with_viewer_flags(
+            social_feed_service.home_posts(viewer).filter(id__in=post_ids), viewer
+        ).in_bulk()
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+# グローバルインスタンス
+social_timeline_service = SocialTimelineService()
@@ -9,9 +9,15 @@ urlpatterns = [
     # 店舗決済
     path('store/payment/', store_payment_views.process_store_payment, name='store-payment'),
     
+    # ポイント一括付与
+    path('points/grant-bulk/', store_payment_views.grant_points_bulk, name='grant-points-bulk'),
+    
     # 取引履歴
     path('transactions/recent/', store_payment_views.get_recent_transactions, name='recent-transactions'),
     
+    # 時点残高の復元
+    path('balances/at/', store_payment_views.get_balance_at, name='balance-at'),
+    
     # 店舗ポイント購入
     path('purchase-points/', store_payment_views.purchase_store_points, name='purchase-store-points'),
     path('current-points/', store_payment_views.get_current_store_points, name='current-store-points'),
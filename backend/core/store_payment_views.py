@@ -6,11 +6,16 @@ from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import Http404
 import logging
 
 from .models import Store, PointTransaction, User
 from .serializers import PointTransactionSerializer
 from .point_service import point_service
+from .idempotency_service import idempotency_service
+from .ledger_archive_service import ledger_archive_service
+from .balance_snapshot_service import balance_snapshot_service
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -143,10 +148,7 @@ def process_store_payment(request):
         store = None
         if request.user.role == 'store':
             # 店舗管理者の場合、管理している店舗を取得
-            try:
-                store = request.user.managed_stores.first()
-            except AttributeError:
-                pass
+            store = request.user.store
         elif request.user.role == 'terminal':
             # ターミナルユーザーの場合、関連店舗を取得
             try:
@@ -160,24 +162,38 @@ def process_store_payment(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 統一ポイントサービスを使用してポイント決済処理
-        point_transaction = point_service.process_store_payment(
-            customer=customer,
-            store=store,
-            points=points,
-            description=description,
-            processed_by=request.user
+        def run_payment():
+            # 統一ポイントサービスを使用してポイント決済処理
+            point_transaction = point_service.process_store_payment(
+                customer=customer,
+                store=store,
+                points=points,
+                description=description,
+                processed_by=request.user,
+                reference_id=reference_id
+            )
+            return {
+                'transaction_id': point_transaction.id,
+                'points_consumed': points,
+                'balance_after': customer.point_balance,  # 統一されたpoint_balanceを使用
+                'customer_name': customer.username,
+                'store_name': store.name,
+                'message': f'{points}ポイントの決済が完了しました'
+            }, status.HTTP_201_CREATED
+        
+        # 端末の再送は同じ冪等キーで元の決済結果を返す（台帳には触れない）
+        reference_id = idempotency_service.key_from_request(request)
+        body, status_code, replayed = idempotency_service.execute(
+            'store_payment',
+            idempotency_service.actor_key('user', request.user.pk),
+            reference_id,
+            run_payment
+        )
+        return Response(
+            body,
+            status=status_code,
+            headers={'Idempotent-Replayed': 'true'} if replayed else None
         )
-        
-        # レスポンス
-        return Response({
-            'transaction_id': point_transaction.id,
-            'points_consumed': points,
-            'balance_after': customer.point_balance,  # 統一されたpoint_balanceを使用
-            'customer_name': customer.username,
-            'store_name': store.name,
-            'message': f'{points}ポイントの決済が完了しました'
-        }, status=status.HTTP_201_CREATED)
         
     except User.DoesNotExist:
         return Response(
@@ -189,6 +205,12 @@ def process_store_payment(request):
             {'error': str(e)},
             status=status.HTTP_400_BAD_REQUEST
         )
+    except ValueError as e:
+        # 残高不足
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         logger.error(f"Store payment processing failed: {str(e)}")
         return Response(
@@ -197,6 +219,87 @@ def process_store_payment(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def grant_points_bulk(request):
+    """キャンペーン等のポイント一括付与（管理者・店舗管理者）"""
+    try:
+        if request.user.role not in ['store', 'admin']:
+            return Response(
+                {'error': '権限がありません'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        grants = request.data.get('grants')
+        description = request.data.get('description', '')
+        
+        if not isinstance(grants, list) or not grants:
+            return Response(
+                {'error': '付与対象（grants）が必要です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not all(isinstance(row, dict) for row in grants):
+            return Response(
+                {'error': '付与対象の形式が不正です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            expiry_months = int(request.data.get('expiry_months', 6))
+        except (ValueError, TypeError):
+            return Response(
+                {'error': '有効期限（月数）が不正です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # 店舗情報を取得（店舗管理者は自店舗、管理者は指定店舗またはシステム付与）
+        store = None
+        if request.user.role == 'store':
+            store = request.user.store
+            if not store:
+                return Response(
+                    {'error': '店舗情報が取得できません'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        elif request.data.get('store_id'):
+            store = get_object_or_404(Store, id=request.data.get('store_id'))
+        
+        results = point_service.grant_points_bulk(
+            grants,
+            store=store,
+            description=description,
+            expiry_months=expiry_months,
+            processed_by=request.user
+        )
+        
+        succeeded = [row for row in results if row['success']]
+        return Response({
+            'total_rows': len(results),
+            'succeeded': len(succeeded),
+            'failed': len(results) - len(succeeded),
+            'total_points': sum(row['points'] for row in succeeded),
+            'results': results
+        }, status=status.HTTP_201_CREATED if succeeded else status.HTTP_400_BAD_REQUEST)
+        
+    except ValidationError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as e:
+        # デポジット残高不足
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_402_PAYMENT_REQUIRED
+        )
+    except Exception as e:
+        logger.error(f"Bulk point grant failed: {str(e)}")
+        return Response(
+            {'error': 'ポイント一括付与に失敗しました'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_recent_transactions(request):
@@ -212,49 +315,41 @@ def get_recent_transactions(request):
         transaction_type = request.GET.get('type')
         limit = min(int(request.GET.get('limit', 10)), 50)  # 最大50件
         
-        # 基本クエリ
-        queryset = PointTransaction.objects.select_related('user', 'store').order_by('-created_at')
-        
         # フィルタリング
-        if transaction_type:
-            if transaction_type == 'store_payment':
-                queryset = queryset.filter(transaction_type='payment')
+        transaction_types = None
+        if transaction_type == 'store_payment':
+            transaction_types = ['payment']
         
         # 権限に応じてフィルタリング
+        store_ids = None
         if request.user.role == 'store':
             # 店舗管理者は自分の管理店舗の取引のみ
-            try:
-                managed_stores = request.user.managed_stores.all()
-                queryset = queryset.filter(store__in=managed_stores)
-            except AttributeError:
-                queryset = queryset.none()
+            store_ids = [request.user.store_id] if request.user.store_id else []
         elif request.user.role == 'terminal':
             # ターミナルユーザーは関連店舗の取引のみ
-            try:
-                terminal_store = getattr(request.user, 'terminal_store', None)
-                if terminal_store:
-                    queryset = queryset.filter(store=terminal_store)
-                else:
-                    queryset = queryset.none()
-            except AttributeError:
-                queryset = queryset.none()
+            terminal_store = getattr(request.user, 'terminal_store', None)
+            store_ids = [terminal_store.id] if terminal_store else []
         
-        # 取引を取得
-        transactions = queryset[:limit]
+        # 取引を取得（アーカイブ済みの月も透過的に参照）
+        transactions = ledger_archive_service.recent_transactions(
+            limit=limit,
+            store_ids=store_ids,
+            transaction_types=transaction_types
+        ) if store_ids != [] else []
         
         # レスポンス用データ整形
         transaction_data = []
         for trans in transactions:
             transaction_data.append({
-                'id': trans.id,
-                'customer_name': trans.user.username if trans.user else '不明',
-                'customer_email': trans.user.email if trans.user else '',
-                'points': abs(trans.points),  # 絶対値表示
-                'transaction_type': trans.transaction_type,
-                'description': trans.description,
-                'store_name': trans.store.name if trans.store else '不明な店舗',
-                'created_at': trans.created_at.isoformat(),
-                'processed_by': trans.processed_by.username if trans.processed_by else '不明'
+                'id': trans['id'],
+                'customer_name': trans['user_name'] or '不明',
+                'customer_email': trans['user_email'],
+                'points': abs(trans['points']),  # 絶対値表示
+                'transaction_type': trans['transaction_type'],
+                'description': trans['description'],
+                'store_name': trans['store_name'] or '不明な店舗',
+                'created_at': trans['created_at'].isoformat(),
+                'processed_by': trans['processed_by_name'] or '不明'
             })
         
         return Response({
@@ -270,6 +365,62 @@ def get_recent_transactions(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_balance_at(request):
+    """指定日時時点の残高を復元（監査・問い合わせ対応）"""
+    try:
+        user_id = request.GET.get('user_id')
+        store_id = request.GET.get('store_id')
+        at = parse_datetime(request.GET.get('at', ''))
+        
+        if at is None or bool(user_id) == bool(store_id):
+            return Response(
+                {'error': 'user_id または store_id のいずれかと、ISO 8601形式の at が必要です'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        
+        try:
+            target_id = int(user_id or store_id)
+        except (ValueError, TypeError):
+            return Response(
+                {'error': '有効なIDを指定してください'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # 権限チェック（管理者は全件、店舗管理者は自店舗、ユーザーは本人のみ）
+        if request.user.role != 'admin':
+            allowed = (
+                (user_id and target_id == request.user.id)
+                or (store_id and request.user.role == 'store' and target_id == request.user.store_id)
+            )
+            if not allowed:
+                return Response(
+                    {'error': '権限がありません'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        
+        if user_id:
+            get_object_or_404(User, id=target_id)
+            result = balance_snapshot_service.user_balance_at(target_id, at)
+        else:
+            get_object_or_404(Store, id=target_id)
+            result = balance_snapshot_service.store_balance_at(target_id, at)
+        
+        return Response(result)
+        
+    except Http404:
+        raise
+    except Exception as e:
+        logger.error(f"Balance reconstruction failed: {str(e)}")
+        return Response(
+            {'error': '残高の復元に失敗しました'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def purchase_store_points(request):
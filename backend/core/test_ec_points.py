@@ -0,0 +1,621 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+
+from core.models import Store, ECPointRequest, StoreWebhookKey, WebhookQueueItem, WebhookDeadLetter
+from core.duplicate_detection_service import DuplicateDetectionService
+
+User = get_user_model()
+
+
+def create_ec_request(user, store, order_id, amount=Decimal('3000'), purchase_date=None, status='pending'):
+    return ECPointRequest.objects.create(
+        request_type='webhook',
+        user=user,
+        store=store,
+        purchase_amount=amount,
+        order_id=order_id,
+        purchase_date=purchase_date or timezone.now(),
+        status=status,
+        points_to_award=int(amount // 100),
+        request_hash=f'hash-{order_id}',
+        ip_address='127.0.0.1'
+    )
+
+
+class DuplicateDetectionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ec_user', email='ec@test.com', member_id='ec001')
+        self.store = Store.objects.create(
+            name='EC Store',
+            owner_name='Owner',
+            email='ecstore@test.com',
+            phone='03-0000-0000',
+            address='Test Address'
+        )
+        self.service = DuplicateDetectionService()
+        cache.clear()
+
+    def test_rule_signals_from_one_query_and_velocity_counters(self):
+        """注文ID・パターン一致は1クエリ、件数ルールはカウンターから判定する
+
+        類似注文ID（ORDER-R）は却下済みのため検知しない（候補検索・参照先取得の2クエリが追加）。
+        """
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            original = create_ec_request(self.user, self.store, 'ORDER-1', purchase_date=now - timedelta(minutes=30))
+            create_ec_request(self.user, self.store, 'ORDER-R', purchase_date=now, status='rejected')
+            for index in range(2):
+                create_ec_request(self.user, self.store, f'ORDER-X{index}', amount=Decimal('1000'),
+                                  purchase_date=now - timedelta(days=3))
+
+        with self.assertNumQueries(3):
+            duplicates = self.service.check_for_duplicates(
+                self.user, self.store, Decimal('3000'), 'ORDER-1', now
+            )
+
+        signals = sorted((d['type'], d['original'].pk, d['severity']) for d in duplicates)
+        self.assertEqual(signals, [
+            ('order_id', original.pk, 'critical'),
+            ('pattern_match', original.pk, 'high'),
+        ])
+
+        # 1時間に5件以上・同一金額3件以上で不審パターンを検知し、参照先は追加1クエリで取得（類似注文IDの候補検索と合わせて3クエリ）
+        with self.captureOnCommitCallbacks(execute=True):
+            create_ec_request(self.user, self.store, 'ORDER-X2', amount=Decimal('1000'))
+        with self.assertNumQueries(3):
+            duplicates = self.service.check_for_duplicates(
+                self.user, self.store, Decimal('1000'), 'ORDER-NEW', now
+            )
+        suspicious = [d for d in duplicates if d['type'] == 'suspicious']
+        self.assertEqual(
+            [(d['details']['reason'], d['original'].order_id) for d in suspicious],
+            [('短時間での大量申請', 'ORDER-X2'), ('同一金額での繰り返し申請', 'ORDER-X2')]
+        )
+
+    def test_velocity_window_and_rebuild(self):
+        """ウィンドウ外の申請は数えず、カウンター消失後は申請データから再構築できる"""
+        from core.velocity_counter_service import velocity_counter_service
+
+        now = timezone.now()
+        velocity_counter_service.record(self.user.pk, self.store.pk, Decimal('500'), 1, now - timedelta(hours=2))
+        velocity_counter_service.record(self.user.pk, self.store.pk, Decimal('500'), 2, now - timedelta(minutes=10))
+        signals = velocity_counter_service.activity_signals(self.user.pk, self.store.pk, Decimal('500.00'))
+        self.assertEqual(
+            (signals['user_hour_count'], signals['store_hour_count'], signals['same_amount_count']), (1, 1, 2)
+        )
+        self.assertEqual(signals['same_amount_latest'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            request = create_ec_request(self.user, self.store, 'ORDER-V1')
+        cache.clear()
+        velocity_counter_service.rebuild()
+        signals = velocity_counter_service.activity_signals(self.user.pk, self.store.pk, Decimal('3000'))
+        self.assertEqual((signals['user_hour_count'], signals['user_hour_latest']), (1, request.pk))
+
+    def test_similar_order_id_index(self):
+        """1文字違いの注文IDを類似注文IDとして検知し、店舗の書式は類似判定から除外する"""
+        from core.order_id_index_service import order_id_index_service
+
+        with self.captureOnCommitCallbacks(execute=True):
+            original = create_ec_request(self.user, self.store, 'AMZ-2024-8837461',
+                                         purchase_date=timezone.now() - timedelta(days=10))
+        duplicates = self.service.check_for_duplicates(
+            self.user, self.store, Decimal('700'), 'AMZ-2024-8837467', timezone.now()
+        )
+        similar = [d for d in duplicates if d['type'] == 'similar_order_id']
+        self.assertEqual([(d['original'].pk, d['severity']) for d in similar], [(original.pk, 'medium')])
+        self.assertEqual(similar[0]['details']['matching_order_id'], 'AMZ-2024-8837461')
+
+        # 書式を学習すると共通部分（"AMZ-2024-"）はシグネチャから除外され、再構築後も検索できる
+        order_ids = [f'AMZ-2024-{index:07d}' for index in range(order_id_index_service.template_min_ids)]
+        stop_shingles = order_id_index_service.learn_template(self.store.pk, order_ids)
+        self.assertIn('amz', stop_shingles)
+        self.assertEqual(order_id_index_service.rebuild(), 1)
+        self.assertEqual(
+            order_id_index_service.candidates(self.store.pk, 'AMZ-2024-8837467'), ['AMZ-2024-8837461']
+        )
+        self.assertEqual(order_id_index_service.candidates(Store.objects.create(
+            name='Other', owner_name='Owner', email='other@test.com', phone='03-0000-0001', address='Test'
+        ).pk, 'AMZ-2024-8837467'), [])
+
+    def test_index_failure_after_commit_is_logged(self):
+        """コミット後のインデックス更新の失敗は記録のみで、申請の作成は失敗させない"""
+        from unittest import mock
+        from core.order_id_index_service import order_id_index_service
+
+        with mock.patch.object(order_id_index_service, 'add', side_effect=RuntimeError('index down')):
+            with self.assertLogs('core.signals', level='ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    ec_request = create_ec_request(self.user, self.store, 'AMZ-2024-0000001')
+        self.assertTrue(ECPointRequest.objects.filter(pk=ec_request.pk).exists())
+
+
+@override_settings(EC_WEBHOOK_ASYNC=True)
+class WebhookIngestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='queue_user', email='queue@test.com', member_id='q001', role='customer', status='active'
+        )
+        self.store = Store.objects.create(
+            name='Queue Store',
+            owner_name='Owner',
+            email='queuestore@test.com',
+            phone='03-0000-0000',
+            address='Test Address',
+            status='active'
+        )
+        self.webhook_key = StoreWebhookKey.objects.create(store=self.store, webhook_key=StoreWebhookKey.generate_key())
+        cache.clear()
+
+    def post_webhook(self, order_id, user_id=None):
+        from core.ec_point_views import webhook_purchase
+
+        request = APIRequestFactory().get('/api/ec/webhook/purchase/', {
+            'user_id': user_id or self.user.pk,
+            'amount': '2500',
+            'order_id': order_id,
+            'store_key': self.webhook_key.webhook_key,
+        })
+        return webhook_purchase(request)
+
+    def test_accept_and_drain_in_store_order(self):
+        """受信時はキューに保存して202を返し、ワーカーが受信順に申請を作成する"""
+        from core.webhook_ingest_service import webhook_ingest_service
+
+        for order_id in ('Q-1', 'Q-2'):
+            response = self.post_webhook(order_id)
+            self.assertEqual(response.status_code, 202)
+        self.assertFalse(ECPointRequest.objects.exists())
+        self.assertEqual(webhook_ingest_service.queue_metrics()['ready'], 2)
+
+        # 先頭の項目が再試行待ちの間は、同じ店舗の後続の項目も取り出さない
+        first = WebhookQueueItem.objects.order_by('id').first()
+        WebhookQueueItem.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(webhook_ingest_service.claim_batch(), [])
+
+        WebhookQueueItem.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            totals = webhook_ingest_service.drain()
+        self.assertEqual(totals, {'completed': 2, 'retried': 0, 'dead_lettered': 0})
+        self.assertEqual(
+            list(ECPointRequest.objects.order_by('id').values_list('order_id', flat=True)), ['Q-1', 'Q-2']
+        )
+        self.assertEqual(webhook_ingest_service.queue_metrics()['depth'], 0)
+
+    def test_invalid_payload_goes_to_dead_letters(self):
+        """検証エラーの受信データは再試行せずデッドレターへ移し、再投入できる"""
+        from core.webhook_ingest_service import webhook_ingest_service
+
+        self.assertEqual(self.post_webhook('Q-BAD', user_id=999999).status_code, 202)
+        totals = webhook_ingest_service.drain()
+        self.assertEqual(totals['dead_lettered'], 1)
+        self.assertFalse(WebhookQueueItem.objects.exists())
+        self.assertIn('user_id', WebhookDeadLetter.objects.get().error)
+
+        self.assertEqual(webhook_ingest_service.requeue_dead_letters(), 1)
+        self.assertEqual(webhook_ingest_service.queue_metrics()['dead_letters'], 0)
+        self.assertEqual(WebhookQueueItem.objects.get().payload['order_id'], 'Q-BAD')
+
+    @override_settings(EC_WEBHOOK_ASYNC=False)
+    def test_sync_webhook_retry_replays_original_result(self):
+        """同期モードの再送は処理済みの注文IDとして弾かず、元の結果を返す"""
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.post_webhook('SYNC-1')
+        self.assertEqual(first.status_code, 201)
+
+        retry = self.post_webhook('SYNC-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['request_id'], first.data['request_id'])
+        self.assertEqual(ECPointRequest.objects.filter(order_id='SYNC-1').count(), 1)
+
+    def post_batch(self, body, content_type='application/x-ndjson'):
+        from core.ec_point_views import webhook_purchase_batch
+
+        request = APIRequestFactory().post(
+            '/api/ec/webhook/purchase/batch/', data=body, content_type=content_type,
+            HTTP_X_STORE_KEY=self.webhook_key.webhook_key
+        )
+        return webhook_purchase_batch(request)
+
+    def test_batch_endpoint_per_line_results(self):
+        """一括受信は行ごとの結果を返し、バッチ内の先行する申請とも重複照合する"""
+        import json
+        from core.models import DuplicateDetection
+
+        lines = [
+            json.dumps({'user_id': self.user.pk, 'amount': '2500', 'order_id': 'B-100231'}),
+            json.dumps({'user_id': self.user.pk, 'amount': '2500', 'order_id': 'B-100232'}),
+            '{not json',
+            json.dumps({'user_id': 999999, 'amount': '2500', 'order_id': 'B-100299'}),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_batch('\n'.join(lines))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201, 400, 400])
+        self.assertIn('user_id', response.data['results'][3]['errors'])
+
+        first, second = ECPointRequest.objects.order_by('id')
+        self.assertEqual(
+            sorted(DuplicateDetection.objects.filter(duplicate_request=second).values_list(
+                'detection_type', 'original_request'
+            )),
+            [('pattern_match', first.pk), ('similar_order_id', first.pk)]
+        )
+
+        # 再送は元の結果を返し、単発のWebhookでも再送として扱われる
+        response = self.post_batch(json.dumps([{'user_id': self.user.pk, 'amount': '2500', 'order_id': 'B-100231'}]),
+                                   content_type='application/json')
+        self.assertEqual(response.data['results'][0]['request_id'], first.pk)
+        self.assertTrue(response.data['results'][0]['replayed'])
+
+    def test_batch_query_count_independent_of_size(self):
+        """クエリ数は行数に依存しない"""
+        import json
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.webhook_key_service import webhook_key_service
+
+        # 店舗キーは初回のみDBから読み込むため、事前にキャッシュしておく
+        webhook_key_service.resolve(self.webhook_key.webhook_key)
+        counts = []
+        for prefix, size in (('S', 5), ('L', 20)):
+            body = '\n'.join(
+                json.dumps({'user_id': self.user.pk, 'amount': str(1000 + index), 'order_id': f'{prefix}-{index}'})
+                for index in range(size)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post_batch(body)
+            self.assertEqual(response.data['created'], size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BulkApprovalTest(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Bulk Store',
+            owner_name='Owner',
+            email='bulkstore@test.com',
+            phone='03-0000-0000',
+            address='Test Address',
+            status='active',
+            deposit_balance=Decimal('10000')
+        )
+        self.manager = User.objects.create_user(
+            username='bulk_manager', email='manager@test.com', member_id='m001',
+            role='store_manager', store=self.store
+        )
+        self.users = [
+            User.objects.create_user(username=f'bulk_user{index}', email=f'bulk{index}@test.com',
+                                     member_id=f'b00{index}')
+            for index in range(3)
+        ]
+        cache.clear()
+
+    def bulk_approve(self, request_ids):
+        from core.ec_point_views import bulk_approve_store_requests
+
+        request = APIRequestFactory().post(
+            '/api/ec/store/requests/bulk-approve/', {'request_ids': request_ids}, format='json'
+        )
+        force_authenticate(request, user=self.manager)
+        return bulk_approve_store_requests(request)
+
+    def test_single_charge_and_per_request_results(self):
+        """店舗ごとに決済は1回、申請ごとの結果を返し、承認済みの申請は記録済みの結果を返す"""
+        from core.models import DepositTransaction, PointAwardLog, PointTransaction
+
+        ec_requests = [
+            create_ec_request(user, self.store, f'BULK-{index}', amount=Decimal('2500'))
+            for index, user in enumerate(self.users)
+        ]
+        completed = create_ec_request(self.users[0], self.store, 'BULK-DONE', status='completed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk_approve([request.pk for request in ec_requests] + [completed.pk, 999999])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approved'], 3)
+        self.assertEqual(response.data['points_awarded'], 75)
+        self.assertEqual(
+            [result.get('error') for result in response.data['results'][3:]],
+            ['この申請は既に処理済みです', '申請が見つかりません']
+        )
+
+        self.assertEqual(DepositTransaction.objects.filter(store=self.store, transaction_type='consumption').count(), 1)
+        self.store.refresh_from_db()
+        self.assertEqual(self.store.deposit_balance, Decimal('9925'))
+        self.assertEqual(PointAwardLog.objects.count(), 3)
+        self.assertEqual(PointTransaction.objects.filter(store=self.store).count(), 3)
+        self.assertEqual(
+            set(ECPointRequest.objects.filter(pk__in=[r.pk for r in ec_requests]).values_list('status', flat=True)),
+            {'completed'}
+        )
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertEqual(user.point_balance, 25)
+
+        # 再送は決済・付与を再実行せず記録済みの結果を返す
+        response = self.bulk_approve([ec_requests[0].pk])
+        self.assertEqual(response.data['results'][0], {
+            'request_id': ec_requests[0].pk, 'success': True, 'replayed': True, 'points_awarded': 25
+        })
+        self.assertEqual(DepositTransaction.objects.filter(store=self.store, transaction_type='consumption').count(), 1)
+
+    def test_query_count_independent_of_size(self):
+        """クエリ数は申請数に依存しない（初回はランク一覧のキャッシュ読み込みを含むため除外）"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for prefix, size in (('W', 1), ('S', 2), ('L', 8)):
+            request_ids = [
+                create_ec_request(self.users[index % 3], self.store, f'{prefix}-{index}', amount=Decimal('1000')).pk
+                for index in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.bulk_approve(request_ids)
+            self.assertEqual(response.data['approved'], size)
+            counts.append(len(queries))
+        self.assertEqual(counts[1], counts[2])
+
+
+class ECAnalyticsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trend_user', email='trend@test.com', member_id='t001')
+        self.store = Store.objects.create(
+            name='Trend Store',
+            owner_name='Owner',
+            email='trendstore@test.com',
+            phone='03-0000-0000',
+            address='Test Address'
+        )
+        cache.clear()
+
+    def test_daily_trend_single_query_and_cached_history(self):
+        """日別推移は1クエリで集計して空白日を0で埋め、2回目以降は当日分のみ集計する"""
+        from core.ec_analytics_service import ec_analytics_service
+
+        now = timezone.now()
+        for order_id, age, status in (('T-1', 0, 'pending'), ('T-2', 2, 'completed'), ('T-3', 2, 'rejected')):
+            ec_request = create_ec_request(self.user, self.store, order_id, status=status)
+            ECPointRequest.objects.filter(pk=ec_request.pk).update(created_at=now - timedelta(days=age))
+
+        with self.assertNumQueries(2):
+            trend = ec_analytics_service.daily_trend(5)
+        self.assertEqual(len(trend), 5)
+        self.assertEqual([row['total_requests'] for row in trend], [0, 0, 2, 0, 1])
+        self.assertEqual((trend[2]['completed'], trend[2]['rejected'], trend[4]['pending']), (1, 1, 1))
+        self.assertEqual(trend[2]['total_amount'], 6000.0)
+
+        create_ec_request(self.user, self.store, 'T-4')
+        with self.assertNumQueries(1):
+            trend = ec_analytics_service.daily_trend(5)
+        self.assertEqual(trend[4]['total_requests'], 2)
+
+    def test_stats_rollup_matches_rebuild(self):
+        """作成・状態変更・一括承認で差分更新した日次集計は再集計の結果と一致し、分析は集計行のみを読む"""
+        from core.models import ECRequestDailyStat
+        from core.ec_stats_service import ec_stats_service
+        from core.ec_approval_service import ec_approval_service
+
+        manager = User.objects.create_user(
+            username='trend_manager', email='trendm@test.com', member_id='t002', role='store_manager', store=self.store
+        )
+        Store.objects.filter(pk=self.store.pk).update(deposit_balance=Decimal('10000'))
+        requests = [create_ec_request(self.user, self.store, f'R-{index}') for index in range(4)]
+        requests[0].reject(manager, '重複')
+        ec_approval_service.bulk_approve([requests[1].pk, requests[2].pk], manager)
+        requests[3].delete()
+
+        def rollup():
+            return sorted(ECRequestDailyStat.objects.filter(request_count__gt=0).values_list(
+                'store_id', 'day', 'request_type', 'status', 'payment_method',
+                'request_count', 'total_amount', 'points_to_award', 'points_awarded'
+            ))
+
+        incremental = rollup()
+        ec_stats_service.rebuild()
+        self.assertEqual(incremental, rollup())
+
+        with self.assertNumQueries(1):
+            summary = ec_stats_service.summary(30)
+        self.assertEqual((summary['total'], summary['completed'], summary['rejected']), (3, 2, 1))
+        self.assertEqual(summary['total_points'], 60)
+
+
+class ReceiptImageTest(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(
+            username='receipt_user', email='receipt@test.com', member_id='r001', role='customer', status='active'
+        )
+        self.store = Store.objects.create(
+            name='Receipt Store',
+            owner_name='Owner',
+            email='receiptstore@test.com',
+            phone='03-0000-0000',
+            address='Test Address',
+            status='active'
+        )
+        cache.clear()
+
+    def receipt_jpeg(self, size=(600, 800), quality=90):
+        import io
+        from PIL import Image, ImageDraw
+
+        image = Image.new('RGB', (600, 800), 'white')
+        draw = ImageDraw.Draw(image)
+        for index in range(12):
+            draw.rectangle([40, 60 + index * 55, 300 + (index * 37) % 240, 90 + index * 55], fill='black')
+        output = io.BytesIO()
+        image.resize(size).save(output, format='JPEG', quality=quality)
+        return output.getvalue()
+
+    def upload(self, order_id, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from core.ec_point_views import upload_receipt
+
+        request = APIRequestFactory().post('/api/ec/receipt/upload/', {
+            'store_name': self.store.name,
+            'purchase_amount': '3000',
+            'order_id': order_id,
+            'purchase_date': timezone.now().isoformat(),
+            'receipt_image': SimpleUploadedFile('receipt.jpg', content, content_type='image/jpeg'),
+        }, format='multipart')
+        force_authenticate(request, user=self.user)
+        return upload_receipt(request)
+
+    def test_image_duplicates_and_thumbnails(self):
+        """同じ写真は内容ハッシュ、再圧縮・縮小した写真は知覚ハッシュで検知し、サムネイルはワーカーが作成する"""
+        from core.models import DuplicateDetection, ReceiptImage
+        from core.receipt_image_service import receipt_image_service
+
+        original = self.receipt_jpeg()
+        for order_id, content in (('RC-1', original), ('RC-2', original), ('RC-3', self.receipt_jpeg((450, 600), 60))):
+            response = self.upload(order_id, content)
+            self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(response.data['has_duplicates'])
+
+        first = ECPointRequest.objects.get(order_id='RC-1')
+        detections = {
+            detection.duplicate_request.order_id: (detection.detection_details['match'], detection.severity)
+            for detection in DuplicateDetection.objects.filter(detection_type='image_match', original_request=first)
+        }
+        self.assertEqual(detections, {'RC-2': ('exact', 'high'), 'RC-3': ('similar', 'medium')})
+
+        self.assertEqual(ReceiptImage.objects.filter(thumbnail_status='pending').count(), 3)
+        self.assertEqual(receipt_image_service.drain(), {'completed': 3, 'retried': 0, 'failed': 0})
+        record = ReceiptImage.objects.get(ec_request=first)
+        self.assertLess(record.thumbnail.size, record.file_size)
+        self.assertTrue(record.thumbnail.name.startswith('receipts/thumbnails/'))
+
+    def test_exact_match_is_not_cut_by_candidate_limit(self):
+        """類似画像の候補が上限を超えても、古い同一画像の申請は検知する"""
+        from unittest import mock
+        from core.receipt_image_service import receipt_image_service
+
+        def fingerprint(content_hash):
+            return {'content_hash': content_hash, 'perceptual_hash': '00000000000000ff', 'file_size': 1000}
+
+        receipt_image_service.register(create_ec_request(self.user, self.store, 'RC-OLD'), fingerprint('a' * 64))
+        for index in range(3):
+            receipt_image_service.register(
+                create_ec_request(self.user, self.store, f'RC-NEW-{index}'), fingerprint(f'{index}' * 64)
+            )
+
+        oldest = ECPointRequest.objects.get(order_id='RC-OLD')
+        with mock.patch.object(receipt_image_service, 'candidate_limit', 2):
+            matches = receipt_image_service.find_matches(fingerprint('a' * 64))
+        self.assertEqual(matches[0], {'request_id': oldest.pk, 'match': 'exact', 'distance': 0})
+        self.assertEqual([match['match'] for match in matches], ['exact', 'similar', 'similar'])
+
+
+class StageLatencyTest(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Latency Store',
+            owner_name='Owner',
+            email='latencystore@test.com',
+            phone='03-0000-0000',
+            address='Test Address'
+        )
+
+    def test_histograms_flush_and_percentiles(self):
+        """プロセス内のヒストグラムを加算して書き込み、段階別・日別の百分位数を返す"""
+        from core.models import StageLatency
+        from core.latency_service import LatencyService
+
+        service = LatencyService()
+        for duration_ms in range(1, 101):
+            service.record('payment', float(duration_ms), self.store.id)
+        service.record('notification', 5.0)
+        self.assertEqual(service.flush(), 2)
+
+        # 2回目の書き込みは既存の行に加算する
+        service.record('payment', 1000.0, self.store.id)
+        service.flush()
+        row = StageLatency.objects.get(stage='payment', store=self.store)
+        self.assertEqual((row.count, row.max_ms, sum(row.bucket_counts)), (101, 1000.0, 101))
+
+        results = service.stage_percentiles(days=1, store_id=self.store.id)
+        self.assertEqual([result['stage'] for result in results], ['payment'])
+        payment = results[0]
+        self.assertEqual(payment['date'], timezone.localdate().isoformat())
+        # 対数区間（20%）の上限で近似する
+        self.assertTrue(50 <= payment['p50_ms'] <= 60, payment)
+        self.assertTrue(95 <= payment['p95_ms'] <= 114, payment)
+        self.assertEqual(payment['max_ms'], 1000.0)
+
+        by_stage = service.stage_percentiles(days=1, group_by='stage')
+        self.assertEqual([(result['stage'], result['count']) for result in by_stage], [('payment', 101), ('notification', 1)])
+
+    def test_rows_without_store_are_unique(self):
+        """店舗なしの行も (日付, 段階) ごとに1行で、複数プロセスの書き込みは同じ行に加算する"""
+        from django.db import IntegrityError, transaction
+        from core.models import StageLatency
+        from core.latency_service import LatencyService
+
+        for service in (LatencyService(), LatencyService()):
+            service.record('notification', 5.0)
+            self.assertEqual(service.flush(), 1)
+        row = StageLatency.objects.get(stage='notification', store__isnull=True)
+        self.assertEqual(row.count, 2)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StageLatency.objects.create(day=row.day, stage='notification', store=None)
+
+
+class WebhookKeyCacheTest(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(
+            name='Key Cache Store',
+            owner_name='Owner',
+            email='keycachestore@test.com',
+            phone='03-0000-0000',
+            address='Test Address',
+            status='active'
+        )
+        self.webhook_key = StoreWebhookKey.objects.create(store=self.store, webhook_key=StoreWebhookKey.generate_key())
+
+    def test_resolve_is_cached_and_invalidated(self):
+        """2回目以降のキー解決はDBに問い合わせず、キーの無効化・店舗の停止でキャッシュを破棄する"""
+        from core.webhook_key_service import webhook_key_service
+
+        self.assertEqual(webhook_key_service.resolve(self.webhook_key.webhook_key).store_id, self.store.id)
+        with self.assertNumQueries(0):
+            resolved = webhook_key_service.resolve(self.webhook_key.webhook_key)
+            self.assertEqual((resolved.store.name, resolved.rate_limit_per_minute), ('Key Cache Store', 60))
+        self.assertIsNone(webhook_key_service.resolve('unknown-key'))
+
+        # 最終使用日時の更新ではキャッシュを破棄しない
+        webhook_key_service.touch(resolved)
+        self.assertEqual(webhook_key_service.flush_last_used(), 1)
+        self.webhook_key.refresh_from_db()
+        self.assertIsNotNone(self.webhook_key.last_used_at)
+        with self.assertNumQueries(0):
+            webhook_key_service.resolve(self.webhook_key.webhook_key)
+
+        self.store.status = 'suspended'
+        self.store.save()
+        self.assertIsNone(webhook_key_service.resolve(self.webhook_key.webhook_key))
+
+        self.store.status = 'active'
+        self.store.save()
+        self.webhook_key.is_active = False
+        self.webhook_key.save()
+        self.assertIsNone(webhook_key_service.resolve(self.webhook_key.webhook_key))
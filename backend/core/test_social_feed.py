@@ -0,0 +1,222 @@
+from django.test import TestCase
+from django.db import connection
+from django.contrib.auth import get_user_model
+from unittest import mock
+
+from core.social_models import (
+    SocialPost, Friendship, UserBlock, SocialPostLike, SocialPostShare, SocialPostComment
+)
+from core.social_feed_service import social_feed_service
+from core.social_timeline_service import social_timeline_service, LocalTimelineStore
+
+User = get_user_model()
+
+# ソーシャル機能のモデルはマイグレーションがないため、テスト用DBに直接作成する
+SOCIAL_MODELS = [Friendship, UserBlock, SocialPost, SocialPostLike, SocialPostShare, SocialPostComment]
+
+
+class SocialTablesTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        existing = set(connection.introspection.table_names())
+        cls.created_models = [model for model in SOCIAL_MODELS if model._meta.db_table not in existing]
+        with connection.schema_editor() as editor:
+            for model in cls.created_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.created_models):
+                editor.delete_model(model)
+
+    def create_user(self, name):
+        return User.objects.create_user(username=name, email=f'{name}@test.com', member_id=f'social_{name}')
+
+    def befriend(self, user, other):
+        return Friendship.objects.create(from_user=user, to_user=other, status='accepted')
+
+    def post(self, author, visibility='friends', allowed_users=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = SocialPost.objects.create(
+                author=author, post_type='text', content=f'{author.username} post', visibility=visibility
+            )
+            if allowed_users:
+                post.allowed_users.add(*allowed_users)
+        return post
+
+
+class SocialTimelineTest(SocialTablesTestCase):
+    def setUp(self):
+        social_timeline_service._store = LocalTimelineStore()
+        self.addCleanup(setattr, social_timeline_service, 'max_length', social_timeline_service.max_length)
+        self.viewer = self.create_user('viewer')
+        self.friend = self.create_user('friend')
+        self.other_friend = self.create_user('other_friend')
+        self.befriend(self.viewer, self.friend)
+        self.befriend(self.other_friend, self.viewer)
+
+    def tearDown(self):
+        social_timeline_service._store = None
+
+    def timeline_post_ids(self, user):
+        found = social_timeline_service.store.get(user.id, None, 100)
+        return None if found is None else [post_id for _, post_id, _ in found[0]]
+
+    def feed_ids(self, user, page_size=20):
+        """全ページをたどって投稿IDを返す"""
+        post_ids, cursor = [], None
+        while True:
+            posts, cursor = social_timeline_service.feed_page(user, cursor, page_size)
+            post_ids += [post.id for post in posts]
+            if cursor is None:
+                return post_ids
+
+    def test_rebuild_on_miss_and_fan_out_on_post(self):
+        """未作成のタイムラインは読み込み時に作成し、以降の投稿は作成済みのタイムラインへ配信する"""
+        old = self.post(self.friend)
+        self.assertIsNone(self.timeline_post_ids(self.viewer))
+
+        self.assertEqual(self.feed_ids(self.viewer), [old.id])
+        self.assertEqual(self.timeline_post_ids(self.viewer), [old.id])
+
+        new = self.post(self.friend)
+        private = self.post(self.friend, visibility='private')
+        self.assertEqual(self.timeline_post_ids(self.viewer), [new.id, old.id])
+        self.assertEqual(self.feed_ids(self.viewer), [new.id, old.id])
+        self.assertNotIn(private.id, self.feed_ids(self.viewer))
+
+    def test_warm_read_is_one_query(self):
+        """作成済みのタイムラインからの読み込みは投稿の取得1クエリのみ"""
+        for _ in range(3):
+            self.post(self.friend)
+        social_timeline_service.feed_page(self.viewer, None, 2)
+
+        with self.assertNumQueries(1):
+            posts, cursor = social_timeline_service.feed_page(self.viewer, None, 2)
+        self.assertEqual(len(posts), 2)
+        with self.assertNumQueries(1):
+            posts, _ = social_timeline_service.feed_page(self.viewer, cursor, 2)
+        self.assertEqual(len(posts), 1)
+
+    def test_prune_on_unfriend_and_block(self):
+        """フレンド解除・ブロック時は互いのタイムラインから相手の投稿を取り除く"""
+        friend_post = self.post(self.friend)
+        other_post = self.post(self.other_friend)
+        own_post = self.post(self.viewer)
+        self.feed_ids(self.viewer)
+        self.feed_ids(self.friend)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(from_user=self.viewer, to_user=self.friend).delete()
+        self.assertEqual(self.timeline_post_ids(self.viewer), [own_post.id, other_post.id])
+        self.assertNotIn(own_post.id, self.timeline_post_ids(self.friend))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBlock.objects.create(blocker=self.other_friend, blocked=self.viewer)
+        self.assertEqual(self.timeline_post_ids(self.viewer), [own_post.id])
+        self.assertEqual(self.feed_ids(self.viewer), [own_post.id])
+        self.assertNotIn(friend_post.id, self.feed_ids(self.viewer))
+
+    def test_cursor_paging_beyond_retained_window(self):
+        """保持件数を超えて遡るページはDBから取得し、重複・欠落なくたどれる"""
+        social_timeline_service.max_length = 3
+        posts = [self.post(self.friend) for _ in range(5)]
+        expected = [post.id for post in reversed(posts)]
+
+        self.assertEqual(self.feed_ids(self.viewer, page_size=2), expected)
+        self.assertEqual(self.timeline_post_ids(self.viewer), expected[:3])
+
+        # 配信による切り詰め後も同様
+        newest = self.post(self.friend)
+        self.assertEqual(self.timeline_post_ids(self.viewer), [newest.id] + expected[:2])
+        self.assertEqual(self.feed_ids(self.viewer, page_size=2), [newest.id] + expected)
+
+    def test_pruned_truncated_timeline_reads_older_posts_from_database(self):
+        """切り詰めたタイムラインから投稿を取り除いても、それより古い投稿は隠れない"""
+        social_timeline_service.max_length = 3
+        older = [self.post(self.other_friend) for _ in range(2)]
+        for _ in range(3):
+            self.post(self.friend)
+        self.feed_ids(self.viewer)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(from_user=self.viewer, to_user=self.friend).delete()
+        self.assertEqual(self.timeline_post_ids(self.viewer), [])
+        self.assertEqual(self.feed_ids(self.viewer), [post.id for post in reversed(older)])
+
+    def test_fan_out_failure_is_logged_not_raised(self):
+        """配信先の取得に失敗してもコミット後の処理から例外を送出せず、投稿者のタイムラインを破棄する"""
+        self.feed_ids(self.viewer)
+        with mock.patch.object(social_timeline_service, 'recipients', side_effect=RuntimeError('db down')):
+            with self.assertLogs('core.social_timeline_service', level='ERROR'):
+                post = self.post(self.viewer)
+        self.assertIsNone(self.timeline_post_ids(self.viewer))
+        self.assertEqual(self.feed_ids(self.viewer), [post.id])
+
+
+class SocialFeedVisibilityTest(SocialTablesTestCase):
+    def setUp(self):
+        social_timeline_service._store = LocalTimelineStore()
+        self.viewer = self.create_user('viewer')
+        self.friend = self.create_user('friend')
+        self.stranger = self.create_user('stranger')
+        self.befriend(self.friend, self.viewer)
+
+    def tearDown(self):
+        social_timeline_service._store = None
+
+    def visible_ids(self, viewer):
+        return set(social_feed_service.visible_posts(viewer).values_list('id', flat=True))
+
+    def test_visibility_rules(self):
+        """公開は全員、フレンドのみはフレンド、制限公開は許可されたユーザー、自分のみは投稿者だけが閲覧できる"""
+        public = self.post(self.stranger, visibility='public')
+        friends_only = self.post(self.friend, visibility='friends')
+        stranger_friends_only = self.post(self.stranger, visibility='friends')
+        limited = self.post(self.stranger, visibility='limited', allowed_users=[self.viewer])
+        limited_other = self.post(self.friend, visibility='limited', allowed_users=[self.stranger])
+        private = self.post(self.friend, visibility='private')
+
+        self.assertEqual(self.visible_ids(self.viewer), {public.id, friends_only.id, limited.id})
+        self.assertEqual(
+            self.visible_ids(self.friend), {public.id, friends_only.id, limited_other.id, private.id}
+        )
+        self.assertNotIn(stranger_friends_only.id, self.visible_ids(self.friend))
+
+    def test_block_hides_posts_in_both_directions(self):
+        """ブロックした側・された側のどちらからも相手の投稿は見えず、自分の投稿は見える"""
+        viewer_post = self.post(self.viewer, visibility='public')
+        stranger_post = self.post(self.stranger, visibility='public')
+        friend_post = self.post(self.friend, visibility='public')
+        UserBlock.objects.create(blocker=self.viewer, blocked=self.stranger)
+
+        self.assertEqual(self.visible_ids(self.viewer), {viewer_post.id, friend_post.id})
+        self.assertEqual(self.visible_ids(self.stranger), {stranger_post.id, friend_post.id})
+
+    def test_cursor_pages_through_created_at_ties(self):
+        """作成日時が同じ投稿がページの境界をまたいでも、重複・欠落なくたどれる"""
+        posts = [self.post(self.friend) for _ in range(5)]
+        SocialPost.objects.filter(pk__in=[post.pk for post in posts]).update(created_at=posts[0].created_at)
+
+        queryset = social_feed_service.visible_posts(self.viewer)
+        post_ids, cursor = [], None
+        while True:
+            page, cursor = social_feed_service.page(queryset, cursor, 2)
+            post_ids += [post.id for post in page]
+            if cursor is None:
+                break
+        self.assertEqual(post_ids, sorted((post.id for post in posts), reverse=True))
+
+    def test_invalid_cursor_returns_400(self):
+        """不正なカーソルは400を返す"""
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from core.social_posts_views import SocialPostViewSet
+
+        request = APIRequestFactory().get('/api/social/posts/feed/', {'cursor': 'not-a-cursor'})
+        force_authenticate(request, user=self.viewer)
+        response = SocialPostViewSet.as_view({'get': 'feed'})(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['success'])
@@ -0,0 +1,196 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from collections import defaultdict
+from decimal import Decimal
+import logging
+
+from .models import ECPointRequest
+
+logger = logging.getLogger(__name__)
+
+
+class VelocityCounterService:
+    """EC申請の不審パターン判定用スライディングウィンドウカウンター
+
+    ユーザー・店舗・(ユーザー, 金額) ごとの申請件数を、ウィンドウを細分化したバケット単位で
+    共有キャッシュに加算し、判定時は全バケットを1回の get_many で読み出して合計する。
+    ウィンドウ境界にかかる最古のバケットは重なり割合で按分する（近似値）。
+    共有キャッシュが利用できない場合はプロセス内キャッシュで代替する。
+    """
+
+    KEY = 'ec_velocity:{dimension}:{key}:{bucket}'
+    LATEST_KEY = 'ec_velocity:{dimension}:{key}:latest'
+
+    # 種別ごとの (ウィンドウ秒, バケット秒)
+    WINDOWS = {
+        'user': (60 * 60, 5 * 60),
+        'store': (60 * 60, 5 * 60),
+        'user_amount': (7 * 24 * 60 * 60, 6 * 60 * 60),
+    }
+
+    def __init__(self):
+        self.fallback_cache = LocMemCache('ec-velocity-fallback', {'TIMEOUT': None})
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'EC_VELOCITY_CACHE', 'default')]
+
+    @staticmethod
+    def _normalize_amount(amount):
+        return str(Decimal(amount).quantize(Decimal('0.01')))
+
+    def _dimension_keys(self, user_id, store_id, amount):
+        return {
+            'user': user_id,
+            'store': store_id,
+            'user_amount': f'{user_id}:{self._normalize_amount(amount)}',
+        }
+
+    def _bucket_key(self, dimension, key, timestamp):
+        bucket_seconds = self.WINDOWS[dimension][1]
+        return self.KEY.format(dimension=dimension, key=key, bucket=int(timestamp // bucket_seconds))
+
+    def _timeout(self, dimension):
+        window, bucket_seconds = self.WINDOWS[dimension]
+        return window + bucket_seconds
+
+    def _call(self, method, *args, **kwargs):
+        """共有キャッシュを操作し、障害時はプロセス内キャッシュで代替"""
+        try:
+            return getattr(self.cache, method)(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Velocity counter cache unavailable, using in-process fallback: {str(e)}")
+            return getattr(self.fallback_cache, method)(*args, **kwargs)
+
+    def _increment(self, cache_key, amount, timeout):
+        self._call('add', cache_key, 0, timeout)
+        try:
+            self._call('incr', cache_key, amount)
+        except ValueError:
+            # add と incr の間に期限切れになった場合
+            self._call('set', cache_key, amount, timeout)
+
+    def record(self, user_id, store_id, amount, request_id, at=None):
+        """申請1件をカウンターに加算（申請作成のコミット後に呼び出す）"""
+        timestamp = (at or timezone.now()).timestamp()
+        for dimension, key in self._dimension_keys(user_id, store_id, amount).items():
+            timeout = self._timeout(dimension)
+            self._increment(self._bucket_key(dimension, key, timestamp), 1, timeout)
+            self._call('set', self.LATEST_KEY.format(dimension=dimension, key=key), request_id, timeout)
+
+    def record_request(self, ec_request):
+        self.record(ec_request.user_id, ec_request.store_id, ec_request.purchase_amount,
+                    ec_request.id, ec_request.created_at)
+
+    def record_requests(self, ec_requests):
+        """一括作成した申請をカウンターに加算（バケットごとにまとめて加算、申請ID順に作成されていること）"""
+        increments = defaultdict(int)
+        latest = {}
+        for ec_request in ec_requests:
+            timestamp = (ec_request.created_at or timezone.now()).timestamp()
+            keys = self._dimension_keys(ec_request.user_id, ec_request.store_id, ec_request.purchase_amount)
+            for dimension, key in keys.items():
+                increments[(dimension, self._bucket_key(dimension, key, timestamp))] += 1
+                latest[(dimension, self.LATEST_KEY.format(dimension=dimension, key=key))] = ec_request.id
+
+        for (dimension, cache_key), count in increments.items():
+            self._increment(cache_key, count, self._timeout(dimension))
+        for dimension in self.WINDOWS:
+            values = {cache_key: request_id for (kind, cache_key), request_id in latest.items() if kind == dimension}
+            if values:
+                self._call('set_many', values, self._timeout(dimension))
+
+    def activity_signals(self, user_id, store_id, amount, now=None):
+        """不審パターン判定用の件数と最新申請IDを返す（キャッシュ1往復）"""
+        return self.activity_signals_many([(user_id, store_id, amount)], now)[0]
+
+    def activity_signals_many(self, keys, now=None):
+        """[(ユーザーID, 店舗ID, 金額), ...] ごとの件数と最新申請IDを返す（キャッシュ1往復）"""
+        now = (now or timezone.now()).timestamp()
+
+        # 申請ごと・種別ごとに (キャッシュキー, 重み) の一覧を作成
+        weighted_keys = []
+        latest_keys = []
+        for user_id, store_id, amount in keys:
+            dimension_keys = self._dimension_keys(user_id, store_id, amount)
+            weighted = {}
+            for dimension, key in dimension_keys.items():
+                window, bucket_seconds = self.WINDOWS[dimension]
+                window_start = now - window
+                first_bucket = int(window_start // bucket_seconds)
+                last_bucket = int(now // bucket_seconds)
+                weighted[dimension] = [
+                    (
+                        self.KEY.format(dimension=dimension, key=key, bucket=bucket),
+                        # 最古のバケットはウィンドウと重なる割合のみ算入
+                        ((bucket + 1) * bucket_seconds - window_start) / bucket_seconds
+                        if bucket == first_bucket else 1
+                    )
+                    for bucket in range(first_bucket, last_bucket + 1)
+                ]
+            weighted_keys.append(weighted)
+            latest_keys.append({
+                dimension: self.LATEST_KEY.format(dimension=dimension, key=key)
+                for dimension, key in dimension_keys.items()
+            })
+
+        cache_keys = {
+            cache_key
+            for weighted in weighted_keys for bucket_keys in weighted.values() for cache_key, _ in bucket_keys
+        }
+        cache_keys.update(cache_key for latest in latest_keys for cache_key in latest.values())
+        values = self._call('get_many', list(cache_keys))
+
+        signals = []
+        for weighted, latest in zip(weighted_keys, latest_keys):
+            counts = {
+                dimension: int(round(sum(values.get(cache_key, 0) * weight for cache_key, weight in bucket_keys)))
+                for dimension, bucket_keys in weighted.items()
+            }
+            signals.append({
+                'user_hour_count': counts['user'],
+                'user_hour_latest': values.get(latest['user']),
+                'same_amount_count': counts['user_amount'],
+                'same_amount_latest': values.get(latest['user_amount']),
+                'store_hour_count': counts['store'],
+                'store_hour_latest': values.get(latest['store']),
+            })
+        return signals
+
+    def rebuild(self, dry_run=False):
+        """直近ウィンドウ分の申請からカウンターを再構築（キャッシュ消去・デプロイ後に実行）
+
+        再構築対象のバケットは上書きされるため、実行中に作成された申請は再度加算されない場合がある。
+        """
+        now = timezone.now()
+        longest_window = max(window for window, _ in self.WINDOWS.values())
+        buckets = defaultdict(int)
+        latest = {}
+
+        requests = ECPointRequest.objects.filter(
+            created_at__gte=now - timezone.timedelta(seconds=longest_window)
+        ).order_by('id').values_list('id', 'user_id', 'store_id', 'purchase_amount', 'created_at')
+
+        for request_id, user_id, store_id, amount, created_at in requests.iterator(chunk_size=5000):
+            timestamp = created_at.timestamp()
+            for dimension, key in self._dimension_keys(user_id, store_id, amount).items():
+                if timestamp < now.timestamp() - self.WINDOWS[dimension][0]:
+                    continue
+                buckets[(dimension, self._bucket_key(dimension, key, timestamp))] += 1
+                latest[(dimension, self.LATEST_KEY.format(dimension=dimension, key=key))] = request_id
+
+        if not dry_run:
+            for dimension in self.WINDOWS:
+                values = {cache_key: count for (kind, cache_key), count in buckets.items() if kind == dimension}
+                values.update({cache_key: request_id for (kind, cache_key), request_id in latest.items() if kind == dimension})
+                if values:
+                    self._call('set_many', values, self._timeout(dimension))
+
+        logger.info(f"Velocity counters rebuilt: {len(buckets)} buckets")
+        return len(buckets)
+
+
+# グローバルインスタンス
+velocity_counter_service = VelocityCounterService()
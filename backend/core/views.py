@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 from django.contrib.auth import get_user_model, authenticate
 from django.utils import timezone
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from datetime import datetime, timedelta
 import jwt
@@ -16,6 +17,9 @@ from .serializers import (
     GiftSerializer, GiftCategorySerializer, GiftExchangeSerializer, GiftExchangeRequestSerializer
 )
 from .digital_gift_client import get_digital_gift_client, DigitalGiftAPIError
+from .point_service import point_service
+from .idempotency_service import idempotency_service
+from .ledger_archive_service import ledger_archive_service
 
 logger = logging.getLogger(__name__)
 
@@ -268,44 +272,66 @@ class PointGrantView(APIView):
             except User.DoesNotExist:
                 user = User.objects.get(username=uid)
             
-            user.points += int(points)
-            user.save()
+            points = int(points)
             
-            from .models import Store
-            default_store = Store.objects.first()
-            
-            transaction = PointTransaction.objects.create(
-                user=user,
-                store=default_store,
-                amount=0,
-                points_issued=int(points),
-                payment_method='grant',
-                status='completed',
-                description=reason
+            def run_grant():
+                point_service.award_points(
+                    user,
+                    points,
+                    description=reason or f"{points}ポイント付与",
+                    reference_id=reference_id
+                )
+                return {
+                    'success': True,
+                    'message': f'{points} points granted to {user.username}',
+                    'user_points': user.point_balance
+                }, 200
+            
+            # 再送時は同じ冪等キーで元の付与結果を返す
+            reference_id = idempotency_service.key_from_request(request)
+            body, status_code, replayed = idempotency_service.execute(
+                'point_grant',
+                idempotency_service.actor_key('user', request.user.pk),
+                reference_id,
+                run_grant
+            )
+            return Response(
+                body,
+                status=status_code,
+                headers={'Idempotent-Replayed': 'true'} if replayed else None
             )
-            
-            return Response({
-                'success': True,
-                'message': f'{points} points granted to {user.username}',
-                'user_points': user.points
-            })
             
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=404)
+        except (ValueError, ValidationError) as e:
+            return Response({'error': str(e)}, status=400)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
 
 class PointHistoryView(APIView):
     def get(self, request):
-        transactions = PointTransaction.objects.filter(
-            points_issued__gt=0
-        ).order_by('-transaction_date')[:50]
+        # 付与履歴（アーカイブ済みの月も透過的に参照）
+        transactions = ledger_archive_service.recent_transactions(limit=50, positive_only=True)
         
-        serializer = PointTransactionSerializer(transactions, many=True)
         return Response({
             'success': True,
-            'transactions': serializer.data
+            'transactions': [
+                {
+                    'id': trans['id'],
+                    'user': trans['user_id'],
+                    'store': trans['store_id'],
+                    'user_name': trans['user_name'],
+                    'store_name': trans['store_name'],
+                    'points': trans['points'],
+                    'transaction_type': trans['transaction_type'],
+                    'description': trans['description'],
+                    'reference_id': trans['reference_id'],
+                    'created_at': trans['created_at'],
+                    'archived': trans['archived']
+                }
+                for trans in transactions
+            ]
         })
 
 
@@ -0,0 +1,498 @@
+from django.db import transaction
+from django.db.models import Q, F, Count, Min
+from django.db.models.functions import Mod
+from django.utils import timezone
+from rest_framework import status
+import json
+import logging
+import time
+
+from .models import (
+    ECPointRequest, DuplicateDetection, IdempotencyRecord, User, WebhookQueueItem, WebhookDeadLetter
+)
+from .duplicate_detection_service import DuplicateDetectionService
+from .notification_service import NotificationService
+from .idempotency_service import idempotency_service
+from .velocity_counter_service import velocity_counter_service
+from .order_id_index_service import order_id_index_service
+from .ec_stats_service import ec_stats_service
+from .latency_service import latency_service
+from .webhook_key_service import webhook_key_service
+from .ec_point_serializers import WebhookRequestSerializer, WebhookBatchLineSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookIngestService:
+    """Webhook購入通知の取り込みサービス
+
+    同期モードではリクエスト内で取り込み処理（重複検知・申請作成・通知）を実行する。
+    非同期モードでは受信データのみをキューに保存して即座に応答し、ワーカーがキューを
+    バッチ単位で取り出して同じ取り込み処理を実行する。一括受信（ingest_batch）は検証・
+    重複検知・作成をバッチ全体で集合単位に行う。
+
+    店舗ごとの受信順を保つため、ワーカーは店舗IDで分割したパーティションを1つずつ担当し、
+    再試行待ち・処理中の項目がある店舗の後続項目は取り出さない。
+    """
+
+    SCOPE = 'ec_webhook'
+
+    def __init__(self):
+        self.batch_size = 100
+        self.max_attempts = 5
+        self.retry_base_seconds = 30  # 再試行間隔（試行ごとに倍増）
+        self.lease_seconds = 300  # 処理中のまま この秒数を超えた項目はワーカー停止とみなして戻す
+        self.completed_retention_days = 7
+        self.max_batch_lines = 1000  # 一括受信1回あたりの上限行数
+
+    def process(self, validated_data, ip_address, user_agent, start_time=None):
+        """取り込み処理を冪等キー付きで実行し、(レスポンス内容, ステータス, 再送か) を返す"""
+        start_time = start_time or time.time()
+        user = validated_data['user_id']  # 既にUserオブジェクト
+        webhook_key = validated_data['store_key']  # 既にStoreWebhookKeyオブジェクト
+        store = webhook_key.store
+        purchase_date = validated_data.get('purchase_date', timezone.now())
+
+        def run_webhook():
+            # 重複検知
+            with latency_service.measure('duplicate_detection', store.id):
+                duplicate_service = DuplicateDetectionService()
+                potential_duplicates = duplicate_service.check_for_duplicates(
+                    user=user,
+                    store=store,
+                    amount=validated_data['amount'],
+                    order_id=validated_data['order_id'],
+                    purchase_date=purchase_date
+                )
+
+            with transaction.atomic():
+                # ECポイント申請を作成（リクエストハッシュは申請内容から生成）
+                ec_request = ECPointRequest(
+                    request_type='webhook',
+                    user=user,
+                    store=store,
+                    purchase_amount=validated_data['amount'],
+                    order_id=validated_data['order_id'],
+                    purchase_date=purchase_date,
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    points_to_award=int(validated_data['amount'] // 100)
+                )
+                ec_request.request_hash = ec_request.generate_request_hash()
+                ec_request.save()
+
+                # 重複検知結果を記録
+                if potential_duplicates:
+                    for duplicate in potential_duplicates:
+                        DuplicateDetection.objects.create(
+                            detection_type=duplicate['type'],
+                            original_request=duplicate['original'],
+                            duplicate_request=ec_request,
+                            detection_details=duplicate['details'],
+                            severity=duplicate['severity']
+                        )
+
+                # Webhookキーの使用記録を更新（定期的にまとめて書き込む）
+                webhook_key_service.touch(webhook_key)
+
+                # 店舗に承認依頼通知
+                with latency_service.measure('notification', store.id):
+                    notification_service = NotificationService()
+                    notification_service.notify_store_approval_request(ec_request)
+
+            processing_time = int((time.time() - start_time) * 1000)
+            latency_service.record('webhook_total', (time.time() - start_time) * 1000, store.id)
+            logger.info(f"Webhook processed: Store {store.name}, User {user.username}, Amount {validated_data['amount']}, Time: {processing_time}ms")
+
+            return {
+                'success': True,
+                'request_id': ec_request.id,
+                'message': 'Purchase notification received',
+                'processing_time_ms': processing_time
+            }, status.HTTP_201_CREATED
+
+        return idempotency_service.execute(
+            self.SCOPE, idempotency_service.actor_key('store', store.id), validated_data['order_id'], run_webhook
+        )
+
+    # === 一括受信 ===
+
+    def parse_batch(self, body):
+        """JSON配列またはNDJSONの本文を (各行, {行位置: 解析エラー}) に分解"""
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if text.lstrip().startswith('['):
+            lines = json.loads(text)
+            return lines, {}
+
+        lines, errors = [], {}
+        for raw_line in text.splitlines():
+            if not raw_line.strip():
+                continue
+            try:
+                lines.append(json.loads(raw_line))
+            except ValueError as e:
+                errors[len(lines)] = f'JSONとして解析できません: {str(e)}'
+                lines.append(None)
+        return lines, errors
+
+    def ingest_batch(self, webhook_key, lines, ip_address, user_agent, parse_errors=None):
+        """一括購入通知を取り込み、行ごとの結果の一覧を返す
+
+        店舗キーは呼び出し側で1回だけ認証する。形式チェックは行ごとに行い、ユーザー・再送・
+        処理済み注文IDはバッチ全体をまとめて照会する。重複検知は集合単位で行い、申請・重複検知
+        結果・冪等キーは一括作成する（1件目のWebhookと同じ冪等キーを記録するため、
+        同じ注文を単発のWebhookで再送しても元の結果が返る）。
+        """
+        store = webhook_key.store
+        actor_key = idempotency_service.actor_key('store', store.id)
+        parse_errors = parse_errors or {}
+        results = [None] * len(lines)
+
+        def error(index, order_id, errors):
+            results[index] = {'line': index + 1, 'order_id': order_id, 'status': status.HTTP_400_BAD_REQUEST, 'errors': errors}
+
+        # 1. 行ごとの形式チェック（レイテンシはバッチ全体で1件として記録）
+        validation_started = time.perf_counter()
+        parsed = []
+        for index, line in enumerate(lines):
+            if index in parse_errors:
+                error(index, None, {'non_field_errors': [parse_errors[index]]})
+                continue
+            if not isinstance(line, dict):
+                error(index, None, {'non_field_errors': ['注文データはオブジェクトで指定してください']})
+                continue
+            serializer = WebhookBatchLineSerializer(data=line)
+            if not serializer.is_valid():
+                error(index, line.get('order_id'), serializer.errors)
+                continue
+            parsed.append((index, serializer.validated_data))
+        latency_service.record('validation', (time.perf_counter() - validation_started) * 1000, store.id)
+
+        # 2. 再送・ユーザー・処理済み注文IDをまとめて照会
+        order_ids = list({data['order_id'] for _, data in parsed})
+        replays = {
+            record['reference_id']: record for record in IdempotencyRecord.objects.filter(
+                scope=self.SCOPE,
+                actor_key=actor_key,
+                reference_id__in=order_ids,
+                response_status__isnull=False
+            ).values('reference_id', 'response_body', 'response_status')
+        }
+        users = User.objects.filter(
+            id__in={data['user_id'] for _, data in parsed}, role='customer', status='active'
+        ).in_bulk()
+        processed = set(
+            ECPointRequest.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True)
+        )
+
+        entries = []
+        seen = set()
+        for index, data in parsed:
+            order_id = data['order_id']
+            replay = replays.get(order_id)
+            if replay is not None:
+                results[index] = {
+                    'line': index + 1,
+                    'order_id': order_id,
+                    'status': replay['response_status'],
+                    'request_id': replay['response_body'].get('request_id'),
+                    'replayed': True
+                }
+            elif data['user_id'] not in users:
+                error(index, order_id, {'user_id': ['有効なユーザーが見つかりません']})
+            elif order_id in processed or order_id in seen:
+                error(index, order_id, {'order_id': ['この注文IDは既に処理済みです']})
+            else:
+                seen.add(order_id)
+                entries.append({
+                    'line': index,
+                    'user': users[data['user_id']],
+                    'amount': data['amount'],
+                    'order_id': order_id,
+                    'purchase_date': data.get('purchase_date', timezone.now()),
+                })
+
+        if not entries:
+            return results
+
+        # 3. 集合単位の重複検知
+        with latency_service.measure('duplicate_detection', store.id):
+            duplicates = DuplicateDetectionService().check_batch(store, entries)
+
+        # 4. 一括作成
+        with transaction.atomic():
+            ec_requests = []
+            for entry in entries:
+                ec_request = ECPointRequest(
+                    request_type='webhook',
+                    user=entry['user'],
+                    store=store,
+                    purchase_amount=entry['amount'],
+                    order_id=entry['order_id'],
+                    purchase_date=entry['purchase_date'],
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    points_to_award=int(entry['amount'] // 100)
+                )
+                ec_request.request_hash = ec_request.generate_request_hash()
+                ec_requests.append(ec_request)
+            ec_requests = ECPointRequest.objects.bulk_create(ec_requests)
+            ec_stats_service.record_created(ec_requests)
+
+            DuplicateDetection.objects.bulk_create([
+                DuplicateDetection(
+                    detection_type=duplicate['type'],
+                    # バッチ内の先行する申請はバッチ内の位置で返される
+                    original_request=ec_requests[duplicate['original']]
+                    if isinstance(duplicate['original'], int) else duplicate['original'],
+                    duplicate_request=ec_request,
+                    detection_details=duplicate['details'],
+                    severity=duplicate['severity']
+                )
+                for ec_request, entry_duplicates in zip(ec_requests, duplicates)
+                for duplicate in entry_duplicates
+            ])
+
+            IdempotencyRecord.objects.bulk_create([
+                IdempotencyRecord(
+                    scope=self.SCOPE,
+                    actor_key=actor_key,
+                    reference_id=ec_request.order_id,
+                    response_body={
+                        'success': True,
+                        'request_id': ec_request.id,
+                        'message': 'Purchase notification received'
+                    },
+                    response_status=status.HTTP_201_CREATED
+                )
+                for ec_request in ec_requests
+            ])
+
+            webhook_key_service.touch(webhook_key)
+            with latency_service.measure('notification', store.id):
+                NotificationService().notify_store_batch_approval_request(store, ec_requests)
+
+            # 一括作成では post_save シグナルが発火しないため、カウンターと類似検索インデックスを直接更新
+            def index_requests():
+                try:
+                    velocity_counter_service.record_requests(ec_requests)
+                except Exception as e:
+                    logger.error(f"Failed to record velocity counters for EC request batch: {str(e)}")
+                try:
+                    order_id_index_service.add_many([
+                        (store.id, ec_request.order_id, ec_request.created_at) for ec_request in ec_requests
+                    ])
+                except Exception as e:
+                    # 登録できなかった注文IDは rebuild_order_id_index で再登録される
+                    logger.error(f"Failed to index order IDs for EC request batch: {str(e)}")
+
+            transaction.on_commit(index_requests)
+
+        for entry, ec_request, entry_duplicates in zip(entries, ec_requests, duplicates):
+            results[entry['line']] = {
+                'line': entry['line'] + 1,
+                'order_id': ec_request.order_id,
+                'status': status.HTTP_201_CREATED,
+                'request_id': ec_request.id,
+                'duplicate_flags': len(entry_duplicates)
+            }
+
+        logger.info(f"Webhook batch processed: Store {store.name}, {len(ec_requests)} of {len(lines)} lines created")
+        return results
+
+    # === 非同期モード（キュー） ===
+
+    def enqueue(self, store, payload, ip_address, user_agent):
+        """受信データをキューに保存"""
+        return WebhookQueueItem.objects.create(
+            store=store,
+            payload=payload,
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+
+    def _partition_items(self, partition, partitions):
+        items = WebhookQueueItem.objects.all()
+        if partitions > 1:
+            items = items.annotate(partition=Mod('store_id', partitions)).filter(partition=partition)
+        return items
+
+    def claim_batch(self, partition=0, partitions=1, batch_size=None):
+        """パーティション内の処理可能な項目を受信順に取り出し、処理中にする"""
+        batch_size = batch_size or self.batch_size
+        now = timezone.now()
+        items = self._partition_items(partition, partitions)
+
+        # 処理中のままリース期限を過ぎた項目（ワーカー停止）は処理待ちに戻す
+        stale = list(items.filter(
+            status='processing', locked_at__lt=now - timezone.timedelta(seconds=self.lease_seconds)
+        ).values_list('id', flat=True))
+        if stale:
+            WebhookQueueItem.objects.filter(id__in=stale, status='processing').update(status='pending')
+            logger.warning(f"Webhook queue: {len(stale)} stale items returned to pending")
+
+        # 先頭の項目が再試行待ち・処理中の店舗は、後続の項目も取り出さない
+        blocked_stores = items.filter(
+            Q(status='processing') | Q(status='pending', next_attempt_at__gt=now)
+        ).values('store_id')
+        ids = list(
+            items.filter(status='pending', next_attempt_at__lte=now).exclude(
+                store_id__in=blocked_stores
+            ).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        # 状態を条件に更新し、同じ項目を他のワーカーが取り出した場合は除外する
+        WebhookQueueItem.objects.filter(id__in=ids, status='pending').update(
+            status='processing', locked_at=now, attempts=F('attempts') + 1
+        )
+        return list(
+            WebhookQueueItem.objects.filter(id__in=ids, status='processing', locked_at=now).order_by('id')
+        )
+
+    def process_batch(self, items):
+        """取り出した項目を受信順に処理し、(完了, 再試行, デッドレター) の件数を返す"""
+        completed = retried = dead_lettered = 0
+        failed_stores = set()
+
+        for item in items:
+            if item.store_id in failed_stores:
+                # 同じ店舗の先行項目が再試行待ちになったため、順序を保つよう処理せずに戻す
+                WebhookQueueItem.objects.filter(pk=item.pk).update(
+                    status='pending', locked_at=None, attempts=F('attempts') - 1
+                )
+                continue
+
+            outcome = self.process_item(item)
+            if outcome == 'completed':
+                completed += 1
+            elif outcome == 'retry':
+                retried += 1
+                failed_stores.add(item.store_id)
+            else:
+                dead_lettered += 1
+
+        return completed, retried, dead_lettered
+
+    def process_item(self, item):
+        """キュー項目1件を取り込み、'completed' / 'retry' / 'dead_letter' を返す"""
+        start_time = time.time()
+        payload = item.payload
+        try:
+            # 前回の試行が申請作成後に中断した場合は記録済みの結果で完了とする
+            replay = idempotency_service.lookup(
+                self.SCOPE, idempotency_service.actor_key('store', item.store_id),
+                str(payload.get('order_id') or '').strip()
+            )
+            if replay is not None:
+                self._complete(item, replay[0])
+                return 'completed'
+
+            # IPアドレス制限・レート制限は受信時に確認済み
+            with latency_service.measure('validation', item.store_id):
+                serializer = WebhookRequestSerializer(data=payload)
+                is_valid = serializer.is_valid()
+            if not is_valid:
+                self._dead_letter(item, json.dumps(serializer.errors, ensure_ascii=False))
+                return 'dead_letter'
+
+            body, status_code, _ = self.process(serializer.validated_data, item.ip_address, item.user_agent, start_time)
+            if status_code >= 400:
+                raise RuntimeError(f"Webhook processing returned {status_code}: {body}")
+
+            self._complete(item, body)
+            return 'completed'
+
+        except Exception as e:
+            logger.error(f"Webhook queue item {item.pk} failed (attempt {item.attempts}): {str(e)}")
+            if item.attempts >= self.max_attempts:
+                self._dead_letter(item, str(e))
+                return 'dead_letter'
+
+            WebhookQueueItem.objects.filter(pk=item.pk).update(
+                status='pending',
+                locked_at=None,
+                last_error=str(e),
+                next_attempt_at=timezone.now() + timezone.timedelta(
+                    seconds=self.retry_base_seconds * 2 ** (item.attempts - 1)
+                )
+            )
+            return 'retry'
+
+    def _complete(self, item, body):
+        WebhookQueueItem.objects.filter(pk=item.pk).update(
+            status='completed', locked_at=None, result=body, processed_at=timezone.now()
+        )
+
+    def _dead_letter(self, item, error):
+        with transaction.atomic():
+            WebhookDeadLetter.objects.create(
+                store_id=item.store_id,
+                payload=item.payload,
+                ip_address=item.ip_address,
+                user_agent=item.user_agent,
+                attempts=item.attempts,
+                error=error,
+                received_at=item.created_at
+            )
+            WebhookQueueItem.objects.filter(pk=item.pk).delete()
+        logger.warning(f"Webhook queue item {item.pk} moved to dead letters: {error}")
+
+    def drain(self, partition=0, partitions=1, batch_size=None):
+        """処理可能な項目がなくなるまでバッチ処理し、件数の合計を返す"""
+        totals = {'completed': 0, 'retried': 0, 'dead_lettered': 0}
+        while True:
+            items = self.claim_batch(partition, partitions, batch_size)
+            if not items:
+                return totals
+            completed, retried, dead_lettered = self.process_batch(items)
+            totals['completed'] += completed
+            totals['retried'] += retried
+            totals['dead_lettered'] += dead_lettered
+
+    def purge_completed(self, days=None):
+        """保持期間を過ぎた完了済み項目を削除"""
+        cutoff = timezone.now() - timezone.timedelta(days=days or self.completed_retention_days)
+        deleted, _ = WebhookQueueItem.objects.filter(status='completed', processed_at__lt=cutoff).delete()
+        return deleted
+
+    def requeue_dead_letters(self, store_id=None):
+        """デッドレターをキューの末尾に戻す"""
+        dead_letters = WebhookDeadLetter.objects.order_by('id')
+        if store_id:
+            dead_letters = dead_letters.filter(store_id=store_id)
+
+        with transaction.atomic():
+            letters = list(dead_letters.select_for_update())
+            WebhookQueueItem.objects.bulk_create([
+                WebhookQueueItem(
+                    store_id=letter.store_id,
+                    payload=letter.payload,
+                    ip_address=letter.ip_address,
+                    user_agent=letter.user_agent
+                )
+                for letter in letters
+            ])
+            WebhookDeadLetter.objects.filter(pk__in=[letter.pk for letter in letters]).delete()
+        return len(letters)
+
+    def queue_metrics(self):
+        """キューの滞留状況（件数・最古の処理待ちの経過秒・デッドレター数）"""
+        now = timezone.now()
+        metrics = WebhookQueueItem.objects.exclude(status='completed').aggregate(
+            ready=Count('id', filter=Q(status='pending', next_attempt_at__lte=now)),
+            retrying=Count('id', filter=Q(status='pending', next_attempt_at__gt=now)),
+            processing=Count('id', filter=Q(status='processing')),
+            stores=Count('store', distinct=True),
+            oldest=Min('created_at')
+        )
+        oldest = metrics.pop('oldest')
+        metrics['depth'] = metrics['ready'] + metrics['retrying'] + metrics['processing']
+        metrics['oldest_age_seconds'] = int((now - oldest).total_seconds()) if oldest else 0
+        metrics['dead_letters'] = WebhookDeadLetter.objects.count()
+        return metrics
+
+
+# グローバルインスタンス
+webhook_ingest_service = WebhookIngestService()
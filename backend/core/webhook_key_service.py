@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+import hashlib
+import logging
+import threading
+import time
+
+from .models import StoreWebhookKey, Store
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookKeyService:
+    """Webhook認証キーの解決（プロセス内キャッシュ + 共有キャッシュ）と最終使用日時の集約更新
+
+    キャッシュはバージョン付きで、キーや店舗の変更時にバージョンを上げて全プロセスの
+    キャッシュを無効化する。プロセス内キャッシュは version_check_interval 秒ごとに
+    共有キャッシュのバージョンを確認するため、定常状態のWebhookではキーの解決に
+    DBへの問い合わせは発生しない。最終使用日時はプロセス内に集約して定期的に書き込む。
+    """
+
+    VERSION_CACHE_KEY = 'webhook_key_version'
+    ENTRY_CACHE_KEY = 'webhook_key:{version}:{digest}'
+    KEY_FIELDS = ['id', 'store_id', 'webhook_key', 'allowed_ips', 'is_active', 'rate_limit_per_minute']
+    STORE_FIELDS = ['id', 'name', 'status']
+
+    def __init__(self):
+        self.entry_timeout = 3600
+        self.missing_timeout = 60  # 無効なキーの結果を共有キャッシュに保持する秒数
+        self.max_local_entries = 10000
+        self.version_check_interval = 5  # プロセス内キャッシュのバージョン確認間隔（秒）
+        self._lock = threading.Lock()
+        self._local = {}
+        self._local_version = None
+        self._version_checked_at = 0.0
+        self._last_used = {}
+        self._last_used_flushed_at = time.monotonic()
+        self._flush_scheduled = False
+
+    @property
+    def last_used_flush_interval(self):
+        """最終使用日時をまとめて書き込む間隔（秒）"""
+        return getattr(settings, 'WEBHOOK_KEY_LAST_USED_FLUSH_SECONDS', 60)
+
+    # === キーの解決 ===
+
+    def resolve(self, key):
+        """有効なキー（店舗が有効なもの）を店舗付きで返す（存在しない場合は None）
+
+        返す StoreWebhookKey・Store はキャッシュした項目のみを持ち、それ以外の項目は
+        参照時に読み込まれる（遅延読み込み）。
+        """
+        if not key:
+            return None
+        version = self.current_version()
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+        entry = self._local.get(digest)
+        if entry is None:
+            cache_key = self.ENTRY_CACHE_KEY.format(version=version, digest=digest)
+            entry = cache.get(cache_key)
+            if entry is None:
+                entry = self._load(key)
+                cache.set(cache_key, entry, timeout=self.entry_timeout if entry['key'] else self.missing_timeout)
+            # 無効なキーはプロセス内には保持しない（任意のキーの送信でメモリが増え続けないように）
+            if entry['key']:
+                with self._lock:
+                    if self._local_version == version:
+                        if len(self._local) >= self.max_local_entries:
+                            self._local = {}
+                        self._local[digest] = entry
+
+        return self._build(entry) if entry['key'] else None
+
+    def current_version(self):
+        """キャッシュのバージョン（プロセス内では一定間隔ごとに共有キャッシュと照合）"""
+        now = time.monotonic()
+        if self._local_version is not None and now - self._version_checked_at < self.version_check_interval:
+            return self._local_version
+
+        version = cache.get(self.VERSION_CACHE_KEY)
+        if version is None:
+            version = 1
+            cache.add(self.VERSION_CACHE_KEY, version, timeout=None)
+        with self._lock:
+            if version != self._local_version:
+                self._local = {}
+                self._local_version = version
+            self._version_checked_at = now
+        return version
+
+    def invalidate(self):
+        """全プロセスのキャッシュを無効化（キーの再発行・無効化、店舗の状態変更時）"""
+        try:
+            cache.incr(self.VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(self.VERSION_CACHE_KEY, 2, timeout=None)
+        with self._lock:
+            self._local = {}
+            self._local_version = None
+
+    def _load(self, key):
+        """DBからキーを読み込み、キャッシュ用の辞書にする（無効なキーは key を None とする）"""
+        webhook_key = StoreWebhookKey.objects.select_related('store').filter(
+            webhook_key=key,
+            is_active=True,
+            store__status='active'
+        ).first()
+        if webhook_key is None:
+            return {'key': None}
+        return {
+            'key': {field: getattr(webhook_key, field) for field in self.KEY_FIELDS},
+            'store': {field: getattr(webhook_key.store, field) for field in self.STORE_FIELDS},
+        }
+
+    def _build(self, entry):
+        store = Store.from_db('default', self.STORE_FIELDS, [entry['store'][field] for field in self.STORE_FIELDS])
+        webhook_key = StoreWebhookKey.from_db('default', self.KEY_FIELDS, [entry['key'][field] for field in self.KEY_FIELDS])
+        webhook_key.store = store
+        return webhook_key
+
+    # === 最終使用日時 ===
+
+    def touch(self, webhook_key):
+        """最終使用日時を記録（書き込みは一定間隔ごとにまとめて行う）"""
+        now = timezone.now()
+        webhook_key.last_used_at = now
+        with self._lock:
+            self._last_used[webhook_key.pk] = now
+            due = (
+                not self._flush_scheduled
+                and time.monotonic() - self._last_used_flushed_at >= self.last_used_flush_interval
+            )
+            if due:
+                self._flush_scheduled = True
+
+        if due:
+            transaction.on_commit(self.flush_last_used)
+
+    def flush_last_used(self):
+        """集約した最終使用日時を書き込み、更新したキーの数を返す"""
+        with self._lock:
+            pending, self._last_used = self._last_used, {}
+            self._last_used_flushed_at = time.monotonic()
+            self._flush_scheduled = False
+        if not pending:
+            return 0
+
+        try:
+            # bulk_update は保存シグナルを発火しないため、キャッシュは無効化されない
+            StoreWebhookKey.objects.bulk_update(
+                [StoreWebhookKey(pk=key_id, last_used_at=used_at) for key_id, used_at in pending.items()],
+                ['last_used_at']
+            )
+        except Exception as e:
+            logger.error(f"Failed to flush webhook key last-used times: {str(e)}")
+            with self._lock:
+                for key_id, used_at in pending.items():
+                    self._last_used[key_id] = max(used_at, self._last_used.get(key_id, used_at))
+            return 0
+        return len(pending)
+
+
+# グローバルインスタンス
+webhook_key_service = WebhookKeyService()
@@ -0,0 +1,34 @@
+"""Webhook受信キューのワーカー処理
+
+spawnで起動した子プロセスから読み込まれるため、モジュール読み込み時にはモデルを
+importせず、Djangoのセットアップ後に関数内でimportする。
+"""
+import time
+
+
+def run_partition(partition, partitions, batch_size, poll_interval, once):
+    """担当パーティションのキューを処理し続ける（once の場合は空になった時点で終了）"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    import logging
+    from .webhook_ingest_service import webhook_ingest_service
+    from .latency_service import latency_service
+    from .webhook_key_service import webhook_key_service
+
+    logger = logging.getLogger(__name__)
+    totals = {'completed': 0, 'retried': 0, 'dead_lettered': 0}
+
+    while True:
+        drained = webhook_ingest_service.drain(partition, partitions, batch_size)
+        for key, value in drained.items():
+            totals[key] += value
+        if any(drained.values()):
+            logger.info(f"Webhook queue partition {partition}/{partitions}: {drained}")
+        if once:
+            latency_service.flush()
+            webhook_key_service.flush_last_used()
+            return totals
+        time.sleep(poll_interval)
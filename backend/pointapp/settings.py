@@ -325,12 +325,32 @@ else:
             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
             'LOCATION': 'biid-dev-cache',
             'TIMEOUT': 300,
+            'OPTIONS': {
+                # EC不審パターン判定のカウンターがバケット単位でキーを持つため既定(300)より多めに確保
+                'MAX_ENTRIES': 10000,
+            },
         }
     }
 
 # URL末尾スラッシュ問題を解消
 APPEND_SLASH = False
 
+# ポイント取引台帳のアーカイブ設定（締め済み月を圧縮ファイルへ退避）
+POINT_LEDGER_ARCHIVE_DIR = config('POINT_LEDGER_ARCHIVE_DIR', default=str(BASE_DIR / 'ledger_archive'))
+POINT_LEDGER_HOT_MONTHS = config('POINT_LEDGER_HOT_MONTHS', default=12, cast=int)
+
+# EC購入Webhookの非同期受信（受信データをキューに保存して202を返し、process_webhook_queue で取り込む）
+EC_WEBHOOK_ASYNC = config('EC_WEBHOOK_ASYNC', default=False, cast=bool)
+
+# 冪等キー記録の保持日数（purge_idempotency_records で期間を過ぎた記録を削除）
+IDEMPOTENCY_RETENTION_DAYS = config('IDEMPOTENCY_RETENTION_DAYS', default=30, cast=int)
+
+# ECパイプラインの処理段階別レイテンシ（プロセス内のヒストグラムをテーブルへ書き込む間隔・秒）
+LATENCY_FLUSH_SECONDS = config('LATENCY_FLUSH_SECONDS', default=30, cast=int)
+
+# Webhookキーの最終使用日時をまとめて書き込む間隔（秒）
+WEBHOOK_KEY_LAST_USED_FLUSH_SECONDS = config('WEBHOOK_KEY_LAST_USED_FLUSH_SECONDS', default=60, cast=int)
+
 # 決済ゲートウェイ設定
 import os
 